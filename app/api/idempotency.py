@@ -0,0 +1,65 @@
+import hashlib
+import logging
+from fastapi import Request
+from app.database.postgres_store import postgres_store
+from app.state.store import TTLSet
+from config import settings
+
+logger = logging.getLogger(__name__)
+
+
+class WebhookDeduplicator:
+    """
+    Drops repeated Shopify webhook deliveries.
+
+    Deliveries are keyed on the X-Shopify-Webhook-Id header, or on a hash of
+    the body when the header is missing. Keys seen by this worker are answered
+    from an in-memory TTL set; the first sighting claims the key in the
+    webhook_receipts table so other workers see it too. Expired receipts are
+    deleted by the retention job, off the request path.
+    """
+
+    def __init__(self, ttl: float, max_size: int):
+        self.ttl = ttl
+        self.seen = TTLSet(ttl, max_size)
+        self.memory_hits = 0
+        self.db_hits = 0
+        self.misses = 0
+
+    def key_for(self, topic: str, request: Request, body: bytes) -> str:
+        webhook_id = request.headers.get("x-shopify-webhook-id")
+        if webhook_id:
+            return f"{topic}:{webhook_id}"
+        return f"{topic}:sha:{hashlib.blake2b(body, digest_size=16).hexdigest()}"
+
+    async def is_duplicate(self, key: str) -> bool:
+        """Check a delivery key, claiming it if this is its first delivery"""
+        if key in self.seen:
+            self.memory_hits += 1
+            return True
+        claimed = await postgres_store.claim_webhook(key)
+        self.seen.add(key)
+        if not claimed:
+            self.db_hits += 1
+            return True
+        self.misses += 1
+        return False
+
+    async def release(self, key: str):
+        """Forget a key whose delivery failed so Shopify's retry is processed"""
+        self.seen.discard(key)
+        await postgres_store.release_webhook(key)
+
+    def stats(self) -> dict:
+        total = self.memory_hits + self.db_hits + self.misses
+        return {
+            "tracked_keys": len(self.seen),
+            "memory_hits": self.memory_hits,
+            "db_hits": self.db_hits,
+            "misses": self.misses,
+            "hit_rate": (self.memory_hits + self.db_hits) / total if total else 0.0
+        }
+
+
+# Global instance
+webhook_deduplicator = WebhookDeduplicator(settings.WEBHOOK_DEDUP_TTL, settings.WEBHOOK_DEDUP_MAX_SIZE)
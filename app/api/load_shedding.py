@@ -0,0 +1,164 @@
+import json
+import logging
+import time
+from typing import Callable, Dict, Optional, Tuple
+from app.clock import clock
+from app.metrics import metrics, db_pool_acquire_wait
+from config import settings
+
+logger = logging.getLogger(__name__)
+
+
+class AdaptiveLimiter:
+    """
+    Concurrency limit that follows observed latency (AIMD).
+
+    Completed requests are averaged over short windows. A window whose average
+    latency exceeds `tolerance` times the no-load baseline, or whose average
+    pool acquire wait exceeds `pool_wait_threshold`, cuts the limit by 10%;
+    a healthy window in which the limit was actually in use raises it by one.
+    The baseline follows the lowest window average and, on healthy windows
+    only, drifts up slowly so a lasting change in workload is eventually
+    re-learned; overloaded windows never raise it, so sustained overload keeps
+    the limit down instead of becoming the new normal.
+    """
+
+    def __init__(self, initial: int, min_limit: int, max_limit: int, tolerance: float,
+                 pool_wait_threshold: float, pool_wait: Callable[[], Tuple[float, int]],
+                 window: float = 0.5):
+        self.limit = float(initial)
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.tolerance = tolerance
+        self.pool_wait_threshold = pool_wait_threshold
+        self.pool_wait = pool_wait
+        self.window = window
+        self.in_flight = 0
+        self.baseline: Optional[float] = None
+        self._window_started = clock.monotonic()
+        self._latency_sum = 0.0
+        self._latency_count = 0
+        self._peak_in_flight = 0
+        self._pool_totals = pool_wait()
+        self.increases = 0
+        self.decreases = 0
+
+    def try_acquire(self, share: float = 1.0) -> bool:
+        """Take a slot if fewer than `share` of the limit are in use"""
+        if self.in_flight >= max(1, int(self.limit * share)):
+            return False
+        self.in_flight += 1
+        self._peak_in_flight = max(self._peak_in_flight, self.in_flight)
+        return True
+
+    def release(self, latency: float):
+        """Return a slot and record how long its request took"""
+        self.in_flight -= 1
+        self._latency_sum += latency
+        self._latency_count += 1
+        now = clock.monotonic()
+        if now - self._window_started >= self.window:
+            self._adjust(now)
+
+    def _adjust(self, now: float):
+        average = self._latency_sum / self._latency_count
+        pool_sum, pool_count = self.pool_wait()
+        waits = pool_count - self._pool_totals[1]
+        pool_average = (pool_sum - self._pool_totals[0]) / waits if waits else 0.0
+        self._pool_totals = (pool_sum, pool_count)
+
+        if self.baseline is None or average < self.baseline:
+            self.baseline = average
+
+        if average > self.baseline * self.tolerance or pool_average > self.pool_wait_threshold:
+            self.limit = max(self.min_limit, self.limit * 0.9)
+            self.decreases += 1
+            logger.info("[Load Shedding] Limit down to %.0f (latency %.3fs, baseline %.3fs, pool wait %.3fs)",
+                        self.limit, average, self.baseline, pool_average)
+        else:
+            self.baseline += (average - self.baseline) * 0.01
+            if self._peak_in_flight >= self.limit / 2:
+                self.limit = min(self.max_limit, self.limit + 1)
+                self.increases += 1
+
+        self._window_started = now
+        self._latency_sum = 0.0
+        self._latency_count = 0
+        self._peak_in_flight = self.in_flight
+
+    def stats(self) -> dict:
+        return {
+            "limit": round(self.limit, 1),
+            "in_flight": self.in_flight,
+            "baseline_latency": round(self.baseline, 4) if self.baseline is not None else None,
+            "increases": self.increases,
+            "decreases": self.decreases,
+        }
+
+
+class LoadSheddingMiddleware:
+    """
+    Pure ASGI middleware admitting requests to the routes in `shares` through
+    an AdaptiveLimiter. Each route may use its share of the limit, so the
+    remainder stays free for higher-priority routes; anything over is answered
+    immediately with 503 and Retry-After. The slot is held until the request,
+    including its background tasks, has finished.
+    """
+
+    def __init__(self, app, limiter: AdaptiveLimiter, shares: Dict[str, float], retry_after: int):
+        self.app = app
+        self.limiter = limiter
+        self.shares = shares
+        self.retry_after = retry_after
+        self._body = json.dumps({"status": "overloaded", "retry_after": retry_after}).encode()
+
+    async def _shed(self, send):
+        await send({
+            "type": "http.response.start",
+            "status": 503,
+            "headers": [
+                (b"content-type", b"application/json"),
+                (b"content-length", str(len(self._body)).encode()),
+                (b"retry-after", str(self.retry_after).encode()),
+            ],
+        })
+        await send({"type": "http.response.body", "body": self._body})
+
+    async def __call__(self, scope, receive, send):
+        share = self.shares.get(scope["path"]) if scope["type"] == "http" else None
+        if share is None:
+            await self.app(scope, receive, send)
+            return
+        if not self.limiter.try_acquire(share):
+            load_shed_decisions.inc(scope["path"], "shed")
+            await self._shed(send)
+            return
+        load_shed_decisions.inc(scope["path"], "admitted")
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            self.limiter.release(time.perf_counter() - started)
+
+
+# Share of the limit each webhook route may use; orders get all of it
+WEBHOOK_SHARES = {
+    "/orders/create": 1.0,
+    "/checkouts/create": settings.SHED_CHECKOUT_SHARE,
+}
+
+# Global instance
+webhook_limiter = AdaptiveLimiter(
+    settings.SHED_INITIAL_LIMIT,
+    min_limit=settings.SHED_MIN_LIMIT,
+    max_limit=settings.SHED_MAX_LIMIT,
+    tolerance=settings.SHED_LATENCY_TOLERANCE,
+    pool_wait_threshold=settings.SHED_POOL_WAIT_THRESHOLD,
+    pool_wait=db_pool_acquire_wait.totals
+)
+
+load_shed_decisions = metrics.counter(
+    "load_shed_decisions_total", "Webhook admission decisions by route", ("route", "decision")
+)
+metrics.gauge("load_shed_limit", "Adaptive webhook concurrency limit and requests in flight", ("value",),
+              collect=lambda: {("limit",): webhook_limiter.limit, ("in_flight",): webhook_limiter.in_flight})
@@ -0,0 +1,69 @@
+import json
+from typing import Any, Dict, Optional
+from app.models.checkout import CartItem, CheckoutPayload
+
+try:
+    import orjson
+    loads = orjson.loads
+except ImportError:
+    loads = json.loads
+
+
+def parse_body(body: bytes) -> Dict[str, Any]:
+    """Decode a raw webhook body into a dict"""
+    payload = loads(body)
+    if not isinstance(payload, dict):
+        raise ValueError("Webhook body must be a JSON object")
+    return payload
+
+
+def extract_phone(payload: Dict[str, Any]) -> Optional[str]:
+    """Pick the customer phone from the places Shopify may put it"""
+    customer = payload.get("customer") or {}
+    return (
+        customer.get("phone")
+        or (customer.get("default_address") or {}).get("phone")
+        or (payload.get("billing_address") or {}).get("phone")
+        or (payload.get("shipping_address") or {}).get("phone")
+        or payload.get("phone")
+        or payload.get("sms_marketing_phone")
+    )
+
+
+def extract_checkout(payload: Dict[str, Any]) -> CheckoutPayload:
+    """
+    Build a CheckoutPayload from a Shopify checkout, reading only the fields the
+    flow needs. The values are already typed by the JSON decoder, so pydantic
+    validation is skipped.
+    """
+    customer = payload.get("customer") or {}
+
+    # Handle name - could be in different formats
+    first_name = customer.get("first_name") or ""
+    last_name = customer.get("last_name") or ""
+    customer_name = f"{first_name} {last_name}".strip() or None
+
+    cart_items = [
+        CartItem.model_construct(
+            name=item.get("title", "Unknown Product"),
+            quantity=item.get("quantity", 1),
+            price=float(item.get("price") or 0)
+        )
+        for item in payload.get("line_items") or []
+    ]
+
+    return CheckoutPayload.model_construct(
+        customer_name=customer_name,
+        customer_email=payload.get("email"),
+        customer_phone=extract_phone(payload),
+        cart_items=cart_items,
+        created_at=payload.get("created_at", "")
+    )
+
+
+def extract_order_email(payload: Dict[str, Any]) -> Optional[str]:
+    """Get the customer email from a Shopify order"""
+    email = payload.get("email")
+    if not email:
+        email = (payload.get("customer") or {}).get("email")
+    return email
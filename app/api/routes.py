@@ -1,125 +1,118 @@
-from fastapi import APIRouter, BackgroundTasks, Request, HTTPException
-from app.models.checkout import CheckoutPayload
+from fastapi import APIRouter, BackgroundTasks, Request, HTTPException, Query
+from fastapi.responses import JSONResponse, StreamingResponse, PlainTextResponse
+from datetime import datetime, timedelta, timezone
+from typing import Optional
+from app.api.parsing import parse_body, extract_checkout, extract_order_email
+from app.api.idempotency import webhook_deduplicator
 from app.services.handlers import handle_checkout_flow
-from app.state.store import update_checkout_status
+from app.services.flow_plans import flow_plans
+from app.services.send_queue import send_queue
+from app.services.circuit_breaker import circuit_breakers
+from app.api.load_shedding import webhook_limiter
+from app.metrics import metrics
+from config import settings
+from app.state.store import update_checkout_status, checkout_flows, recent_admissions
 from app.database.postgres_store import postgres_store  # Add this import
+import base64
+import json
 import logging
 
 router = APIRouter()
 logger = logging.getLogger(__name__)
 
+# Per-delivery webhook logs are sampled under this category (see LOG_SAMPLE_RATES)
+WEBHOOK_LOG = {"category": "webhook"}
+
 @router.get("/ping")
 async def ping():
     return {"status": "ok", "database": "neon-postgresql"}
 
+@router.get("/ready")
+async def ready(request: Request):
+    """Readiness probe: 503 until startup (schema check, pool pre-warm, schedulers) has finished"""
+    if not getattr(request.app.state, "ready", False):
+        return JSONResponse({"status": "starting"}, status_code=503)
+    return {"status": "ready"}
+
+@router.get("/metrics")
+async def get_metrics():
+    """Prometheus text-format metrics for this worker"""
+    return PlainTextResponse(await metrics.render(), media_type="text/plain; version=0.0.4")
+
 @router.post("/checkouts/create")
 async def checkout_webhook(
-    payload: dict,  # Accept raw dict instead of CheckoutPayload
     background_task: BackgroundTasks,
     request: Request
 ):
+    # Read raw bytes and extract only the fields we need instead of letting
+    # FastAPI decode and validate the whole Shopify checkout
+    body = await request.body()
+    webhook_key = webhook_deduplicator.key_for("checkouts/create", request, body)
+    if await webhook_deduplicator.is_duplicate(webhook_key):
+        return {"status": "duplicate"}
     try:
-        logger.info(f"[Webhook] Received checkout webhook")
-        
-        # Extract data from Shopify's format
-        email = payload.get("email")
-        customer = payload.get("customer") or {}
+        logger.info("[Webhook] Received checkout webhook", extra=WEBHOOK_LOG)
         
-        # Handle name - could be in different formats
-        first_name = customer.get("first_name", "")
-        last_name = customer.get("last_name", "")
-        customer_name = f"{first_name} {last_name}".strip() or None
-        
-        # Phone number can be in multiple places in Shopify
-        customer_phone = None
-        
-        # Try customer phone first
-        if customer.get("phone"):
-            customer_phone = customer.get("phone")
-        # Try customer default address
-        elif customer.get("default_address", {}).get("phone"):
-            customer_phone = customer.get("default_address", {}).get("phone")
-        # Try billing address
-        elif payload.get("billing_address", {}).get("phone"):
-            customer_phone = payload.get("billing_address", {}).get("phone")
-        # Try shipping address
-        elif payload.get("shipping_address", {}).get("phone"):
-            customer_phone = payload.get("shipping_address", {}).get("phone")
-        # Try top-level phone
-        elif payload.get("phone"):
-            customer_phone = payload.get("phone")
-        # Try SMS marketing phone
-        elif payload.get("sms_marketing_phone"):
-            customer_phone = payload.get("sms_marketing_phone")
-        
-        # Extract line items
-        line_items = payload.get("line_items", [])
-        cart_items = []
-        for item in line_items:
-            cart_items.append({
-                "name": item.get("title", "Unknown Product"),
-                "quantity": item.get("quantity", 1),
-                "price": float(item.get("price", "0"))
-            })
+        payload = parse_body(body)
+        checkout_data = extract_checkout(payload)
+        email = checkout_data.customer_email
+        customer_phone = checkout_data.customer_phone
         
-        # Create our payload format
-        checkout_data = CheckoutPayload(
-            customer_name=customer_name,
-            customer_email=email,
-            customer_phone=customer_phone,
-            cart_items=cart_items,
-            created_at=payload.get("created_at", "")
-        )
+        logger.info("[Webhook] Parsed data - Email: %s, Phone: %s, Name: %s", email, customer_phone, checkout_data.customer_name,
+                    extra=WEBHOOK_LOG)
         
-        logger.info(f"[Webhook] Parsed data - Email: {email}, Phone: {customer_phone}, Name: {customer_name}")
+        shop_domain = request.headers.get("x-shopify-shop-domain")
+        client_id = flow_plans.client_for_shop(shop_domain) if shop_domain else settings.DEFAULT_CLIENT_ID
+        if client_id is None:
+            logger.error("[Webhook] No flow plan for shop %s, add it to a client's shop_domains", shop_domain)
+            return {"status": "skipped", "reason": "unknown_shop"}
         
         # Only process if we have email (phone is optional but preferred)
         if email:
-            background_task.add_task(handle_checkout_flow, checkout_data)
+            background_task.add_task(handle_checkout_flow, checkout_data, client_id)
             return {"status": "received", "email": email, "phone": customer_phone}
         else:
-            logger.warning(f"[Webhook] No email found in checkout payload")
+            logger.warning("[Webhook] No email found in checkout payload")
             return {"status": "skipped", "reason": "no_email"}
         
     except Exception as e:
-        logger.error(f"[Webhook] Error processing checkout: {str(e)}")
-        logger.error(f"[Webhook] Raw payload keys: {list(payload.keys())}")
+        logger.error("[Webhook] Error processing checkout: %s", e)
+        logger.error("[Webhook] Raw payload size: %s bytes", len(body))
+        await webhook_deduplicator.release(webhook_key)
         raise HTTPException(status_code=400, detail=f"Error processing webhook: {str(e)}")
 
 @router.post("/orders/create")
-async def order_created_webhook(payload: dict):
+async def order_created_webhook(request: Request):
+    body = await request.body()
+    webhook_key = webhook_deduplicator.key_for("orders/create", request, body)
+    if await webhook_deduplicator.is_duplicate(webhook_key):
+        return {"status": "duplicate"}
     try:
-        logger.info(f"[Webhook] Received order webhook")
+        logger.info("[Webhook] Received order webhook", extra=WEBHOOK_LOG)
         
         # Extract email from order payload
-        email = payload.get("email")
-        customer = payload.get("customer") or {}
-        if not email and customer:
-            email = customer.get("email")
+        email = extract_order_email(parse_body(body))
             
         if email:
             await update_checkout_status(email, "completed")
-            logger.info(f"[Order Completed] Cancelled flow for: {email}")
+            logger.info("[Order Completed] Marked flow completed for: %s", email)
             
         return {"status": "received", "email": email}
         
     except Exception as e:
-        logger.error(f"[Webhook] Error processing order: {str(e)}")
-        logger.error(f"[Webhook] Raw payload: {payload}")
+        logger.error("[Webhook] Error processing order: %s", e)
+        logger.error("[Webhook] Raw payload size: %s bytes", len(body))
+        await webhook_deduplicator.release(webhook_key)
         return {"status": "error", "message": str(e)}
 
 @router.post("/debug/webhook")
 async def debug_webhook(payload: dict, request: Request):
     """Debug endpoint to see what Shopify sends"""
-    logger.info(f"[DEBUG] Headers: {dict(request.headers)}")
-    logger.info(f"[DEBUG] Payload: {payload}")
-    
-    print(f"\n{'='*50}")
-    print(f"SHOPIFY WEBHOOK DEBUG")
-    print(f"{'='*50}")
-    print(f"Headers: {dict(request.headers)}")
-    print(f"Payload: {payload}")
-    print(f"{'='*50}\n")
+    # Header names and top-level keys only: full payloads carry customer PII
+    # and can be hundreds of KB
+    logger.info("[DEBUG] Webhook topic %s from %s, headers %s, payload keys %s",
+                request.headers.get("x-shopify-topic"), request.headers.get("x-shopify-shop-domain"),
+                list(request.headers.keys()), list(payload.keys()))
     
     return {"status": "debug_received", "payload_keys": list(payload.keys())}
 
@@ -133,11 +126,15 @@ async def reset_database():
         async with postgres_store.pool.acquire() as conn:
             # Delete all checkout flows
             result = await conn.execute("DELETE FROM checkout_flows")
+            await conn.execute("DELETE FROM flow_events")
+            await conn.execute("DELETE FROM flow_rollups")
             
             # Extract count from result string like "DELETE 5"
             deleted_count = int(result.split()[-1]) if result and result.split() else 0
+            checkout_flows.clear()
+            recent_admissions.clear()
             
-            logger.info(f"[Admin] Database reset - Deleted {deleted_count} checkout flows")
+            logger.info("[Admin] Database reset - Deleted %s checkout flows", deleted_count)
             
             return {
                 "status": "success",
@@ -147,74 +144,166 @@ async def reset_database():
             }
             
     except Exception as e:
-        logger.error(f"[Admin] Database reset failed: {str(e)}")
+        logger.error("[Admin] Database reset failed: %s", e)
         raise HTTPException(status_code=500, detail=f"Database reset failed: {str(e)}")
 
+@router.get("/admin/cache-stats")
+async def get_cache_stats():
+    """
+    Flow cache size and hit/miss/eviction counters for this worker
+    """
+    return checkout_flows.stats()
+
+@router.get("/admin/flow-plans")
+async def get_flow_plans():
+    """
+    Loaded flow plan version per client on this worker
+    """
+    return {"source": flow_plans.source, "reloads": flow_plans.reloads, "versions": flow_plans.versions()}
+
+@router.post("/admin/flow-plans/reload")
+async def reload_flow_plans():
+    """
+    Re-read flow definitions now instead of waiting for the next reload interval
+    """
+    try:
+        await flow_plans.reload()
+        return {"status": "success", "versions": flow_plans.versions()}
+    except Exception as e:
+        logger.error("[Admin] Flow plan reload failed: %s", e)
+        raise HTTPException(status_code=500, detail=f"Flow plan reload failed: {str(e)}")
+
+@router.get("/admin/send-queue-stats")
+async def get_send_queue_stats():
+    """
+    Outbound send queue depth, throughput counters and send latency for this worker
+    """
+    return send_queue.stats()
+
+@router.get("/admin/circuit-breakers")
+async def get_circuit_breakers():
+    """
+    Circuit breaker state, rejections and state transitions per upstream for this worker
+    """
+    return circuit_breakers.stats()
+
+@router.get("/admin/load-shedding")
+async def get_load_shedding_stats():
+    """
+    Adaptive webhook concurrency limit, requests in flight and limit adjustments for this worker
+    """
+    return webhook_limiter.stats()
+
+@router.get("/admin/webhook-dedup-stats")
+async def get_webhook_dedup_stats():
+    """
+    Webhook idempotency hit rate and counters for this worker
+    """
+    return webhook_deduplicator.stats()
+
+def _encode_cursor(flow: dict) -> str:
+    return base64.urlsafe_b64encode(json.dumps([flow["created_at"], flow["email"]]).encode()).decode()
+
+def _decode_cursor(cursor: str):
+    created_at, email = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+    return datetime.fromisoformat(created_at), email
+
 @router.get("/admin/database-state")
-async def get_database_state():
+async def get_database_state(
+    limit: int = Query(100, ge=1, le=1000),
+    cursor: Optional[str] = None,
+    status: Optional[str] = None,
+    client_id: Optional[str] = None,
+    created_after: Optional[datetime] = None,
+    created_before: Optional[datetime] = None,
+    format: str = Query("json", pattern="^(json|ndjson)$")
+):
     """
-    Get complete database state - all checkout flows and statistics
+    Get database state - checkout flows and statistics.
+    
+    Flows are returned newest first, one page at a time; pass `next_cursor`
+    back as `cursor` to continue. `format=ndjson` streams every matching flow
+    instead, one JSON object per line, in constant memory.
     """
+    filters = {
+        "status": status,
+        "client_id": client_id,
+        "created_after": created_after,
+        "created_before": created_before
+    }
+    
+    if format == "ndjson":
+        async def export():
+            async for flow in postgres_store.iter_flows(**filters):
+                yield json.dumps(flow) + "\n"
+        return StreamingResponse(export(), media_type="application/x-ndjson")
+    
     try:
-        async with postgres_store.pool.acquire() as conn:
-            # Get all flows
-            flows = await conn.fetch("""
-                SELECT 
-                    email, 
-                    status, 
-                    step_status, 
-                    customer_name, 
-                    customer_phone, 
-                    client_id,
-                    created_at, 
-                    updated_at
-                FROM checkout_flows 
-                ORDER BY created_at DESC
-            """)
-            
-            # Get statistics
-            stats = await conn.fetchrow("""
-                SELECT 
-                    COUNT(*) as total_flows,
-                    COUNT(*) FILTER (WHERE status = 'pending') as pending_flows,
-                    COUNT(*) FILTER (WHERE status = 'completed') as completed_flows,
-                    COUNT(*) FILTER (WHERE status = 'blocked') as blocked_flows,
-                    COUNT(*) FILTER (WHERE created_at > NOW() - INTERVAL '1 hour') as flows_last_hour,
-                    COUNT(*) FILTER (WHERE created_at > NOW() - INTERVAL '24 hours') as flows_last_24h,
-                    MIN(created_at) as oldest_flow,
-                    MAX(created_at) as newest_flow
-                FROM checkout_flows
-            """)
-            
-            # Convert flows to list of dicts
-            flows_data = []
-            for flow in flows:
-                flows_data.append({
-                    "email": flow["email"],
-                    "status": flow["status"],
-                    "step_status": flow["step_status"],
-                    "customer_name": flow["customer_name"],
-                    "customer_phone": flow["customer_phone"],
-                    "client_id": flow["client_id"],
-                    "created_at": flow["created_at"].isoformat() if flow["created_at"] else None,
-                    "updated_at": flow["updated_at"].isoformat() if flow["updated_at"] else None
-                })
-            
-            return {
-                "statistics": {
-                    "total_flows": stats["total_flows"],
-                    "pending_flows": stats["pending_flows"],
-                    "completed_flows": stats["completed_flows"],
-                    "blocked_flows": stats["blocked_flows"],
-                    "flows_last_hour": stats["flows_last_hour"],
-                    "flows_last_24h": stats["flows_last_24h"],
-                    "oldest_flow": stats["oldest_flow"].isoformat() if stats["oldest_flow"] else None,
-                    "newest_flow": stats["newest_flow"].isoformat() if stats["newest_flow"] else None
-                },
-                "flows": flows_data,
-                "total_records": len(flows_data)
-            }
-            
+        after = _decode_cursor(cursor) if cursor else None
+    except Exception:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    
+    try:
+        flows_data = await postgres_store.list_flows(limit, after, **filters)
+        
+        # Status counts are maintained by triggers and the time windows are
+        # index range counts, so their cost does not grow with the table
+        stats = await postgres_store.get_flow_statistics()
+        
+        return {
+            "statistics": {
+                "total_flows": stats["total"],
+                "pending_flows": stats["pending"],
+                "completed_flows": stats["completed"],
+                "blocked_flows": stats["blocked"],
+                "flows_last_hour": stats["last_hour"],
+                "flows_last_24h": stats["last_24h"],
+                "oldest_flow": stats["oldest_flow"].isoformat() if stats["oldest_flow"] else None,
+                "newest_flow": stats["newest_flow"].isoformat() if stats["newest_flow"] else None
+            },
+            "flows": flows_data,
+            "total_records": len(flows_data),
+            "next_cursor": _encode_cursor(flows_data[-1]) if len(flows_data) == limit else None
+        }
+        
+    except Exception as e:
+        logger.error("[Admin] Database state query failed: %s", e)
+        raise HTTPException(status_code=500, detail=f"Database state query failed: {str(e)}")
+
+@router.get("/admin/analytics/funnel")
+async def get_funnel_analytics(
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    client_id: Optional[str] = None
+):
+    """
+    Funnel counters (flows created, blocked, completed, step N sent/failed)
+    per client and hour, plus totals over the range. Defaults to the last 24 hours.
+    """
+    end = end or datetime.now(timezone.utc)
+    start = start or end - timedelta(hours=24)
+    try:
+        rows = await postgres_store.get_funnel(start, end, client_id)
+        
+        totals = {}
+        series = {}
+        for row in rows:
+            totals[row["metric"]] = totals.get(row["metric"], 0) + row["count"]
+            point = series.setdefault((row["bucket"], row["client_id"]), {
+                "bucket": row["bucket"].isoformat(),
+                "client_id": row["client_id"],
+                "metrics": {}
+            })
+            point["metrics"][row["metric"]] = row["count"]
+        
+        return {
+            "start": start.isoformat(),
+            "end": end.isoformat(),
+            "client_id": client_id,
+            "totals": totals,
+            "series": list(series.values())
+        }
+        
     except Exception as e:
-        logger.error(f"[Admin] Database state query failed: {str(e)}")
-        raise HTTPException(status_code=500, detail=f"Database state query failed: {str(e)}")
\ No newline at end of file
+        logger.error("[Admin] Funnel analytics query failed: %s", e)
+        raise HTTPException(status_code=500, detail=f"Funnel analytics query failed: {str(e)}")
@@ -0,0 +1,222 @@
+"""
+Seed checkout_flows with a shop's historical checkouts so the anti-spam
+checks see its recent customers from the first webhook on.
+
+Reads a Shopify checkout export as NDJSON (one checkout object per line) or
+CSV (one column per field, nested fields as dotted paths such as
+customer.first_name or billing_address.phone), extracts the same fields as
+the checkouts/create webhook, and bulk-loads them batch by batch: COPY into
+a temporary staging table, then one INSERT ... SELECT per batch that keeps
+the newest checkout per email and never touches flows the app created. Memory
+stays bounded by --batch-size. Run from the repository root:
+
+    python -m app.backfill checkouts.ndjson --client-id zuzumonk [--batch-size 20000]
+    python -m app.backfill - --format csv --shop-domain shop.myshopify.com < checkouts.csv
+"""
+import argparse
+import asyncio
+import csv
+import io
+import sys
+import time
+from datetime import datetime
+from typing import Any, Dict, Iterator, List, Optional
+
+import asyncpg
+
+from app.api.parsing import parse_body, extract_checkout
+from app.database.postgres_store import postgres_store
+from app.services.flow_plans import flow_plans
+from config import settings
+
+# Imported checkouts never had a flow; "completed" when the export shows the order went through
+BACKFILL_STATUS = "backfilled"
+
+STAGING_COLUMNS = ("email", "status", "customer_name", "customer_phone", "client_id", "created_at")
+
+CREATE_STAGING_SQL = """
+    CREATE TEMPORARY TABLE checkout_backfill (
+        email VARCHAR(255) NOT NULL,
+        status VARCHAR(50) NOT NULL,
+        customer_name VARCHAR(255),
+        customer_phone VARCHAR(50),
+        client_id VARCHAR(100) NOT NULL,
+        created_at TIMESTAMP WITH TIME ZONE NOT NULL
+    )
+"""
+
+# updated_at is the checkout time so retention ages imported rows like live ones.
+# A later checkout in another batch replaces an earlier backfilled one; flows the
+# app created are never touched
+MERGE_SQL = """
+    INSERT INTO checkout_flows
+    (email, status, step_status, customer_name, customer_phone, client_id, created_at, updated_at)
+    SELECT DISTINCT ON (email)
+        email, status, '{}', customer_name, customer_phone, client_id, created_at, created_at
+    FROM checkout_backfill
+    ORDER BY email, created_at DESC
+    ON CONFLICT (email) DO UPDATE SET
+        status = EXCLUDED.status,
+        customer_name = EXCLUDED.customer_name,
+        customer_phone = EXCLUDED.customer_phone,
+        created_at = EXCLUDED.created_at,
+        updated_at = EXCLUDED.updated_at
+    WHERE checkout_flows.status = 'backfilled' AND checkout_flows.created_at < EXCLUDED.created_at
+"""
+
+
+def _unflatten(row: Dict[str, str]) -> Dict[str, Any]:
+    """Turn {"customer.phone": "..."} CSV columns back into nested checkout objects"""
+    payload: Dict[str, Any] = {}
+    for key, value in row.items():
+        if not key or value in (None, ""):
+            continue
+        target = payload
+        *parents, leaf = key.split(".")
+        for parent in parents:
+            target = target.setdefault(parent, {})
+        target[leaf] = value
+    return payload
+
+
+def read_checkouts(stream: io.BufferedReader, fmt: str) -> Iterator[Optional[Dict[str, Any]]]:
+    """Yield checkout payloads one at a time from an NDJSON or CSV export; None for unparseable lines"""
+    if fmt == "csv":
+        for row in csv.DictReader(io.TextIOWrapper(stream, encoding="utf-8", newline="")):
+            yield _unflatten(row)
+        return
+    for line in stream:
+        if not line.strip():
+            continue
+        try:
+            yield parse_body(line)
+        except ValueError:
+            yield None
+
+
+def to_record(payload: Dict[str, Any], client_id: str) -> Optional[tuple]:
+    """Staging row for a checkout, or None when it has no email or creation time"""
+    checkout = extract_checkout(payload)
+    if not checkout.customer_email or not checkout.created_at:
+        return None
+    created_at = datetime.fromisoformat(checkout.created_at.replace("Z", "+00:00"))
+    status = "completed" if payload.get("completed_at") else BACKFILL_STATUS
+    return (
+        checkout.customer_email,
+        status,
+        checkout.customer_name,
+        checkout.customer_phone,
+        client_id,
+        created_at,
+    )
+
+
+class Progress:
+    """Rows read, skipped and written, reported to stderr at most every `interval` seconds"""
+
+    def __init__(self, interval: float = 2.0):
+        self.interval = interval
+        self.started = time.perf_counter()
+        self._reported = self.started
+        self.read = 0
+        self.skipped = 0
+        self.written = 0
+
+    def report(self, force: bool = False):
+        now = time.perf_counter()
+        if not force and now - self._reported < self.interval:
+            return
+        self._reported = now
+        elapsed = max(now - self.started, 1e-9)
+        print(
+            f"[Backfill] {self.read} read, {self.skipped} skipped, {self.written} written "
+            f"({self.read / elapsed:,.0f} rows/s)",
+            file=sys.stderr,
+        )
+
+
+async def _load_batch(conn: asyncpg.Connection, records: List[tuple]) -> int:
+    """Stage one batch and merge it into checkout_flows; returns the rows written"""
+    async with conn.transaction():
+        await conn.copy_records_to_table("checkout_backfill", records=records, columns=STAGING_COLUMNS)
+        result = await conn.execute(MERGE_SQL)
+        await conn.execute("TRUNCATE checkout_backfill")
+    return int(result.split()[-1])
+
+
+async def backfill(stream: io.BufferedReader, fmt: str, client_id: str, batch_size: int,
+                   skip_notify: bool = False) -> Progress:
+    """Load every checkout in `stream` for `client_id`"""
+    progress = Progress()
+    conn = await asyncpg.connect(settings.DATABASE_URL)
+    try:
+        await postgres_store.ensure_schema(conn)
+        if skip_notify:
+            # Only backfilled rows are written, which no worker has cached a
+            # live flow for, so the invalidations can be skipped (needs superuser)
+            await conn.execute("SET session_replication_role = replica")
+        await conn.execute(CREATE_STAGING_SQL)
+        batch: List[tuple] = []
+        for payload in read_checkouts(stream, fmt):
+            progress.read += 1
+            try:
+                record = to_record(payload, client_id) if payload is not None else None
+            except (TypeError, ValueError):
+                record = None
+            if record is None:
+                progress.skipped += 1
+                continue
+            batch.append(record)
+            if len(batch) >= batch_size:
+                progress.written += await _load_batch(conn, batch)
+                batch = []
+                progress.report()
+        if batch:
+            progress.written += await _load_batch(conn, batch)
+    finally:
+        await conn.close()
+    progress.report(force=True)
+    return progress
+
+
+async def _client_for(shop_domain: str) -> Optional[str]:
+    """Client the webhooks would use for `shop_domain`, from the FLOW_PLANS_SOURCE plans"""
+    if flow_plans.source == "postgres":
+        await postgres_store.init_pool()
+        try:
+            await flow_plans.reload()
+        finally:
+            await postgres_store.close()
+    else:
+        await flow_plans.reload()
+    return flow_plans.client_for_shop(shop_domain)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("path", help="NDJSON or CSV export, or - for stdin")
+    parser.add_argument("--format", choices=["ndjson", "csv"], help="defaults to the file extension, else ndjson")
+    parser.add_argument("--client-id", help=f"defaults to the --shop-domain's client, else {settings.DEFAULT_CLIENT_ID}")
+    parser.add_argument("--shop-domain", help="resolve the client from the flow plans' shop_domains")
+    parser.add_argument("--batch-size", type=int, default=20000)
+    parser.add_argument("--skip-notify", action="store_true",
+                        help="skip the change-notification trigger (requires a superuser)")
+    args = parser.parse_args()
+
+    client_id = args.client_id
+    if client_id is None and args.shop_domain:
+        client_id = asyncio.run(_client_for(args.shop_domain))
+        if client_id is None:
+            parser.error(f"no flow plan for shop {args.shop_domain}")
+    client_id = client_id or settings.DEFAULT_CLIENT_ID
+    fmt = args.format or ("csv" if args.path.endswith(".csv") else "ndjson")
+
+    if args.path == "-":
+        asyncio.run(backfill(sys.stdin.buffer, fmt, client_id, args.batch_size, args.skip_notify))
+    else:
+        with open(args.path, "rb") as stream:
+            asyncio.run(backfill(stream, fmt, client_id, args.batch_size, args.skip_notify))
+
+
+if __name__ == "__main__":
+    main()
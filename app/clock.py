@@ -0,0 +1,113 @@
+import asyncio
+import heapq
+import itertools
+import time
+from typing import List, Optional
+
+
+class SystemClock:
+    """Wall-clock time for normal operation"""
+
+    def time(self) -> float:
+        return time.time()
+
+    def monotonic(self) -> float:
+        return time.monotonic()
+
+    async def sleep(self, seconds: float):
+        await asyncio.sleep(seconds)
+
+
+class VirtualClock:
+    """
+    Clock that only moves when advanced, for replaying traffic faster than real
+    time. It starts from the current system readings, so deadlines already
+    taken from the system clock (such as the timing wheel's origin) stay valid.
+    Sleepers wake when `advance` reaches their deadline.
+    """
+
+    # Shortest sleep: anything less could leave monotonic() unchanged after
+    # float rounding, so a caller waiting for time to pass would never see it
+    RESOLUTION = 1e-6
+
+    def __init__(self, start: Optional[float] = None):
+        self._wall = time.time() if start is None else start
+        self._monotonic = time.monotonic()
+        self.elapsed = 0.0
+        # (deadline in elapsed seconds, sequence, future) per sleeper
+        self._sleepers: List[tuple] = []
+        self._seq = itertools.count()
+
+    def time(self) -> float:
+        return self._wall + self.elapsed
+
+    def monotonic(self) -> float:
+        return self._monotonic + self.elapsed
+
+    async def sleep(self, seconds: float):
+        if seconds <= 0:
+            await asyncio.sleep(0)
+            return
+        future = asyncio.get_running_loop().create_future()
+        deadline = self.elapsed + max(seconds, self.RESOLUTION)
+        heapq.heappush(self._sleepers, (deadline, next(self._seq), future))
+        await future
+
+    def next_deadline(self) -> Optional[float]:
+        """Elapsed time at which the next sleeper wakes, or None if nothing is sleeping"""
+        while self._sleepers and self._sleepers[0][2].done():
+            # Cancelled sleeper
+            heapq.heappop(self._sleepers)
+        return self._sleepers[0][0] if self._sleepers else None
+
+    def advance(self, seconds: float):
+        self.elapsed += seconds
+        while self._sleepers and self._sleepers[0][0] <= self.elapsed:
+            _, _, future = heapq.heappop(self._sleepers)
+            if not future.done():
+                future.set_result(None)
+
+
+class Clock:
+    """
+    Process-wide time source for flow timing: the timing wheel, the send queue
+    (its token buckets and retry backoff), the circuit breakers, the send rate
+    limiters, the in-process anti-spam windows and the load-shedding limiter's
+    adjustment windows read the time and sleep through it, so a simulation can
+    swap in a VirtualClock. Anything that times how long work took (metrics,
+    logs) keeps using time.perf_counter directly.
+    """
+
+    def __init__(self):
+        self.source = SystemClock()
+
+    def time(self) -> float:
+        return self.source.time()
+
+    def monotonic(self) -> float:
+        return self.source.monotonic()
+
+    async def sleep(self, seconds: float):
+        await self.source.sleep(seconds)
+
+    async def wait(self, event: asyncio.Event, timeout: Optional[float]) -> bool:
+        """Wait until `event` is set or `timeout` seconds have passed on this clock; whether it was set"""
+        if timeout is None:
+            await event.wait()
+            return True
+        waiter = asyncio.ensure_future(event.wait())
+        sleeper = asyncio.ensure_future(self.sleep(timeout))
+        try:
+            await asyncio.wait((waiter, sleeper), return_when=asyncio.FIRST_COMPLETED)
+        finally:
+            waiter.cancel()
+            sleeper.cancel()
+        return event.is_set()
+
+    def use(self, source):
+        """Read the time from `source` from now on"""
+        self.source = source
+
+
+# Global instance
+clock = Clock()
@@ -1,89 +1,471 @@
+import asyncio
 import asyncpg
+from asyncpg.prepared_stmt import PreparedStatement
 import json
-from typing import Dict, Any, Optional
+import time
+from contextlib import AsyncExitStack
+from datetime import datetime, timezone
+from typing import AsyncIterator, Callable, Dict, Any, List, Optional, Tuple
 import logging
+from app.database.queries import STATEMENTS
+from app.database.write_buffer import WriteBehindBuffer
+from app.metrics import metrics, instrument_methods, db_query_duration, db_pool_acquire_wait
 from config import settings
 
 logger = logging.getLogger(__name__)
 
+# Channel carrying {"email", "status"} payloads for every checkout_flows write
+FLOW_CHANGES_CHANNEL = "checkout_flow_changes"
+
+# Version of the schema init_tables creates; bump it whenever the DDL changes so
+# the next boot applies it. Boots that find this version (or newer) skip the DDL.
+SCHEMA_VERSION = 3
+
+# Advisory lock serializing schema changes between workers starting together
+SCHEMA_LOCK_KEY = 7_214_003
+
+# SQLSTATE classes worth retrying the same write for: connection exception,
+# transaction rollback (deadlock, serialization), insufficient resources and
+# operator intervention (shutdown, cancelled statement)
+TRANSIENT_SQLSTATE_CLASSES = ("08", "40", "53", "57")
+
+# Read-only catalog statements run once on each connection while pre-warming,
+# with arguments that match no rows
+WARM_STATEMENTS = {
+    "get_flow": ("",),
+    "admit_flow": ("", "", 1, 1, 1),
+    "get_rate_limit": ("",),
+}
+
+# Per-row write logs are sampled under this category (see LOG_SAMPLE_RATES)
+DB_ROW_LOG = {"category": "db_row"}
+
+# Funnel counter recorded when a flow is stored with each status
+FLOW_STATUS_METRICS = {"pending": "flows_created", "blocked": "flows_blocked"}
+
+class _TimedAcquire:
+    """Pool acquire context that records how long the caller waited for a connection"""
+    __slots__ = ("_context",)
+
+    def __init__(self, context):
+        self._context = context
+
+    async def __aenter__(self):
+        started = time.perf_counter()
+        conn = await self._context.__aenter__()
+        db_pool_acquire_wait.observe(time.perf_counter() - started)
+        return conn
+
+    async def __aexit__(self, *exc_info):
+        return await self._context.__aexit__(*exc_info)
+
+
+class InstrumentedPool:
+    """asyncpg pool wrapper timing `acquire`; everything else is delegated to the pool"""
+
+    def __init__(self, pool: asyncpg.Pool):
+        self._pool = pool
+
+    def acquire(self):
+        return _TimedAcquire(self._pool.acquire())
+
+    def __getattr__(self, name):
+        return getattr(self._pool, name)
+
+
+class CatalogConnection(asyncpg.Connection):
+    """Pool connection carrying the STATEMENTS catalog, prepared once when it is opened"""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.statements: Dict[str, PreparedStatement] = {}
+
+    async def prepare_catalog(self):
+        for name, query in STATEMENTS.items():
+            self.statements[name] = await self.prepare(query)
+
+
+def _step_number(step: str) -> int:
+    """Step number of a step key such as step_1"""
+    return int(step.rsplit("_", 1)[1])
+
+
+async def _run(conn, name: str, *args) -> str:
+    """Execute a catalog statement for its effect and return the command status (e.g. DELETE 3)"""
+    statement = conn.statements[name]
+    await statement.fetch(*args)
+    return statement.get_statusmsg()
+
+
+def is_transient_error(error: Exception) -> bool:
+    """Whether a failed write may succeed if retried unchanged (as opposed to a rejected row)"""
+    if isinstance(error, (OSError, asyncio.TimeoutError, asyncpg.InterfaceError)):
+        return True
+    return isinstance(error, asyncpg.PostgresError) and (error.sqlstate or "")[:2] in TRANSIENT_SQLSTATE_CLASSES
+
+
 class PostgresStore:
     def __init__(self):
         self.connection_string = settings.DATABASE_URL
         self.pool = None
+        # Server PIDs of our own pool connections, used to skip notifications we caused
+        self.backend_pids = set()
+        self._listener_task = None
+        self.write_buffer = WriteBehindBuffer(
+            self.write_batch,
+            flush_interval=settings.WRITE_BEHIND_FLUSH_INTERVAL,
+            max_batch=settings.WRITE_BEHIND_MAX_BATCH,
+            retryable=is_transient_error,
+            max_retries=settings.WRITE_BEHIND_MAX_RETRIES
+        )
         
     async def init_pool(self):
-        """Initialize connection pool"""
+        """Bring the schema up to date, then open (and pre-warm) the connection pool"""
         try:
-            self.pool = await asyncpg.create_pool(
+            # Tables must exist before pool connections can prepare the catalog
+            conn = await asyncpg.connect(self.connection_string)
+            try:
+                await self.ensure_schema(conn)
+            finally:
+                await conn.close()
+            self.pool = InstrumentedPool(await asyncpg.create_pool(
                 self.connection_string,
-                min_size=2,
-                max_size=10,
-                command_timeout=60
-            )
+                min_size=settings.DB_POOL_MIN_SIZE,
+                max_size=settings.DB_POOL_MAX_SIZE,
+                statement_cache_size=settings.DB_STATEMENT_CACHE_SIZE,
+                command_timeout=60,
+                connection_class=CatalogConnection,
+                init=self._init_connection
+            ))
             logger.info("[Database] Connection pool initialized")
-            await self.init_tables()
+            if settings.DB_POOL_PREWARM:
+                await self.warm_pool()
+            if settings.WRITE_BEHIND_ENABLED:
+                self.write_buffer.start()
         except Exception as e:
-            logger.error(f"[Database] Failed to initialize pool: {e}")
+            logger.error("[Database] Failed to initialize pool: %s", e)
             raise
     
-    async def init_tables(self):
-        """Create tables if they don't exist"""
-        async with self.pool.acquire() as conn:
+    async def _init_connection(self, conn: CatalogConnection):
+        """Prepare the statement catalog and track the connection's backend PID for its lifetime"""
+        await conn.prepare_catalog()
+        pid = conn.get_server_pid()
+        self.backend_pids.add(pid)
+        conn.add_termination_listener(lambda _: self.backend_pids.discard(pid))
+    
+    async def warm_pool(self):
+        """Hold every idle pool connection at once and run the hot read statements on each"""
+        async def warm(conn):
+            for name, args in WARM_STATEMENTS.items():
+                await conn.statements[name].fetch(*args)
+
+        async with AsyncExitStack() as stack:
+            connections = [
+                await stack.enter_async_context(self.pool.acquire()) for _ in range(self.pool.get_idle_size())
+            ]
+            await asyncio.gather(*(warm(conn) for conn in connections))
+        logger.info("[Database] Pre-warmed %s pool connections", len(connections))
+    
+    async def _schema_version(self, conn: asyncpg.Connection) -> int:
+        if await conn.fetchval("SELECT to_regclass('schema_version')") is None:
+            return 0
+        return await conn.fetchval("SELECT COALESCE(MAX(version), 0) FROM schema_version")
+    
+    async def ensure_schema(self, conn: asyncpg.Connection) -> bool:
+        """
+        Run init_tables unless the database is already at SCHEMA_VERSION.
+        
+        The common case costs two catalog reads and takes no DDL locks. When
+        the schema is behind, workers serialize on an advisory lock and only
+        the first one applies the DDL. Returns whether this call applied it.
+        """
+        if await self._schema_version(conn) >= SCHEMA_VERSION:
+            logger.info("[Database] Schema is at version %s, skipping table setup", SCHEMA_VERSION)
+            return False
+        await conn.execute("SELECT pg_advisory_lock($1)", SCHEMA_LOCK_KEY)
+        try:
+            if await self._schema_version(conn) >= SCHEMA_VERSION:
+                return False
+            await self.init_tables(conn)
             await conn.execute("""
-                CREATE TABLE IF NOT EXISTS checkout_flows (
-                    email VARCHAR(255) PRIMARY KEY,
-                    status VARCHAR(50) NOT NULL,
-                    step_status JSONB NOT NULL DEFAULT '{}',
-                    customer_name VARCHAR(255),
-                    customer_phone VARCHAR(50),
-                    client_id VARCHAR(100) DEFAULT 'zuzumonk',
-                    created_at TIMESTAMP WITH TIME ZONE DEFAULT NOW(),
-                    updated_at TIMESTAMP WITH TIME ZONE DEFAULT NOW()
+                INSERT INTO schema_version (version) VALUES ($1)
+                ON CONFLICT (version) DO NOTHING
+            """, SCHEMA_VERSION)
+            logger.info("[Database] Schema upgraded to version %s", SCHEMA_VERSION)
+            return True
+        finally:
+            await conn.execute("SELECT pg_advisory_unlock($1)", SCHEMA_LOCK_KEY)
+    
+    async def init_tables(self, conn: asyncpg.Connection):
+        """Create tables if they don't exist"""
+        await conn.execute("""
+            CREATE TABLE IF NOT EXISTS checkout_flows (
+                email VARCHAR(255) PRIMARY KEY,
+                status VARCHAR(50) NOT NULL,
+                step_status JSONB NOT NULL DEFAULT '{}',
+                customer_name VARCHAR(255),
+                customer_phone VARCHAR(50),
+                client_id VARCHAR(100) DEFAULT 'zuzumonk',
+                created_at TIMESTAMP WITH TIME ZONE DEFAULT NOW(),
+                updated_at TIMESTAMP WITH TIME ZONE DEFAULT NOW()
+            );
+            
+            CREATE INDEX IF NOT EXISTS idx_checkout_flows_status 
+            ON checkout_flows(status);
+            
+            CREATE INDEX IF NOT EXISTS idx_checkout_flows_updated_at 
+            ON checkout_flows(updated_at);
+            
+            CREATE INDEX IF NOT EXISTS idx_checkout_flows_client_id 
+            ON checkout_flows(client_id);
+            
+            CREATE INDEX IF NOT EXISTS idx_checkout_flows_phone_created_at 
+            ON checkout_flows(customer_phone, created_at);
+            
+            CREATE INDEX IF NOT EXISTS idx_checkout_flows_created_at_email 
+            ON checkout_flows(created_at, email);
+            
+            CREATE OR REPLACE FUNCTION notify_checkout_flow_change() RETURNS trigger AS $$
+            BEGIN
+                PERFORM pg_notify(
+                    'checkout_flow_changes',
+                    json_build_object('email', NEW.email, 'status', NEW.status)::text
+                );
+                RETURN NEW;
+            END;
+            $$ LANGUAGE plpgsql;
+            
+            CREATE OR REPLACE TRIGGER checkout_flows_notify_change
+            AFTER INSERT OR UPDATE ON checkout_flows
+            FOR EACH ROW EXECUTE FUNCTION notify_checkout_flow_change();
+            
+            -- Step outcomes are appended here rather than rewriting the
+            -- checkout_flows row; checkout_flow_state folds them back in
+            CREATE TABLE IF NOT EXISTS flow_events (
+                email VARCHAR(255) NOT NULL,
+                step SMALLINT NOT NULL,
+                outcome VARCHAR(20) NOT NULL,
+                created_at TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT clock_timestamp()
+            );
+            
+            CREATE INDEX IF NOT EXISTS idx_flow_events_email 
+            ON flow_events(email);
+            
+            CREATE OR REPLACE VIEW checkout_flow_state AS
+            SELECT f.email, f.status, 
+                   f.step_status || COALESCE(e.steps, '{}'::jsonb) AS step_status,
+                   f.customer_name, f.customer_phone, f.client_id, f.created_at,
+                   GREATEST(f.updated_at, e.last_event_at) AS updated_at
+            FROM checkout_flows f
+            LEFT JOIN LATERAL (
+                SELECT jsonb_object_agg('step_' || step, outcome ORDER BY created_at) AS steps,
+                       MAX(created_at) AS last_event_at
+                FROM flow_events 
+                WHERE flow_events.email = f.email
+            ) e ON TRUE;
+            
+            CREATE OR REPLACE FUNCTION notify_flow_event() RETURNS trigger AS $$
+            BEGIN
+                PERFORM pg_notify(
+                    'checkout_flow_changes',
+                    json_build_object('email', NEW.email, 'status', NULL)::text
                 );
-                
-                CREATE INDEX IF NOT EXISTS idx_checkout_flows_status 
-                ON checkout_flows(status);
-                
-                CREATE INDEX IF NOT EXISTS idx_checkout_flows_updated_at 
-                ON checkout_flows(updated_at);
-                
-                CREATE INDEX IF NOT EXISTS idx_checkout_flows_client_id 
-                ON checkout_flows(client_id);
-            """)
-            logger.info("[Database] Tables initialized")
+                RETURN NEW;
+            END;
+            $$ LANGUAGE plpgsql;
+            
+            CREATE OR REPLACE TRIGGER flow_events_notify_change
+            AFTER INSERT ON flow_events
+            FOR EACH ROW EXECUTE FUNCTION notify_flow_event();
+            
+            CREATE TABLE IF NOT EXISTS flow_steps (
+                email VARCHAR(255) PRIMARY KEY,
+                step_index SMALLINT NOT NULL,
+                client_id VARCHAR(100) NOT NULL,
+                customer_phone VARCHAR(50) NOT NULL,
+                customer_name VARCHAR(255),
+                due_at TIMESTAMP WITH TIME ZONE NOT NULL,
+                leased_until TIMESTAMP WITH TIME ZONE,
+                leased_by VARCHAR(100),
+                attempts SMALLINT NOT NULL DEFAULT 0
+            );
+            
+            CREATE INDEX IF NOT EXISTS idx_flow_steps_due_at 
+            ON flow_steps(due_at);
+            
+            CREATE TABLE IF NOT EXISTS rate_limits (
+                key VARCHAR(255) PRIMARY KEY,
+                window_index BIGINT NOT NULL,
+                current_count INTEGER NOT NULL DEFAULT 0,
+                previous_count INTEGER NOT NULL DEFAULT 0,
+                idle_seconds DOUBLE PRECISION,
+                updated_at TIMESTAMP WITH TIME ZONE DEFAULT NOW()
+            );
+            
+            -- Each key keeps the idle TTL of the limiter that wrote it
+            ALTER TABLE rate_limits ADD COLUMN IF NOT EXISTS idle_seconds DOUBLE PRECISION;
+            
+            CREATE INDEX IF NOT EXISTS idx_rate_limits_updated_at 
+            ON rate_limits(updated_at);
+            
+            CREATE TABLE IF NOT EXISTS webhook_receipts (
+                webhook_key VARCHAR(255) PRIMARY KEY,
+                received_at TIMESTAMP WITH TIME ZONE DEFAULT NOW()
+            );
+            
+            CREATE INDEX IF NOT EXISTS idx_webhook_receipts_received_at 
+            ON webhook_receipts(received_at);
+            
+            CREATE TABLE IF NOT EXISTS flow_rollups (
+                client_id VARCHAR(100) NOT NULL,
+                bucket TIMESTAMP WITH TIME ZONE NOT NULL,
+                metric VARCHAR(50) NOT NULL,
+                count BIGINT NOT NULL DEFAULT 0,
+                PRIMARY KEY (client_id, bucket, metric)
+            );
+            
+            CREATE INDEX IF NOT EXISTS idx_flow_rollups_bucket 
+            ON flow_rollups(bucket);
+            
+            -- Current number of flows per status, kept as an append-only log of
+            -- per-statement deltas so concurrent writers never contend on a
+            -- counter row; compact_status_counts folds it back to one row per status
+            CREATE TABLE IF NOT EXISTS flow_status_counts (
+                status VARCHAR(50) NOT NULL,
+                delta BIGINT NOT NULL
+            );
+            
+            CREATE OR REPLACE FUNCTION count_checkout_flow_status() RETURNS trigger AS $$
+            BEGIN
+                IF TG_OP = 'INSERT' THEN
+                    INSERT INTO flow_status_counts (status, delta)
+                    SELECT status, COUNT(*) FROM new_rows GROUP BY status;
+                ELSIF TG_OP = 'DELETE' THEN
+                    INSERT INTO flow_status_counts (status, delta)
+                    SELECT status, -COUNT(*) FROM old_rows GROUP BY status;
+                ELSE
+                    INSERT INTO flow_status_counts (status, delta)
+                    SELECT status, SUM(delta) FROM (
+                        SELECT status, -1 AS delta FROM old_rows
+                        UNION ALL
+                        SELECT status, 1 FROM new_rows
+                    ) changes
+                    GROUP BY status HAVING SUM(delta) <> 0;
+                END IF;
+                RETURN NULL;
+            END;
+            $$ LANGUAGE plpgsql;
+            
+            CREATE OR REPLACE TRIGGER checkout_flows_count_insert
+            AFTER INSERT ON checkout_flows REFERENCING NEW TABLE AS new_rows
+            FOR EACH STATEMENT EXECUTE FUNCTION count_checkout_flow_status();
+            
+            CREATE OR REPLACE TRIGGER checkout_flows_count_update
+            AFTER UPDATE ON checkout_flows REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows
+            FOR EACH STATEMENT EXECUTE FUNCTION count_checkout_flow_status();
+            
+            CREATE OR REPLACE TRIGGER checkout_flows_count_delete
+            AFTER DELETE ON checkout_flows REFERENCING OLD TABLE AS old_rows
+            FOR EACH STATEMENT EXECUTE FUNCTION count_checkout_flow_status();
+            
+            -- Counts must also follow backfills run with session_replication_role = replica
+            ALTER TABLE checkout_flows ENABLE ALWAYS TRIGGER checkout_flows_count_insert;
+            ALTER TABLE checkout_flows ENABLE ALWAYS TRIGGER checkout_flows_count_update;
+            ALTER TABLE checkout_flows ENABLE ALWAYS TRIGGER checkout_flows_count_delete;
+            
+            -- Seed from the existing rows the first time; the triggers above
+            -- already lock out concurrent writes until this script commits
+            INSERT INTO flow_status_counts (status, delta)
+            SELECT status, COUNT(*) FROM checkout_flows
+            WHERE NOT EXISTS (SELECT 1 FROM flow_status_counts)
+            GROUP BY status;
+            
+            CREATE TABLE IF NOT EXISTS client_flow_plans (
+                client_id VARCHAR(100) PRIMARY KEY,
+                definition JSONB NOT NULL,
+                updated_at TIMESTAMP WITH TIME ZONE DEFAULT NOW()
+            );
+            
+            CREATE TABLE IF NOT EXISTS schema_version (
+                version INTEGER PRIMARY KEY,
+                applied_at TIMESTAMP WITH TIME ZONE DEFAULT NOW()
+            );
+        """)
+        # Seed the rollups from existing flows the first time the table is created
+        await conn.execute("""
+            INSERT INTO flow_rollups (client_id, bucket, metric, count)
+            SELECT client_id, bucket, metric, COUNT(*) FROM (
+                SELECT COALESCE(client_id, 'zuzumonk') AS client_id, 
+                       date_trunc('hour', created_at) AS bucket,
+                       CASE WHEN status = 'blocked' THEN 'flows_blocked' ELSE 'flows_created' END AS metric
+                FROM checkout_flows
+                UNION ALL
+                SELECT COALESCE(client_id, 'zuzumonk'), date_trunc('hour', updated_at), 'flows_completed'
+                FROM checkout_flows WHERE status = 'completed'
+                UNION ALL
+                SELECT COALESCE(client_id, 'zuzumonk'), date_trunc('hour', updated_at), step.key || '_' || step.value
+                FROM checkout_flow_state, jsonb_each_text(step_status) AS step
+                WHERE step.key LIKE 'step\\_%'
+            ) history
+            WHERE NOT EXISTS (SELECT 1 FROM flow_rollups)
+            GROUP BY client_id, bucket, metric
+        """)
+        logger.info("[Database] Tables initialized")
     
     async def set_flow(self, email: str, data: Dict[str, Any]):
         """Create or update a checkout flow"""
+        row = (
+            email, 
+            data["status"], 
+            json.dumps(data.get("step_status", {})),
+            data.get("customer_name"),
+            data.get("customer_phone"),
+            data.get("client_id", settings.DEFAULT_CLIENT_ID)
+        )
+        metric = FLOW_STATUS_METRICS.get(data["status"])
+        if self.write_buffer.running:
+            self.write_buffer.add_flow(email, row, data.get("customer_phone"))
+            if metric:
+                await self.record_metric(row[5], metric)
+            return
         async with self.pool.acquire() as conn:
-            await conn.execute("""
-                INSERT INTO checkout_flows 
-                (email, status, step_status, customer_name, customer_phone, client_id, updated_at) 
-                VALUES ($1, $2, $3, $4, $5, $6, NOW())
-                ON CONFLICT (email) DO UPDATE SET 
-                    status = $2, 
-                    step_status = $3, 
-                    customer_name = $4,
-                    customer_phone = $5,
-                    client_id = $6,
-                    updated_at = NOW()
-            """, 
-                email, 
-                data["status"], 
-                json.dumps(data.get("step_status", {})),
-                data.get("customer_name"),
-                data.get("customer_phone"),
-                data.get("client_id", "zuzumonk")
-            )
-            logger.info(f"[Database] Set flow for {email}")
+            await _run(conn, "upsert_flow", *row)
+            logger.info("[Database] Set flow for %s", email, extra=DB_ROW_LOG)
+        if metric:
+            await self.record_metric(row[5], metric)
+    
+    async def record_metric(self, client_id: str, metric: str, count: int = 1):
+        """Add to a per-client, per-hour funnel counter"""
+        bucket = datetime.now(timezone.utc).replace(minute=0, second=0, microsecond=0)
+        if self.write_buffer.running:
+            self.write_buffer.add_rollup((client_id, bucket, metric), count)
+            return
+        async with self.pool.acquire() as conn:
+            await _run(conn, "increment_rollup", client_id, bucket, metric, count)
+    
+    async def write_batch(self, flows: List[tuple], steps: List[tuple], rollups: List[tuple]):
+        """Write buffered flow upserts, then step events and rollup increments, in one transaction"""
+        # Every worker locks flow and rollup rows in key order, so overlapping
+        # flushes wait for each other instead of deadlocking
+        flows = sorted(flows, key=lambda row: row[0])
+        rollups = sorted(rollups)
+        async with self.pool.acquire() as conn:
+            async with conn.transaction():
+                if flows:
+                    await conn.statements["upsert_flow"].executemany(flows)
+                if steps:
+                    await conn.statements["append_flow_event"].executemany(
+                        [(email, _step_number(step), outcome) for email, step, outcome in steps]
+                    )
+                if rollups:
+                    await conn.statements["increment_rollup"].executemany(rollups)
+        logger.info("[Database] Flushed %s flow upserts, %s step events and %s rollup increments", len(flows), len(steps), len(rollups))
     
     async def get_flow(self, email: str) -> Dict[str, Any]:
         """Get checkout flow by email"""
+        await self.write_buffer.flush_if_pending(email)
         async with self.pool.acquire() as conn:
-            row = await conn.fetchrow("""
-                SELECT status, step_status, customer_name, customer_phone, client_id, created_at
-                FROM checkout_flows 
-                WHERE email = $1
-            """, email)
+            row = await conn.statements["get_flow"].fetchrow(email)
             
             if row:
                 return {
@@ -98,63 +480,332 @@ class PostgresStore:
     
     async def update_status(self, email: str, status: str):
         """Update flow status"""
+        # Keep buffered writes for this email ordered before the status change
+        await self.write_buffer.flush_if_pending(email)
         async with self.pool.acquire() as conn:
-            result = await conn.execute("""
-                UPDATE checkout_flows 
-                SET status = $1, updated_at = NOW() 
-                WHERE email = $2
-            """, status, email)
+            row = await conn.statements["update_status"].fetchrow(status, email)
             
-            if result == "UPDATE 1":
-                logger.info(f"[Database] Updated status for {email} to {status}")
+            if row:
+                logger.info("[Database] Updated status for %s to %s", email, status, extra=DB_ROW_LOG)
             else:
-                logger.warning(f"[Database] No flow found for {email}")
+                logger.warning("[Database] No flow found for %s", email)
+        if row and status == "completed" and row["previous_status"] != "completed":
+            await self.record_metric(row["client_id"] or settings.DEFAULT_CLIENT_ID, "flows_completed")
     
-    async def update_step_status(self, email: str, step: str, status: str):
-        """Update specific step status"""
-        async with self.pool.acquire() as conn:
-            await conn.execute("""
-                UPDATE checkout_flows 
-                SET step_status = jsonb_set(step_status, $1, $2, true),
-                    updated_at = NOW()
-                WHERE email = $3
-            """, [step], json.dumps(status), email)
-            logger.info(f"[Database] Updated {step} status for {email}")
-    
-    async def cleanup_old_flows(self, days: int = 30):
-        """Clean up flows older than specified days"""
-        async with self.pool.acquire() as conn:
-            result = await conn.execute("""
-                DELETE FROM checkout_flows 
-                WHERE updated_at < NOW() - INTERVAL '%s days'
-            """ % days)
-            logger.info(f"[Database] Cleaned up old flows: {result}")
+    async def update_step_status(self, email: str, step: str, status: str, client_id: str = settings.DEFAULT_CLIENT_ID):
+        """Record a step outcome as a flow event"""
+        if self.write_buffer.running:
+            self.write_buffer.add_step(email, step, status)
+        else:
+            async with self.pool.acquire() as conn:
+                await _run(conn, "append_flow_event", email, _step_number(step), status)
+                logger.info("[Database] Updated %s status for %s", step, email, extra=DB_ROW_LOG)
+        await self.record_metric(client_id, f"{step}_{status}")
+    
+    async def cleanup_old_flows(self, days: int = 30, batch_size: int = 1000, pause: float = 0.1,
+                                on_deleted: Optional[Callable[[List[str]], None]] = None) -> int:
+        """
+        Clean up flows older than specified days.
+        
+        Rows are deleted `batch_size` at a time with a `pause` between batches,
+        so locks stay short and WAL is written gradually. `on_deleted` receives
+        the emails removed by each batch.
+        """
+        await self.write_buffer.flush_if_pending()
+        await self.compact_status_counts()
+        total = 0
+        while True:
+            async with self.pool.acquire() as conn:
+                rows = await conn.statements["delete_expired_flows"].fetch(days, batch_size)
+            emails = [row["email"] for row in rows]
+            total += len(emails)
+            if emails and on_deleted is not None:
+                on_deleted(emails)
+            if len(emails) < batch_size:
+                break
+            await asyncio.sleep(pause)
+        logger.info("[Database] Cleaned up %s old flows", total)
+        return total
+    
+    async def start_listener(self, on_change: Callable[[str, str], None], on_reset: Callable[[], None]):
+        """
+        LISTEN for checkout flow writes made by other processes.
+        
+        `on_change(email, status)` runs for every foreign write, with status None
+        for step events. `on_reset()` runs whenever the listener connection is
+        lost, since notifications sent while disconnected are gone.
+        """
+        if self._listener_task is None:
+            self._listener_task = asyncio.create_task(self._listen(on_change, on_reset))
+    
+    async def _listen(self, on_change: Callable[[str, str], None], on_reset: Callable[[], None]):
+        def handle(conn, pid, channel, payload):
+            if pid in self.backend_pids:
+                return
+            try:
+                change = json.loads(payload)
+                on_change(change["email"], change["status"])
+            except Exception as e:
+                logger.error("[Database] Bad flow change notification %r: %s", payload, e)
+        
+        while True:
+            conn = None
+            try:
+                conn = await asyncpg.connect(self.connection_string)
+                lost = asyncio.Event()
+                conn.add_termination_listener(lambda _: lost.set())
+                await conn.add_listener(FLOW_CHANGES_CHANNEL, handle)
+                logger.info("[Database] Listening for flow changes")
+                await lost.wait()
+                logger.warning("[Database] Flow change listener disconnected")
+            except asyncio.CancelledError:
+                if conn is not None:
+                    await conn.close()
+                raise
+            except Exception as e:
+                logger.error("[Database] Flow change listener failed: %s", e)
+            on_reset()
+            await asyncio.sleep(5)
     
     async def close(self):
         """Close connection pool"""
+        if self._listener_task is not None:
+            self._listener_task.cancel()
+            try:
+                await self._listener_task
+            except asyncio.CancelledError:
+                pass
+            self._listener_task = None
+        await self.write_buffer.stop()
         if self.pool:
             await self.pool.close()
             logger.info("[Database] Connection pool closed")
     
     async def check_recent_flow(self, email: str, hours: int = 24) -> bool:
         """Check if user had a flow within the last X hours"""
+        await self.write_buffer.flush_if_pending(email)
         async with self.pool.acquire() as conn:
-            result = await conn.fetchval("""
-                SELECT COUNT(*) FROM checkout_flows 
-                WHERE email = $1 AND created_at > NOW() - INTERVAL '%s hours'
-            """ % hours, email)
-            return result > 0
+            return await conn.statements["check_recent_flow"].fetchval(email, hours)
     
     async def get_phone_message_count(self, phone: str, hours: int = 24) -> int:
         """Get message count for a phone number in the last X hours"""
+        await self.write_buffer.flush_if_pending(phone=phone)
         async with self.pool.acquire() as conn:
-            result = await conn.fetchval("""
-                SELECT COUNT(*) FROM checkout_flows 
-                WHERE customer_phone = $1 
-                AND created_at > NOW() - INTERVAL '%s hours'
-                AND status != 'blocked'
-            """ % hours, phone)
+            result = await conn.statements["count_phone_flows"].fetchval(phone, hours)
             return result or 0
+    
+    async def admit_flow(self, email: str, phone: str, recent_hours: int,
+                         phone_hours: int, phone_limit: int) -> str:
+        """
+        Decide in one statement whether a new flow may start.
+        
+        Returns "duplicate" if the email had a flow in the last `recent_hours`,
+        "phone_limit" if the phone already has `phone_limit` unblocked flows in
+        the last `phone_hours`, otherwise "allowed".
+        """
+        # Only this email's and phone's queued flows can change the answer
+        await self.write_buffer.flush_if_pending(email, phone)
+        async with self.pool.acquire() as conn:
+            row = await conn.statements["admit_flow"].fetchrow(email, phone, recent_hours, phone_hours, phone_limit)
+            if row["duplicate"]:
+                return "duplicate"
+            if row["phone_flows"] >= phone_limit:
+                return "phone_limit"
+            return "allowed"
+    
+    async def schedule_step(self, email: str, phone: str, customer_name: Optional[str],
+                            client_id: str, step_index: int, delay: float):
+        """Persist the next due step of a flow, replacing any pending step for the email"""
+        async with self.pool.acquire() as conn:
+            await _run(conn, "schedule_step", email, step_index, client_id, phone, customer_name, float(delay))
+            logger.info("[Database] Scheduled step %s for %s in %ss", step_index+1, email, delay, extra=DB_ROW_LOG)
+    
+    async def claim_due_steps(self, worker_id: str, limit: int, lease_seconds: float) -> List[Dict[str, Any]]:
+        """Lease up to `limit` due steps; rows locked or leased by other workers are skipped"""
+        async with self.pool.acquire() as conn:
+            rows = await conn.statements["claim_due_steps"].fetch(limit, float(lease_seconds), worker_id)
+            return [dict(row) for row in rows]
+    
+    async def advance_step(self, email: str, step_index: int, next_delay: Optional[float]):
+        """Release a leased step, moving the flow to its next step or removing it when done"""
+        async with self.pool.acquire() as conn:
+            if next_delay is None:
+                await _run(conn, "finish_step", email, step_index)
+            else:
+                await _run(conn, "advance_step", email, step_index, float(next_delay))
+    
+    async def extend_leases(self, worker_id: str, lease_seconds: float):
+        """Push back the lease of every step `worker_id` still holds"""
+        async with self.pool.acquire() as conn:
+            await _run(conn, "extend_leases", worker_id, float(lease_seconds))
+    
+    async def count_pending_steps(self) -> Dict[int, int]:
+        """Number of flows waiting on each step index in flow_steps"""
+        async with self.pool.acquire() as conn:
+            rows = await conn.statements["count_pending_steps"].fetch()
+        return {row["step_index"]: row["count"] for row in rows}
+    
+    async def cancel_steps(self, email: str):
+        """Remove the pending step of a flow so no worker claims it"""
+        async with self.pool.acquire() as conn:
+            await _run(conn, "cancel_steps", email)
+    
+    async def get_rate_limit(self, key: str) -> Optional[Dict[str, Any]]:
+        """Get the window counters for a rate limit key"""
+        async with self.pool.acquire() as conn:
+            row = await conn.statements["get_rate_limit"].fetchrow(key)
+            return dict(row) if row else None
+    
+    async def increment_rate_limit(self, key: str, window_index: int, idle_seconds: float):
+        """Count a hit for a rate limit key, rolling its counters forward to `window_index`"""
+        async with self.pool.acquire() as conn:
+            await _run(conn, "increment_rate_limit", key, window_index, float(idle_seconds))
+    
+    async def evict_rate_limits(self, idle_seconds: float):
+        """Delete counters idle for longer than `idle_seconds` and their own key's idle TTL"""
+        async with self.pool.acquire() as conn:
+            result = await _run(conn, "evict_rate_limits", float(idle_seconds))
+            logger.info("[Database] Evicted idle rate limit keys: %s", result)
+    
+    async def claim_webhook(self, webhook_key: str) -> bool:
+        """Record a webhook delivery; False if any worker already recorded it"""
+        async with self.pool.acquire() as conn:
+            claimed = await conn.statements["claim_webhook"].fetchval(webhook_key)
+            return bool(claimed)
+    
+    async def release_webhook(self, webhook_key: str):
+        """Forget a webhook delivery"""
+        async with self.pool.acquire() as conn:
+            await _run(conn, "release_webhook", webhook_key)
+    
+    async def evict_webhook_receipts(self, max_age_seconds: float, batch_size: int = 1000,
+                                     pause: float = 0.1) -> int:
+        """Delete webhook receipts older than `max_age_seconds`, `batch_size` at a time"""
+        total = 0
+        while True:
+            async with self.pool.acquire() as conn:
+                result = await _run(conn, "evict_webhook_receipts", float(max_age_seconds), batch_size)
+            deleted = int(result.split()[-1])
+            total += deleted
+            if deleted < batch_size:
+                break
+            await asyncio.sleep(pause)
+        logger.info("[Database] Evicted %s old webhook receipts", total)
+        return total
+    
+    async def get_flow_plans(self) -> Dict[str, Dict[str, Any]]:
+        """Load every client's flow definition from client_flow_plans"""
+        async with self.pool.acquire() as conn:
+            rows = await conn.statements["get_flow_plans"].fetch()
+        return {
+            row["client_id"]: json.loads(row["definition"]) if isinstance(row["definition"], str) else row["definition"]
+            for row in rows
+        }
+    
+    def _flow_filters(self, status: Optional[str], client_id: Optional[str],
+                      created_after: Optional[datetime], created_before: Optional[datetime]) -> Tuple[List[str], list]:
+        """Build parameterized WHERE conditions for flow listings"""
+        conditions, args = [], []
+        for condition, value in (
+            ("status = ${}", status),
+            ("client_id = ${}", client_id),
+            ("created_at >= ${}", created_after),
+            ("created_at < ${}", created_before)
+        ):
+            if value is not None:
+                args.append(value)
+                conditions.append(condition.format(len(args)))
+        return conditions, args
+    
+    def _flow_record(self, row) -> Dict[str, Any]:
+        return {
+            "email": row["email"],
+            "status": row["status"],
+            "step_status": json.loads(row["step_status"]),
+            "customer_name": row["customer_name"],
+            "customer_phone": row["customer_phone"],
+            "client_id": row["client_id"],
+            "created_at": row["created_at"].isoformat() if row["created_at"] else None,
+            "updated_at": row["updated_at"].isoformat() if row["updated_at"] else None
+        }
+    
+    async def list_flows(self, limit: int, after: Optional[Tuple[datetime, str]] = None,
+                         status: Optional[str] = None, client_id: Optional[str] = None,
+                         created_after: Optional[datetime] = None,
+                         created_before: Optional[datetime] = None) -> List[Dict[str, Any]]:
+        """Get one page of flows, newest first, continuing below the (created_at, email) key `after`"""
+        conditions, args = self._flow_filters(status, client_id, created_after, created_before)
+        if after is not None:
+            args.extend(after)
+            conditions.append(f"(created_at, email) < (${len(args) - 1}, ${len(args)})")
+        args.append(limit)
+        where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+        async with self.pool.acquire() as conn:
+            rows = await conn.fetch(f"""
+                SELECT email, status, step_status, customer_name, customer_phone, 
+                       client_id, created_at, updated_at
+                FROM checkout_flow_state 
+                {where}
+                ORDER BY created_at DESC, email DESC
+                LIMIT ${len(args)}
+            """, *args)
+            return [self._flow_record(row) for row in rows]
+    
+    async def iter_flows(self, status: Optional[str] = None, client_id: Optional[str] = None,
+                         created_after: Optional[datetime] = None, created_before: Optional[datetime] = None,
+                         prefetch: int = 1000) -> AsyncIterator[Dict[str, Any]]:
+        """Stream flows, newest first, through a server-side cursor"""
+        conditions, args = self._flow_filters(status, client_id, created_after, created_before)
+        where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+        async with self.pool.acquire() as conn:
+            async with conn.transaction():
+                async for row in conn.cursor(f"""
+                    SELECT email, status, step_status, customer_name, customer_phone, 
+                           client_id, created_at, updated_at
+                    FROM checkout_flow_state 
+                    {where}
+                    ORDER BY created_at DESC, email DESC
+                """, *args, prefetch=prefetch):
+                    yield self._flow_record(row)
+    
+    async def get_funnel(self, start: datetime, end: datetime,
+                         client_id: Optional[str] = None) -> List[Dict[str, Any]]:
+        """Get hourly funnel counters with buckets in [start, end)"""
+        await self.write_buffer.flush_if_pending()
+        async with self.pool.acquire() as conn:
+            rows = await conn.statements["get_funnel"].fetch(start, end, client_id)
+            return [dict(row) for row in rows]
+    
+    async def compact_status_counts(self):
+        """Fold the flow_status_counts deltas into one row per status"""
+        async with self.pool.acquire() as conn:
+            await _run(conn, "compact_status_counts")
+    
+    async def get_flow_statistics(self) -> Dict[str, Any]:
+        """
+        Current flow counts per status, summed from the flow_status_counts
+        deltas (compacted by the retention job, not here), plus flows created
+        in the last hour and day and the oldest and newest flow, read from the
+        created_at index.
+        """
+        await self.write_buffer.flush_if_pending()
+        async with self.pool.acquire() as conn:
+            row = await conn.statements["get_flow_statistics"].fetchrow()
+            return dict(row)
+
+def _pool_connections() -> Dict[Tuple[str, ...], float]:
+    pool = postgres_store.pool
+    if pool is None:
+        return {}
+    size = pool.get_size()
+    idle = pool.get_idle_size()
+    return {("in_use",): size - idle, ("idle",): idle}
+
+
+# Time every public query method; setup and teardown are excluded
+instrument_methods(PostgresStore, db_query_duration, exclude=("init_pool", "warm_pool", "ensure_schema", "init_tables", "start_listener", "close"))
 
 # Global instance
-postgres_store = PostgresStore()
\ No newline at end of file
+postgres_store = PostgresStore()
+
+metrics.gauge("db_pool_connections", "Pool connections by state", ("state",), collect=_pool_connections)
\ No newline at end of file
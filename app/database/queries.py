@@ -0,0 +1,245 @@
+from typing import Dict
+
+# Every fixed query PostgresStore runs, fully parameterized so each has one
+# statement text. CatalogConnection prepares all of them once per pool
+# connection; methods then execute them by name. Only the admin listings,
+# whose WHERE clause depends on the filters given, are built per call.
+STATEMENTS: Dict[str, str] = {
+    # Flows
+    # A (re)started flow begins with no step events
+    # Only newly admitted flows are upserted, and admission already ruled out a
+    # flow for the email inside the duplicate window, so an existing row (a
+    # backfilled or expired one) restarts its created_at like a fresh insert
+    "upsert_flow": """
+        WITH flow AS (
+            INSERT INTO checkout_flows
+            (email, status, step_status, customer_name, customer_phone, client_id, updated_at)
+            VALUES ($1, $2, $3, $4, $5, $6, NOW())
+            ON CONFLICT (email) DO UPDATE SET
+                status = $2,
+                step_status = $3,
+                customer_name = $4,
+                customer_phone = $5,
+                client_id = $6,
+                created_at = NOW(),
+                updated_at = NOW()
+            RETURNING email
+        )
+        DELETE FROM flow_events WHERE email IN (SELECT email FROM flow)
+    """,
+    "append_flow_event": """
+        INSERT INTO flow_events (email, step, outcome)
+        VALUES ($1, $2, $3)
+    """,
+    "get_flow": """
+        SELECT status, step_status, customer_name, customer_phone, client_id, created_at
+        FROM checkout_flow_state
+        WHERE email = $1
+    """,
+    "update_status": """
+        UPDATE checkout_flows f
+        SET status = $1, updated_at = NOW()
+        FROM (
+            SELECT email, status AS previous_status
+            FROM checkout_flows
+            WHERE email = $2
+            FOR UPDATE
+        ) previous
+        WHERE f.email = previous.email
+        RETURNING f.client_id, previous.previous_status
+    """,
+    "delete_expired_flows": """
+        WITH expired AS (
+            DELETE FROM checkout_flows
+            WHERE email IN (
+                SELECT email FROM checkout_flows
+                WHERE updated_at < NOW() - make_interval(days => $1)
+                LIMIT $2
+                FOR UPDATE SKIP LOCKED
+            )
+            RETURNING email
+        ), events AS (
+            DELETE FROM flow_events WHERE email IN (SELECT email FROM expired)
+        )
+        SELECT email FROM expired
+    """,
+
+    # Anti-spam checks
+    "check_recent_flow": """
+        SELECT EXISTS (
+            SELECT 1 FROM checkout_flows
+            WHERE email = $1 AND created_at > NOW() - make_interval(hours => $2)
+        )
+    """,
+    "count_phone_flows": """
+        SELECT COUNT(*) FROM checkout_flows
+        WHERE customer_phone = $1
+        AND created_at > NOW() - make_interval(hours => $2)
+        AND status != 'blocked'
+    """,
+    "admit_flow": """
+        SELECT
+            EXISTS (
+                SELECT 1 FROM checkout_flows
+                WHERE email = $1
+                AND created_at > NOW() - make_interval(hours => $3)
+            ) AS duplicate,
+            (
+                SELECT COUNT(*) FROM (
+                    SELECT 1 FROM checkout_flows
+                    WHERE customer_phone = $2
+                    AND created_at > NOW() - make_interval(hours => $4)
+                    AND status != 'blocked'
+                    LIMIT $5
+                ) recent
+            ) AS phone_flows
+    """,
+
+    # Durable flow steps
+    "schedule_step": """
+        INSERT INTO flow_steps
+        (email, step_index, client_id, customer_phone, customer_name, due_at)
+        VALUES ($1, $2, $3, $4, $5, NOW() + make_interval(secs => $6))
+        ON CONFLICT (email) DO UPDATE SET
+            step_index = $2,
+            client_id = $3,
+            customer_phone = $4,
+            customer_name = $5,
+            due_at = NOW() + make_interval(secs => $6),
+            leased_until = NULL,
+            leased_by = NULL,
+            attempts = 0
+    """,
+    "claim_due_steps": """
+        WITH due AS (
+            SELECT email FROM flow_steps
+            WHERE due_at <= NOW()
+            AND (leased_until IS NULL OR leased_until < NOW())
+            ORDER BY due_at
+            LIMIT $1
+            FOR UPDATE SKIP LOCKED
+        )
+        UPDATE flow_steps s SET
+            leased_until = NOW() + make_interval(secs => $2),
+            leased_by = $3,
+            attempts = s.attempts + 1
+        FROM due
+        WHERE s.email = due.email
+        RETURNING s.email, s.step_index, s.client_id, s.customer_phone, s.customer_name, s.attempts
+    """,
+    "finish_step": """
+        DELETE FROM flow_steps
+        WHERE email = $1 AND step_index = $2
+    """,
+    "advance_step": """
+        UPDATE flow_steps SET
+            step_index = step_index + 1,
+            due_at = NOW() + make_interval(secs => $3),
+            leased_until = NULL,
+            leased_by = NULL,
+            attempts = 0
+        WHERE email = $1 AND step_index = $2
+    """,
+    "extend_leases": """
+        UPDATE flow_steps SET leased_until = NOW() + make_interval(secs => $2)
+        WHERE leased_by = $1
+    """,
+    "count_pending_steps": """
+        SELECT step_index, COUNT(*) AS count FROM flow_steps GROUP BY step_index
+    """,
+    "cancel_steps": """
+        DELETE FROM flow_steps WHERE email = $1
+    """,
+
+    # Rate limits
+    "get_rate_limit": """
+        SELECT window_index, current_count, previous_count
+        FROM rate_limits
+        WHERE key = $1
+    """,
+    "increment_rate_limit": """
+        INSERT INTO rate_limits
+        (key, window_index, current_count, previous_count, idle_seconds, updated_at)
+        VALUES ($1, $2, 1, 0, $3, NOW())
+        ON CONFLICT (key) DO UPDATE SET
+            previous_count = CASE
+                WHEN rate_limits.window_index = $2 THEN rate_limits.previous_count
+                WHEN rate_limits.window_index = $2 - 1 THEN rate_limits.current_count
+                ELSE 0 END,
+            current_count = CASE
+                WHEN rate_limits.window_index = $2 THEN rate_limits.current_count + 1
+                ELSE 1 END,
+            window_index = $2,
+            idle_seconds = $3,
+            updated_at = NOW()
+    """,
+    # Limiters with different windows share the table, so a key is only evicted
+    # once it is also past the TTL it was written with
+    "evict_rate_limits": """
+        DELETE FROM rate_limits
+        WHERE updated_at < NOW() - make_interval(secs => $1)
+        AND updated_at < NOW() - make_interval(secs => COALESCE(idle_seconds, $1))
+    """,
+
+    # Webhook receipts
+    "claim_webhook": """
+        INSERT INTO webhook_receipts (webhook_key)
+        VALUES ($1)
+        ON CONFLICT (webhook_key) DO NOTHING
+        RETURNING TRUE
+    """,
+    "release_webhook": """
+        DELETE FROM webhook_receipts WHERE webhook_key = $1
+    """,
+    "evict_webhook_receipts": """
+        DELETE FROM webhook_receipts
+        WHERE webhook_key IN (
+            SELECT webhook_key FROM webhook_receipts
+            WHERE received_at < NOW() - make_interval(secs => $1)
+            LIMIT $2
+            FOR UPDATE SKIP LOCKED
+        )
+    """,
+
+    # Flow plans
+    "get_flow_plans": """
+        SELECT client_id, definition FROM client_flow_plans
+    """,
+
+    # Analytics
+    "increment_rollup": """
+        INSERT INTO flow_rollups (client_id, bucket, metric, count)
+        VALUES ($1, $2, $3, $4)
+        ON CONFLICT (client_id, bucket, metric) DO UPDATE SET
+            count = flow_rollups.count + EXCLUDED.count
+    """,
+    "get_funnel": """
+        SELECT client_id, bucket, metric, count
+        FROM flow_rollups
+        WHERE bucket >= date_trunc('hour', $1::timestamptz) AND bucket < $2
+        AND ($3::text IS NULL OR client_id = $3)
+        ORDER BY bucket, client_id, metric
+    """,
+
+    # Flow statistics
+    "compact_status_counts": """
+        WITH folded AS (
+            DELETE FROM flow_status_counts RETURNING status, delta
+        )
+        INSERT INTO flow_status_counts (status, delta)
+        SELECT status, SUM(delta) FROM folded
+        GROUP BY status HAVING SUM(delta) <> 0
+    """,
+    "get_flow_statistics": """
+        SELECT
+            COALESCE(SUM(delta), 0) AS total,
+            COALESCE(SUM(delta) FILTER (WHERE status = 'pending'), 0) AS pending,
+            COALESCE(SUM(delta) FILTER (WHERE status = 'completed'), 0) AS completed,
+            COALESCE(SUM(delta) FILTER (WHERE status = 'blocked'), 0) AS blocked,
+            (SELECT COUNT(*) FROM checkout_flows WHERE created_at > NOW() - INTERVAL '1 hour') AS last_hour,
+            (SELECT COUNT(*) FROM checkout_flows WHERE created_at > NOW() - INTERVAL '24 hours') AS last_24h,
+            (SELECT MIN(created_at) FROM checkout_flows) AS oldest_flow,
+            (SELECT MAX(created_at) FROM checkout_flows) AS newest_flow
+        FROM flow_status_counts
+    """,
+}
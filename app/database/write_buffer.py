@@ -0,0 +1,228 @@
+import asyncio
+import logging
+from typing import Awaitable, Callable, Dict, Iterator, List, Optional, Tuple
+from app.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+write_behind_failures = metrics.counter(
+    "write_behind_failures_total", "Write-behind rows whose flush failed, by what happened to them", ("outcome",)
+)
+
+
+class WriteBehindBuffer:
+    """
+    Coalesces flow upserts, step-status updates and funnel rollup increments
+    and writes them in batches.
+
+    Writes are keyed (one pending upsert per email, one pending status per
+    email and step, one summed increment per rollup counter), so repeated
+    writes to the same key cost one row. The
+    buffer is flushed every `flush_interval` seconds, as soon as `max_batch`
+    writes are pending, and on stop. Readers call `flush_if_pending` first
+    so they never observe the database behind the buffer.
+
+    A failed flush that `retryable` accepts (lost connection, deadlock) is
+    requeued whole, backing off, up to `max_retries` times in a row before
+    its rows are dropped. Any other failure means the database rejected a
+    row, which would fail every batch it is in, so the batch is rewritten in
+    halves and only the rows that still fail on their own are dropped.
+    Dropped rows are logged and counted in write_behind_failures_total.
+    """
+
+    def __init__(self, write_batch: Callable[[List[tuple], List[tuple], List[tuple]], Awaitable[None]],
+                 flush_interval: float = 0.05, max_batch: int = 500,
+                 retryable: Callable[[Exception], bool] = lambda e: False, max_retries: int = 10):
+        self.write_batch = write_batch
+        self.flush_interval = flush_interval
+        self.max_batch = max_batch
+        self.retryable = retryable
+        self.max_retries = max_retries
+        self._flows: Dict[str, tuple] = {}
+        self._steps: Dict[Tuple[str, str], str] = {}
+        self._rollups: Dict[tuple, int] = {}
+        self._pending_emails = set()
+        self._flushing_emails = set()
+        # Phones of queued flow upserts, for the per-phone admission check
+        self._pending_phones = set()
+        self._flushing_phones = set()
+        self._flushing_rollups = False
+        self._lock = asyncio.Lock()
+        self._full = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+        self._stopping = False
+        # Consecutive flushes that failed with a retryable error
+        self._failures = 0
+        self.flushes = 0
+        self.rows_written = 0
+        self.rows_dropped = 0
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None
+
+    def __len__(self) -> int:
+        return len(self._flows) + len(self._steps) + len(self._rollups)
+
+    def add_flow(self, email: str, row: tuple, phone: Optional[str] = None):
+        """Queue an upsert row for a flow, replacing any queued upsert for the same email"""
+        self._flows[email] = row
+        if phone:
+            self._pending_phones.add(phone)
+        self._queued(email)
+
+    def add_step(self, email: str, step: str, status: str):
+        """Queue a step status update"""
+        self._steps[(email, step)] = status
+        self._queued(email)
+
+    def add_rollup(self, key: tuple, count: int = 1):
+        """Queue an increment of a rollup counter"""
+        self._rollups[key] = self._rollups.get(key, 0) + count
+        if len(self) >= self.max_batch:
+            self._full.set()
+
+    def _queued(self, email: str):
+        self._pending_emails.add(email)
+        if len(self) >= self.max_batch:
+            self._full.set()
+
+    def is_pending(self, email: Optional[str] = None, phone: Optional[str] = None) -> bool:
+        """
+        Whether writes for `email` or flows for `phone` have not been committed
+        yet; with neither given, whether anything has (rollups included).
+        """
+        if email is None and phone is None:
+            return bool(self._pending_emails or self._flushing_emails or self._rollups or self._flushing_rollups)
+        return (
+            email in self._pending_emails or email in self._flushing_emails
+            or phone in self._pending_phones or phone in self._flushing_phones
+        )
+
+    async def flush_if_pending(self, email: Optional[str] = None, phone: Optional[str] = None):
+        if self.is_pending(email, phone):
+            await self.flush()
+
+    async def flush(self):
+        """Write everything queued so far"""
+        async with self._lock:
+            if not self._pending_emails and not self._rollups:
+                return
+            flows, self._flows = self._flows, {}
+            steps, self._steps = self._steps, {}
+            rollups, self._rollups = self._rollups, {}
+            self._flushing_rollups = bool(rollups)
+            self._flushing_emails, self._pending_emails = self._pending_emails, set()
+            self._flushing_phones, self._pending_phones = self._pending_phones, set()
+            self._full.clear()
+            try:
+                await self._write(flows, steps, rollups)
+                self.flushes += 1
+                self._failures = 0
+            except Exception as e:
+                rows = len(flows) + len(steps) + len(rollups)
+                if not self.retryable(e):
+                    logger.error("[Database] Write-behind flush of %s rows was rejected, isolating bad rows: %s", rows, e)
+                    await self._isolate(flows, steps, rollups, e)
+                elif self._failures < self.max_retries:
+                    self._failures += 1
+                    logger.warning("[Database] Write-behind flush of %s rows failed (%s/%s), retrying: %s",
+                                   rows, self._failures, self.max_retries, e)
+                    self._requeue(flows, steps, rollups)
+                else:
+                    self._failures = 0
+                    self._drop(flows, steps, rollups, e)
+            finally:
+                self._flushing_emails = set()
+                self._flushing_phones = set()
+                self._flushing_rollups = False
+
+    async def _write(self, flows: Dict[str, tuple], steps: Dict[Tuple[str, str], str], rollups: Dict[tuple, int]):
+        await self.write_batch(
+            list(flows.values()),
+            [(email, step, status) for (email, step), status in steps.items()],
+            [key + (count,) for key, count in rollups.items()]
+        )
+        self.rows_written += len(flows) + len(steps) + len(rollups)
+
+    async def _isolate(self, flows: Dict[str, tuple], steps: Dict[Tuple[str, str], str],
+                       rollups: Dict[tuple, int], error: Exception):
+        """Write a rejected batch in halves until the rows the database rejects are alone, and drop those"""
+        if len(flows) + len(steps) + len(rollups) == 1:
+            self._drop(flows, steps, rollups, error)
+            return
+        for half in _halves(flows, steps, rollups):
+            try:
+                await self._write(*half)
+            except Exception as e:
+                if self.retryable(e):
+                    self._requeue(*half)
+                else:
+                    await self._isolate(*half, e)
+
+    def _requeue(self, flows: Dict[str, tuple], steps: Dict[Tuple[str, str], str], rollups: Dict[tuple, int]):
+        # Requeue without overwriting anything written to the buffer since
+        for email, row in flows.items():
+            self._flows.setdefault(email, row)
+            self._pending_emails.add(email)
+        for (email, step), status in steps.items():
+            self._steps.setdefault((email, step), status)
+            self._pending_emails.add(email)
+        for key, count in rollups.items():
+            self._rollups[key] = self._rollups.get(key, 0) + count
+        # Rows don't say which phone they were queued under, so keep them all pending
+        self._pending_phones |= self._flushing_phones
+        write_behind_failures.inc("retried", amount=len(flows) + len(steps) + len(rollups))
+
+    def _drop(self, flows: Dict[str, tuple], steps: Dict[Tuple[str, str], str], rollups: Dict[tuple, int],
+              error: Exception):
+        rows = len(flows) + len(steps) + len(rollups)
+        emails = sorted(set(flows) | {email for email, _ in steps})
+        logger.error("[Database] Dropped %s write-behind rows (emails %s, rollups %s): %s",
+                     rows, emails[:10], list(rollups)[:10], error)
+        self.rows_dropped += rows
+        write_behind_failures.inc("dropped", amount=rows)
+
+    async def _run(self):
+        while not self._stopping:
+            if self._failures:
+                # Back off while the database is failing, however full the buffer gets
+                await asyncio.sleep(self.flush_interval * 2 ** min(self._failures, 6))
+            else:
+                try:
+                    await asyncio.wait_for(self._full.wait(), timeout=self.flush_interval)
+                except asyncio.TimeoutError:
+                    pass
+            await self.flush()
+
+    def start(self):
+        if self._task is None:
+            self._stopping = False
+            self._task = asyncio.create_task(self._run())
+            logger.info("[Database] Write-behind buffer started (interval=%ss, batch=%s)", self.flush_interval, self.max_batch)
+
+    async def stop(self):
+        """Stop the flush loop and write out anything still queued"""
+        if self._task is not None:
+            # Let an in-progress flush finish rather than cancelling it mid-write
+            self._stopping = True
+            self._full.set()
+            await self._task
+            self._task = None
+        await self.flush()
+
+
+def _halves(flows: Dict[str, tuple], steps: Dict[Tuple[str, str], str],
+            rollups: Dict[tuple, int]) -> Iterator[tuple]:
+    """Split a batch's rows (of all three kinds) into two batches of about equal size"""
+    items = (
+        [(0, key, value) for key, value in flows.items()]
+        + [(1, key, value) for key, value in steps.items()]
+        + [(2, key, value) for key, value in rollups.items()]
+    )
+    middle = len(items) // 2
+    for half in (items[:middle], items[middle:]):
+        parts = ({}, {}, {})
+        for kind, key, value in half:
+            parts[kind][key] = value
+        yield parts
@@ -0,0 +1,98 @@
+import json
+import logging
+import queue
+import random
+import sys
+from logging.handlers import QueueHandler, QueueListener
+from typing import Dict
+
+# LogRecord attributes that are not user-supplied `extra` fields
+_RECORD_FIELDS = set(vars(logging.LogRecord("", 0, "", 0, "", (), None))) | {"message", "asctime"}
+
+
+class LazyQueueHandler(QueueHandler):
+    """
+    QueueHandler that enqueues the record untouched.
+
+    The stock handler formats the message before enqueueing, which would put
+    the %-interpolation back on the event loop; here it happens in the
+    listener thread when the record is written.
+    """
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        return record
+
+
+class SamplingFilter(logging.Filter):
+    """
+    Keep only a fraction of INFO and DEBUG records per category.
+
+    Records opt in with `extra={"category": "..."}`; warnings, errors and
+    records of categories without a rate always pass.
+    """
+
+    def __init__(self, rates: Dict[str, float]):
+        super().__init__()
+        self.rates = rates
+        self.dropped: Dict[str, int] = {}
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        category = getattr(record, "category", None)
+        if category is None or record.levelno >= logging.WARNING:
+            return True
+        rate = self.rates.get(category)
+        if rate is None or rate >= 1 or random.random() < rate:
+            return True
+        self.dropped[category] = self.dropped.get(category, 0) + 1
+        return False
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line with the message, its [Tag] prefix as `tag`, and any extra fields"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        message = record.getMessage()
+        entry = {
+            "ts": self.formatTime(record, "%Y-%m-%dT%H:%M:%S") + f".{int(record.msecs):03d}",
+            "level": record.levelname,
+            "logger": record.name,
+            "message": message,
+        }
+        if message.startswith("["):
+            end = message.find("]")
+            if end > 1:
+                entry["tag"] = message[1:end]
+        for key, value in vars(record).items():
+            if key not in _RECORD_FIELDS:
+                entry[key] = value
+        if record.exc_info:
+            entry["exc_info"] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+
+def configure_logging(level: str = "INFO", json_format: bool = True,
+                      sample_rates: Dict[str, float] = None) -> QueueListener:
+    """
+    Route all logging through an in-memory queue drained by a background
+    thread that formats and writes to stderr. Returns the started listener;
+    stop it at shutdown to flush what is still queued.
+    """
+    log_queue: queue.SimpleQueue = queue.SimpleQueue()
+    output = logging.StreamHandler(sys.stderr)
+    if json_format:
+        output.setFormatter(JsonFormatter())
+    else:
+        output.setFormatter(logging.Formatter("%(asctime)s - %(name)s - %(levelname)s - %(message)s"))
+
+    handler = LazyQueueHandler(log_queue)
+    handler.addFilter(SamplingFilter(sample_rates or {}))
+
+    root = logging.getLogger()
+    for existing in list(root.handlers):
+        root.removeHandler(existing)
+    root.addHandler(handler)
+    root.setLevel(level)
+
+    listener = QueueListener(log_queue, output, respect_handler_level=True)
+    listener.start()
+    return listener
@@ -1,17 +1,23 @@
+import asyncio
 import logging
+import time
 from contextlib import asynccontextmanager
 from fastapi import FastAPI
 from app.api.routes import router
-from app.state.store import init_database, postgres_store
+from app.api.load_shedding import LoadSheddingMiddleware, WEBHOOK_SHARES, webhook_limiter
+from app.logging_config import configure_logging
+from app.metrics import RouteMetricsMiddleware, http_request_duration
+from app.state.store import init_database, postgres_store, run_retention
+from app.services.handlers import dispatch_due_steps
+from app.services.scheduler import flow_scheduler
+from app.services.durable_scheduler import durable_step_queue
+from app.services.whatsapp import whatsapp_sender
+from app.services.flow_plans import flow_plans
+from app.services.send_queue import send_queue
+from config import settings
 
-# Configure logging
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.StreamHandler(),  # This outputs to console/terminal
-    ]
-)
+# Configure logging: records are queued and written by a background thread
+log_listener = configure_logging(settings.LOG_LEVEL, settings.LOG_JSON, settings.LOG_SAMPLE_RATES)
 
 logger = logging.getLogger(__name__)
 
@@ -19,14 +25,44 @@ logger = logging.getLogger(__name__)
 async def lifespan(app: FastAPI):
     # Startup
     logger.info("Starting up application...")
+    started = time.perf_counter()
+    app.state.ready = False
     await init_database()
+    await flow_plans.start()
+    await whatsapp_sender.start()
+    send_queue.start()
+    if settings.FLOW_SCHEDULER == "postgres":
+        step_scheduler = durable_step_queue
+        step_scheduler.start(dispatch_due_steps, capacity=send_queue.free_slots)
+    else:
+        step_scheduler = flow_scheduler
+        step_scheduler.start(dispatch_due_steps)
+    retention_task = None
+    if settings.RETENTION_INTERVAL_SECONDS > 0:
+        retention_task = asyncio.create_task(
+            run_retention(settings.RETENTION_DAYS, settings.RETENTION_INTERVAL_SECONDS)
+        )
+    app.state.ready = True
+    logger.info("[Startup] Ready in %.2fs", time.perf_counter() - started)
     yield
     # Shutdown
     logger.info("Shutting down application...")
+    app.state.ready = False
+    if retention_task is not None:
+        retention_task.cancel()
+    await step_scheduler.stop()
+    await flow_plans.stop()
+    await send_queue.stop()
+    await whatsapp_sender.close()
     await postgres_store.close()
+    log_listener.stop()
 
 app = FastAPI(lifespan=lifespan)
 app.include_router(router)
+if settings.SHED_ENABLED:
+    app.add_middleware(LoadSheddingMiddleware, limiter=webhook_limiter, shares=WEBHOOK_SHARES,
+                       retry_after=settings.SHED_RETRY_AFTER)
+app.add_middleware(RouteMetricsMiddleware, histogram=http_request_duration)
 
 @app.get("/")
 def read_root():
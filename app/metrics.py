@@ -0,0 +1,240 @@
+import functools
+import inspect
+import logging
+import time
+from bisect import bisect_left
+from typing import Awaitable, Callable, Dict, List, Optional, Sequence, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Prometheus' default latency buckets, in seconds
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _label_text(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(str(value))}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class Counter:
+    """Monotonic counter, incremented in place or read at scrape time from totals kept elsewhere"""
+
+    def __init__(self, name: str, help: str, labels: Sequence[str] = (),
+                 collect: Optional[Callable[[], Dict[Tuple[str, ...], float]]] = None):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self.collect = collect
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, *label_values: str, amount: float = 1):
+        self._values[label_values] = self._values.get(label_values, 0) + amount
+
+    def render(self) -> List[str]:
+        values = self.collect() if self.collect is not None else self._values
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        for label_values, total in values.items():
+            lines.append(f"{self.name}{_label_text(self.labels, label_values)} {total}")
+        return lines
+
+
+class Gauge:
+    """Gauge whose samples come from a callback evaluated at scrape time"""
+
+    def __init__(self, name: str, help: str, labels: Sequence[str] = (),
+                 collect: Optional[Callable[[], Dict[Tuple[str, ...], float]]] = None):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self.collect = collect
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def set(self, value: float, *label_values: str):
+        self._values[label_values] = value
+
+    def replace(self, values: Dict[Tuple[str, ...], float]):
+        self._values = values
+
+    def render(self) -> List[str]:
+        values = self.collect() if self.collect is not None else self._values
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} gauge"]
+        for label_values, value in values.items():
+            lines.append(f"{self.name}{_label_text(self.labels, label_values)} {value}")
+        return lines
+
+
+class Histogram:
+    """
+    Fixed-bucket histogram. An observation is one bisect and three increments;
+    buckets are only made cumulative when rendered.
+    """
+
+    def __init__(self, name: str, help: str, labels: Sequence[str] = (), buckets: Sequence[float] = DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self.buckets = tuple(buckets)
+        # label values -> [per-bucket counts (+Inf last), sum, count]
+        self._series: Dict[Tuple[str, ...], list] = {}
+
+    def observe(self, value: float, *label_values: str):
+        series = self._series.get(label_values)
+        if series is None:
+            series = self._series[label_values] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+        series[0][bisect_left(self.buckets, value)] += 1
+        series[1] += value
+        series[2] += 1
+
+    def totals(self, *label_values: str) -> Tuple[float, int]:
+        """Sum and count of the observations of one series so far"""
+        series = self._series.get(label_values)
+        return (series[1], series[2]) if series is not None else (0.0, 0)
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        for values, (counts, total, count) in self._series.items():
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += bucket_count
+                le = "+Inf" if bound == float("inf") else repr(bound)
+                labels = _label_text(self.labels, values, 'le="' + le + '"')
+                lines.append(f"{self.name}_bucket{labels} {cumulative}")
+            lines.append(f"{self.name}_sum{_label_text(self.labels, values)} {total}")
+            lines.append(f"{self.name}_count{_label_text(self.labels, values)} {count}")
+        return lines
+
+
+class MetricsRegistry:
+    """Process-local metrics rendered in the Prometheus text exposition format"""
+
+    def __init__(self):
+        self._metrics: Dict[str, object] = {}
+        self._collectors: List[Callable[[], Awaitable[None]]] = []
+
+    def _register(self, metric):
+        if metric.name in self._metrics:
+            raise ValueError(f"Metric {metric.name} already registered")
+        self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name: str, help: str, labels: Sequence[str] = (),
+                collect: Optional[Callable[[], Dict[Tuple[str, ...], float]]] = None) -> Counter:
+        return self._register(Counter(name, help, labels, collect))
+
+    def gauge(self, name: str, help: str, labels: Sequence[str] = (),
+              collect: Optional[Callable[[], Dict[Tuple[str, ...], float]]] = None) -> Gauge:
+        return self._register(Gauge(name, help, labels, collect))
+
+    def histogram(self, name: str, help: str, labels: Sequence[str] = (),
+                  buckets: Sequence[float] = DEFAULT_BUCKETS) -> Histogram:
+        return self._register(Histogram(name, help, labels, buckets))
+
+    def add_collector(self, collector: Callable[[], Awaitable[None]]):
+        """Register an async callback that refreshes gauges before each scrape"""
+        self._collectors.append(collector)
+
+    async def render(self) -> str:
+        for collector in self._collectors:
+            try:
+                await collector()
+            except Exception as e:
+                # Serve the remaining metrics; the refreshed gauges keep their last values
+                logger.error("[Metrics] Collector %s failed: %s", collector.__name__, e)
+        lines: List[str] = []
+        for metric in self._metrics.values():
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+def instrument_methods(cls, histogram: Histogram, exclude: Sequence[str] = ()):
+    """Time every public coroutine method of `cls` into `histogram`, labelled by method name"""
+    for name, method in list(vars(cls).items()):
+        if name.startswith("_") or name in exclude or not inspect.iscoroutinefunction(method):
+            continue
+        setattr(cls, name, _timed(method, histogram, name))
+
+
+def _timed(method, histogram: Histogram, label: str):
+    @functools.wraps(method)
+    async def wrapper(*args, **kwargs):
+        started = time.perf_counter()
+        try:
+            return await method(*args, **kwargs)
+        finally:
+            histogram.observe(time.perf_counter() - started, label)
+    return wrapper
+
+
+class RouteMetricsMiddleware:
+    """
+    Pure ASGI middleware timing each HTTP request into a histogram labelled by
+    method, route template and status. Requests that match no route share one
+    "unmatched" label so arbitrary paths cannot blow up the series count.
+    """
+
+    def __init__(self, app, histogram: Histogram):
+        self.app = app
+        self.histogram = histogram
+        self._paths: Dict[object, str] = {}
+
+    def _route_path(self, scope) -> str:
+        route = scope.get("route")
+        if route is not None:
+            return getattr(route, "path", "unmatched")
+        endpoint = scope.get("endpoint")
+        if endpoint is None:
+            return "unmatched"
+        path = self._paths.get(endpoint)
+        if path is None:
+            path = "unmatched"
+            for candidate in scope["app"].router.routes:
+                if getattr(candidate, "endpoint", None) is endpoint:
+                    path = candidate.path
+                    break
+            self._paths[endpoint] = path
+        return path
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        status = [500]
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                status[0] = message["status"]
+            await send(message)
+
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            self.histogram.observe(
+                time.perf_counter() - started, scope["method"], self._route_path(scope), str(status[0])
+            )
+
+
+# Global instance
+metrics = MetricsRegistry()
+
+http_request_duration = metrics.histogram(
+    "http_request_duration_seconds", "HTTP request latency by route", ("method", "route", "status")
+)
+db_query_duration = metrics.histogram(
+    "db_method_duration_seconds", "PostgresStore method latency", ("method",)
+)
+db_pool_acquire_wait = metrics.histogram(
+    "db_pool_acquire_wait_seconds", "Time spent waiting for a pool connection"
+)
+whatsapp_send_duration = metrics.histogram(
+    "whatsapp_send_duration_seconds", "Graph API send latency", ("outcome",)
+)
+whatsapp_sends = metrics.counter(
+    "whatsapp_sends_total", "send_whatsapp_template calls by outcome", ("outcome",)
+)
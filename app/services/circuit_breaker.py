@@ -0,0 +1,127 @@
+import logging
+from typing import Dict
+from app.clock import clock
+from app.metrics import metrics
+from config import settings
+
+logger = logging.getLogger(__name__)
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+
+class CircuitOpenError(Exception):
+    """Raised instead of calling an upstream whose breaker is open"""
+
+    def __init__(self, upstream: str, retry_after: float):
+        super().__init__(f"Circuit open for {upstream}, retry in {retry_after:.1f}s")
+        self.upstream = upstream
+        self.retry_after = retry_after
+
+
+class CircuitBreaker:
+    """
+    Consecutive-failure circuit breaker for one upstream.
+
+    After `failure_threshold` failures in a row the breaker opens and callers
+    fail fast for `reset_timeout` seconds. It then half-opens, letting up to
+    `half_open_probes` calls through: a success closes it again, a failure
+    re-opens it for another `reset_timeout`.
+    """
+
+    def __init__(self, upstream: str, failure_threshold: int = 5, reset_timeout: float = 30.0,
+                 half_open_probes: int = 1):
+        self.upstream = upstream
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.half_open_probes = half_open_probes
+        self.state = CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+        self._probes = 0
+        self.rejected = 0
+        self.transitions: Dict[str, int] = {CLOSED: 0, OPEN: 0, HALF_OPEN: 0}
+
+    def _transition(self, state: str):
+        if state != self.state:
+            logger.warning("[Circuit Breaker] %s: %s -> %s", self.upstream, self.state, state)
+            self.state = state
+            self.transitions[state] += 1
+
+    def before_call(self):
+        """Admit a call, or raise CircuitOpenError while the upstream is considered unhealthy"""
+        if self.state == OPEN:
+            remaining = self._opened_at + self.reset_timeout - clock.monotonic()
+            if remaining > 0:
+                self.rejected += 1
+                raise CircuitOpenError(self.upstream, remaining)
+            self._transition(HALF_OPEN)
+            self._probes = 0
+        if self.state == HALF_OPEN:
+            if self._probes >= self.half_open_probes:
+                self.rejected += 1
+                raise CircuitOpenError(self.upstream, self.reset_timeout)
+            self._probes += 1
+
+    def record_success(self):
+        self._failures = 0
+        self._transition(CLOSED)
+
+    def record_failure(self):
+        self._failures += 1
+        if self.state == HALF_OPEN or self._failures >= self.failure_threshold:
+            self._opened_at = clock.monotonic()
+            self._transition(OPEN)
+
+    def stats(self) -> dict:
+        return {
+            "state": self.state,
+            "consecutive_failures": self._failures,
+            "rejected": self.rejected,
+            "transitions": dict(self.transitions),
+        }
+
+
+class CircuitBreakerRegistry:
+    """One breaker per upstream, created on first use"""
+
+    def __init__(self, failure_threshold: int, reset_timeout: float, half_open_probes: int):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.half_open_probes = half_open_probes
+        self._breakers: Dict[str, CircuitBreaker] = {}
+
+    def get(self, upstream: str) -> CircuitBreaker:
+        breaker = self._breakers.get(upstream)
+        if breaker is None:
+            breaker = self._breakers[upstream] = CircuitBreaker(
+                upstream, self.failure_threshold, self.reset_timeout, self.half_open_probes
+            )
+        return breaker
+
+    def stats(self) -> Dict[str, dict]:
+        return {upstream: breaker.stats() for upstream, breaker in self._breakers.items()}
+
+
+# Global instance
+circuit_breakers = CircuitBreakerRegistry(
+    settings.BREAKER_FAILURE_THRESHOLD,
+    settings.BREAKER_RESET_TIMEOUT,
+    settings.BREAKER_HALF_OPEN_PROBES
+)
+
+# Numeric value of each state in the circuit_breaker_state gauge
+STATE_VALUES = {CLOSED: 0, HALF_OPEN: 1, OPEN: 2}
+
+metrics.gauge("circuit_breaker_state", "Breaker state per upstream: 0 closed, 1 half-open, 2 open", ("upstream",),
+              collect=lambda: {
+                  (upstream,): STATE_VALUES[breaker.state]
+                  for upstream, breaker in circuit_breakers._breakers.items()
+              })
+metrics.counter("circuit_breaker_transitions_total", "Breaker state changes since start", ("upstream", "state"),
+                collect=lambda: {
+                    (upstream, state): count
+                    for upstream, breaker in circuit_breakers._breakers.items()
+                    for state, count in breaker.transitions.items()
+                })
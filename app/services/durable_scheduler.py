@@ -0,0 +1,134 @@
+import asyncio
+import logging
+import os
+import socket
+from typing import Callable, List, Optional
+from uuid import uuid4
+from app.database.postgres_store import postgres_store
+from app.services.scheduler import PendingStep
+from app.state.store import update_step_status
+from config import settings
+
+logger = logging.getLogger(__name__)
+
+
+class DurableStepQueue:
+    """
+    Postgres-backed flow step scheduler.
+
+    Pending steps live in the flow_steps table. Every worker process polls for
+    due rows, leasing a batch with FOR UPDATE SKIP LOCKED so workers never
+    block on or double-claim each other's rows. While steps are in flight the
+    worker renews its leases every third of `lease_seconds`, so a send held up
+    by queueing, retries or an open circuit breaker keeps its step. A step
+    whose worker dies is picked up again by another worker once its lease
+    expires; one claimed `max_attempts` times without completing is dropped
+    and recorded as failed.
+    """
+
+    def __init__(self, batch_size: int = 100, lease_seconds: float = 120, poll_interval: float = 1.0,
+                 max_attempts: int = 5):
+        self.batch_size = batch_size
+        self.lease_seconds = lease_seconds
+        self.poll_interval = poll_interval
+        self.max_attempts = max_attempts
+        # Unique per instance: a restarted container reuses its hostname and often
+        # its PID, and must not renew (or complete) the leases of its predecessor
+        self.worker_id = f"{socket.gethostname()}:{os.getpid()}:{uuid4().hex[:12]}"
+        self._in_flight = 0
+        self._capacity: Optional[Callable[[], int]] = None
+        self._task: Optional[asyncio.Task] = None
+        self._heartbeat_task: Optional[asyncio.Task] = None
+        self.exhausted = 0
+
+    async def schedule(self, step: PendingStep, delay: float):
+        """Persist a step to fire after `delay` seconds"""
+        await postgres_store.schedule_step(
+            step.email, step.phone, step.customer_name, step.client_id, step.step_index, delay
+        )
+
+    async def complete(self, step: PendingStep, next_delay: Optional[float]):
+        """Release a claimed step, scheduling the following step when `next_delay` is given"""
+        try:
+            await postgres_store.advance_step(step.email, step.step_index, next_delay)
+        finally:
+            self._in_flight -= 1
+
+    async def _give_up(self, row: dict):
+        """Drop a step that kept being claimed without completing"""
+        self.exhausted += 1
+        logger.error("[Scheduler] Step %s for %s claimed %s times without completing, marking it failed",
+                     row["step_index"]+1, row["email"], row["attempts"] - 1)
+        await postgres_store.advance_step(row["email"], row["step_index"], None)
+        await update_step_status(row["email"], f"step_{row['step_index']+1}", "failed", row["client_id"])
+
+    async def _heartbeat(self):
+        while True:
+            await asyncio.sleep(self.lease_seconds / 3)
+            if self._in_flight <= 0:
+                continue
+            try:
+                await postgres_store.extend_leases(self.worker_id, self.lease_seconds)
+            except Exception as e:
+                logger.error("[Scheduler] Error renewing step leases: %s", e)
+
+    async def _run(self, on_due: Callable[[List[PendingStep]], None]):
+        while True:
+            claimed = 0
+            try:
+                capacity = self.batch_size - self._in_flight
+                if self._capacity is not None:
+                    # Downstream backpressure: claim no more than can be accepted
+                    capacity = min(capacity, self._capacity())
+                if capacity > 0:
+                    rows = await postgres_store.claim_due_steps(self.worker_id, capacity, self.lease_seconds)
+                    claimed = len(rows)
+                    # attempts counts this claim too
+                    exhausted = [row for row in rows if row["attempts"] > self.max_attempts]
+                    rows = [row for row in rows if row["attempts"] <= self.max_attempts]
+                    if rows:
+                        self._in_flight += len(rows)
+                        on_due([
+                            PendingStep(
+                                row["email"], row["customer_phone"], row["customer_name"],
+                                row["client_id"], row["step_index"]
+                            )
+                            for row in rows
+                        ])
+                    for row in exhausted:
+                        await self._give_up(row)
+            except Exception as e:
+                logger.error("[Scheduler] Error claiming due steps: %s", e)
+            # Keep draining while full batches come back, otherwise wait for the next poll
+            if claimed < self.batch_size:
+                await asyncio.sleep(self.poll_interval)
+
+    def start(self, on_due: Callable[[List[PendingStep]], None], capacity: Optional[Callable[[], int]] = None):
+        """Start polling for due steps, handing each claimed batch to `on_due` and claiming at most `capacity()`"""
+        if self._task is None:
+            self._capacity = capacity
+            self._task = asyncio.create_task(self._run(on_due))
+            self._heartbeat_task = asyncio.create_task(self._heartbeat())
+            logger.info("[Scheduler] Durable step queue started as %s", self.worker_id)
+
+    async def stop(self):
+        """Stop polling; leased steps not yet completed are retried after their lease expires"""
+        if self._task is not None:
+            for task in (self._task, self._heartbeat_task):
+                task.cancel()
+                try:
+                    await task
+                except asyncio.CancelledError:
+                    pass
+            self._task = None
+            self._heartbeat_task = None
+            logger.info("[Scheduler] Durable step queue stopped with %s steps in flight", self._in_flight)
+
+
+# Global instance
+durable_step_queue = DurableStepQueue(
+    batch_size=settings.FLOW_CLAIM_BATCH,
+    lease_seconds=settings.FLOW_LEASE_SECONDS,
+    poll_interval=settings.FLOW_POLL_INTERVAL,
+    max_attempts=settings.FLOW_MAX_ATTEMPTS
+)
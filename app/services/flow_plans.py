@@ -0,0 +1,185 @@
+import asyncio
+import hashlib
+import json
+import logging
+import os
+from typing import Any, Callable, Dict, NamedTuple, Optional, Set, Tuple
+from app.database.postgres_store import postgres_store
+from app.services.scheduler import PendingStep
+from config import settings
+from config_flows.client_flows import FLOW_CONFIG
+
+logger = logging.getLogger(__name__)
+
+ParamAccessor = Callable[[PendingStep], str]
+
+
+class StepPlan(NamedTuple):
+    delay: float
+    template: str
+    params: Tuple[ParamAccessor, ...]
+
+    def resolve(self, step: PendingStep) -> list:
+        """Template parameters for `step`"""
+        return [param(step) for param in self.params]
+
+
+class FlowPlan(NamedTuple):
+    client_id: str
+    version: str
+    steps: Tuple[StepPlan, ...]
+    shop_domains: Tuple[str, ...]
+
+
+def definition_version(definition: Dict[str, Any]) -> str:
+    """Stable hash of a client's flow definition"""
+    canonical = json.dumps(definition, sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(canonical.encode()).hexdigest()[:12]
+
+
+def _customer_name(step: PendingStep) -> str:
+    return step.customer_name or "there"
+
+
+def _compile_param(param: str, checkout_url: str) -> ParamAccessor:
+    """Turn a "{variable}" placeholder or literal into an accessor, once per plan"""
+    if not (param.startswith("{") and param.endswith("}")):
+        return lambda step: param
+    name = param[1:-1]
+    if name == "customer_name":
+        return _customer_name
+    if name == "checkout_url":
+        return lambda step: checkout_url
+    logger.warning("[Flow Plans] Unknown placeholder %s, sending it empty", param)
+    return lambda step: ""
+
+
+def compile_plan(client_id: str, definition: Dict[str, Any]) -> FlowPlan:
+    """Validate a client's flow definition and compile it into an immutable plan"""
+    checkout_url = definition.get("checkout_url", "")
+    steps = definition.get("checkout") or []
+    if not steps:
+        raise ValueError(f"client {client_id} has no checkout steps")
+    compiled = tuple(
+        StepPlan(
+            float(step["delay"]),
+            step["template"],
+            tuple(_compile_param(param, checkout_url) for param in step.get("params", [])),
+        )
+        for step in steps
+    )
+    domains = tuple(domain.lower() for domain in definition.get("shop_domains", []))
+    return FlowPlan(client_id, definition_version(definition), compiled, domains)
+
+
+class FlowPlanRegistry:
+    """
+    Compiled flow plans per client, swapped atomically on reload.
+
+    Plans are looked up at send time, so a reload applies to the next step of
+    flows already in progress; a flow whose plan shrank below its current step
+    simply ends.
+    """
+
+    def __init__(self, source: str, reload_interval: float):
+        self.source = source
+        self.reload_interval = reload_interval
+        self._plans: Dict[str, FlowPlan] = {}
+        self._by_domain: Dict[str, str] = {}
+        # Unlisted shops already warned about, so the fallback logs once per shop
+        self._fallback_shops: Set[str] = set()
+        self._file_mtime: Optional[float] = None
+        self._task: Optional[asyncio.Task] = None
+        self.reloads = 0
+
+    def get(self, client_id: str) -> Optional[FlowPlan]:
+        return self._plans.get(client_id)
+
+    def client_for_shop(self, shop_domain: str) -> Optional[str]:
+        """
+        Client id registered for a Shopify shop domain. While the only plan is
+        DEFAULT_CLIENT_ID's, a shop missing from shop_domains falls back to it
+        rather than losing every webhook to a wrong or missing domain.
+        """
+        shop_domain = shop_domain.lower()
+        client_id = self._by_domain.get(shop_domain)
+        if client_id is None and self._plans.keys() == {settings.DEFAULT_CLIENT_ID}:
+            if shop_domain not in self._fallback_shops:
+                self._fallback_shops.add(shop_domain)
+                logger.warning("[Flow Plans] Shop %s is not in any shop_domains, using the only plan (%s)",
+                               shop_domain, settings.DEFAULT_CLIENT_ID)
+            client_id = settings.DEFAULT_CLIENT_ID
+        return client_id
+
+    def versions(self) -> Dict[str, str]:
+        return {client_id: plan.version for client_id, plan in self._plans.items()}
+
+    def load(self, definitions: Dict[str, Dict[str, Any]]):
+        """Compile `definitions`, reusing plans whose version is unchanged"""
+        plans: Dict[str, FlowPlan] = {}
+        for client_id, definition in definitions.items():
+            current = self._plans.get(client_id)
+            if current is not None and current.version == definition_version(definition):
+                plans[client_id] = current
+                continue
+            try:
+                plans[client_id] = compile_plan(client_id, definition)
+            except (KeyError, TypeError, ValueError) as e:
+                logger.error("[Flow Plans] Invalid definition for %s: %s", client_id, e)
+                if current is not None:
+                    plans[client_id] = current
+        by_domain = {domain: plan.client_id for plan in plans.values() for domain in plan.shop_domains}
+        changed = plans.keys() != self._plans.keys() or any(
+            plan is not self._plans.get(client_id) for client_id, plan in plans.items()
+        )
+        self._plans, self._by_domain = plans, by_domain
+        if changed:
+            self.reloads += 1
+            logger.info("[Flow Plans] Loaded %s client plans: %s", len(plans), self.versions())
+
+    async def _read_definitions(self) -> Optional[Dict[str, Dict[str, Any]]]:
+        """Current definitions from the source, or None when a file source is unchanged"""
+        if self.source == "config":
+            return FLOW_CONFIG
+        if self.source == "postgres":
+            return await postgres_store.get_flow_plans()
+        mtime = os.stat(self.source).st_mtime
+        if mtime == self._file_mtime:
+            return None
+        with open(self.source) as f:
+            definitions = json.load(f)
+        self._file_mtime = mtime
+        return definitions
+
+    async def reload(self):
+        """Re-read the source and swap in any changed plans"""
+        definitions = await self._read_definitions()
+        if definitions is not None:
+            self.load(definitions)
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.reload_interval)
+            try:
+                await self.reload()
+            except Exception as e:
+                logger.error("[Flow Plans] Reload failed: %s", e)
+
+    async def start(self):
+        """Load the plans and start watching the source for changes"""
+        await self.reload()
+        if self._task is None and self.reload_interval > 0 and self.source != "config":
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+
+# Global instance
+flow_plans = FlowPlanRegistry(settings.FLOW_PLANS_SOURCE, settings.FLOW_PLANS_RELOAD_INTERVAL)
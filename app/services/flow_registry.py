@@ -0,0 +1,50 @@
+import logging
+from typing import Dict
+from app.database.postgres_store import postgres_store
+from app.services.scheduler import PendingStep, flow_scheduler
+from config import settings
+
+logger = logging.getLogger(__name__)
+
+
+class FlowRegistry:
+    """
+    Flows with a step pending or running in this process, keyed by email.
+
+    Pending steps are indexed by the timing wheel itself; the registry adds the
+    steps currently being sent. Cancelling a flow drops its timer and marks a
+    running step so it schedules nothing further.
+    """
+
+    def __init__(self):
+        self._running: Dict[str, PendingStep] = {}
+        self.cancelled = 0
+
+    def started(self, step: PendingStep):
+        self._running[step.email] = step
+
+    def finished(self, step: PendingStep):
+        if self._running.get(step.email) is step:
+            del self._running[step.email]
+
+    def cancel(self, email: str) -> bool:
+        """Cancel this process's timer or running step for `email`"""
+        cancelled = flow_scheduler.cancel(email)
+        step = self._running.get(email)
+        if step is not None and not step.cancelled:
+            step.cancelled = True
+            cancelled = True
+        if cancelled:
+            self.cancelled += 1
+            logger.info("[Checkout Flow] Cancelled flow for %s", email)
+        return cancelled
+
+    async def cancel_everywhere(self, email: str):
+        """Cancel the flow locally and remove its durable step, if steps are stored in Postgres"""
+        self.cancel(email)
+        if settings.FLOW_SCHEDULER == "postgres":
+            await postgres_store.cancel_steps(email)
+
+
+# Global instance
+flow_registry = FlowRegistry()
@@ -1,37 +1,69 @@
 import asyncio
 import logging
+from typing import List
 from app.models.checkout import CheckoutPayload
-from app.services.whatsapp import send_whatsapp_template
-from app.state.store import set_checkout_flow, get_checkout_flow, update_step_status
+from app.services.send_queue import send_queue, step_priority
+from app.services.scheduler import PendingStep, flow_scheduler
+from app.services.durable_scheduler import durable_step_queue
+from app.services.flow_registry import flow_registry
+from app.services.flow_plans import flow_plans
+from app.state.store import set_checkout_flow, update_step_status, recent_admissions
 from app.database.postgres_store import postgres_store
-from config_flows.client_flows import FLOW_CONFIG 
+from app.metrics import metrics
+from config_flows.client_flows import RATE_LIMITS
+from config import settings
 
 logger = logging.getLogger(__name__)
 
-async def handle_checkout_flow(payload: CheckoutPayload, client_id="zuzumonk"):
+# Strong references to in-flight step tasks so they are not garbage collected
+running_steps = set()
+
+flows_pending = metrics.gauge("flows_pending", "Flows waiting to send each step", ("step",))
+
+async def collect_pending_steps():
+    """Refresh flows_pending from whichever scheduler holds the pending steps"""
+    if settings.FLOW_SCHEDULER == "postgres":
+        counts = await postgres_store.count_pending_steps()
+    else:
+        counts = flow_scheduler.pending_by_step()
+    flows_pending.replace({(f"step_{index+1}",): count for index, count in counts.items()})
+
+metrics.add_collector(collect_pending_steps)
+
+async def handle_checkout_flow(payload: CheckoutPayload, client_id: str = settings.DEFAULT_CLIENT_ID):
     email = payload.customer_email
     phone = payload.customer_phone
-    logger.info(f"[Checkout Flow] Starting flow for: {email}")
+    logger.info("[Checkout Flow] Starting flow for: %s", email)
 
     if not email or not phone:
-        logger.warning(f"[Checkout Flow] Missing email or phone for payload: {payload}")
+        logger.warning("[Checkout Flow] Missing email or phone for payload: %s", payload)
         return
 
-    if client_id not in FLOW_CONFIG:
-        logger.error(f"[Checkout Flow] Unknown client_id: {client_id}")
+    plan = flow_plans.get(client_id)
+    if plan is None:
+        logger.error("[Checkout Flow] Unknown client_id: %s", client_id)
         return
 
     # Anti-spam checks
-    # 1. Check if user had a recent flow (prevent duplicate flows)
-    recent_flow = await postgres_store.check_recent_flow(email, hours=2)
-    if recent_flow:
-        logger.info(f"[Checkout Flow] Blocked duplicate flow for {email} (recent flow exists)")
+    # 1. Duplicate flows this worker started recently never need a DB round trip
+    if email in recent_admissions:
+        logger.info("[Checkout Flow] Blocked duplicate flow for %s (recently admitted)", email)
         return
 
-    # 2. Check phone number message frequency
-    phone_msg_count = await postgres_store.get_phone_message_count(phone, hours=24)
-    if phone_msg_count >= 3:  # Max 3 flows per phone per day
-        logger.warning(f"[Checkout Flow] Blocked flow for {phone} (daily limit reached)")
+    # 2. Recent flow for the email and phone message frequency, in one query
+    admission = await postgres_store.admit_flow(
+        email,
+        phone,
+        recent_hours=RATE_LIMITS["min_hours_between_flows"],
+        phone_hours=24,
+        phone_limit=RATE_LIMITS["max_flows_per_phone_per_day"]
+    )
+    if admission == "duplicate":
+        logger.info("[Checkout Flow] Blocked duplicate flow for %s (recent flow exists)", email)
+        return
+
+    if admission == "phone_limit":
+        logger.warning("[Checkout Flow] Blocked flow for %s (daily limit reached)", phone)
         await set_checkout_flow(email, {
             "status": "blocked",
             "step_status": {"reason": "daily_limit_exceeded"},
@@ -41,6 +73,8 @@ async def handle_checkout_flow(payload: CheckoutPayload, client_id="zuzumonk"):
         })
         return
 
+    recent_admissions.add(email)
+
     # Store flow in database
     flow_data = {
         "status": "pending",
@@ -51,45 +85,84 @@ async def handle_checkout_flow(payload: CheckoutPayload, client_id="zuzumonk"):
     }
     await set_checkout_flow(email, flow_data)
 
-    flow_steps = FLOW_CONFIG[client_id]["checkout"]
+    # Hand the flow to the scheduler instead of parking a coroutine per checkout
+    first_delay = plan.steps[0].delay
+    step = PendingStep(email, phone, payload.customer_name, client_id)
+    if settings.FLOW_SCHEDULER == "postgres":
+        await durable_step_queue.schedule(step, first_delay)
+    else:
+        flow_scheduler.schedule(step, first_delay)
 
-    variable_map = {
-        "customer_name": payload.customer_name or "there",
-        "checkout_url": "https://zuzumonk.com/checkout"
-    }
-
-    for step_index, step in enumerate(flow_steps):
-        delay = step["delay"]
-        template = step["template"]
-        param_vars = step["params"]
+async def run_flow_step(step: PendingStep):
+    """Send a single due step and schedule the next one"""
+    email = step.email
+    step_index = step.step_index
+    plan = flow_plans.get(step.client_id)
+    if plan is None or step_index >= len(plan.steps):
+        # The client's plan was removed or shortened by a reload since this step was scheduled
+        logger.warning("[Checkout Flow] No step %s in plan for %s, ending flow: %s", step_index+1, step.client_id, email)
+        await finish_step(step, None)
+        return
+    step_plan = plan.steps[step_index]
+    template = step_plan.template
 
+    # Completed orders cancel the flow through the registry, so there is no
+    # per-step status read here
+    next_delay = None
+    try:
         try:
-            await asyncio.sleep(delay)
-
-            # Check if flow was completed
-            current_flow = await get_checkout_flow(email)
-            if current_flow.get("status") == "completed":
-                logger.info(f"[Checkout Flow] Stopped at step {step_index+1}, order completed: {email}")
-                return
+            resolved_params = step_plan.resolve(step)
 
-            resolved_params = [
-                variable_map.get(param.strip("{}"), "") for param in param_vars
-            ]
-
-            logger.info(f"[Checkout Flow] Sending step {step_index+1} to {email} using template {template}")
+            logger.info("[Checkout Flow] Sending step %s to %s using template %s", step_index+1, email, template)
             
-            # This will now check rate limits before sending
-            await send_whatsapp_template(phone, template, resolved_params)
-            await update_step_status(email, f"step_{step_index+1}", "sent")
+            # Rate limits are checked by the send queue worker before sending
+            await send_queue.submit(
+                step.phone, template, resolved_params,
+                priority=step_priority(step_index, len(plan.steps))
+            )
+            await update_step_status(email, f"step_{step_index+1}", "sent", step.client_id)
             
         except Exception as e:
-            logger.error(f"[Checkout Flow] Error in step {step_index+1} for {email}: {str(e)}")
-            await update_step_status(email, f"step_{step_index+1}", "failed")
+            logger.error("[Checkout Flow] Error in step %s for %s: %s", step_index+1, email, e)
+            await update_step_status(email, f"step_{step_index+1}", "failed", step.client_id)
             
             # If rate limited, stop the entire flow
             if "rate limit" in str(e).lower():
-                logger.info(f"[Checkout Flow] Stopping flow due to rate limit: {email}")
+                logger.info("[Checkout Flow] Stopping flow due to rate limit: %s", email)
                 return
-            continue
 
-    logger.info(f"[Checkout Flow] Flow completed for {email}")
+        if step_index + 1 < len(plan.steps):
+            next_delay = plan.steps[step_index + 1].delay
+        else:
+            logger.info("[Checkout Flow] Flow completed for %s", email)
+    finally:
+        await finish_step(step, next_delay)
+
+async def finish_step(step: PendingStep, next_delay):
+    """Schedule the step after `step`, or end the flow when `next_delay` is None"""
+    flow_registry.finished(step)
+    if step.cancelled:
+        logger.info("[Checkout Flow] Stopped after step %s, order completed: %s", step.step_index+1, step.email)
+        next_delay = None
+    if settings.FLOW_SCHEDULER == "postgres":
+        await durable_step_queue.complete(step, next_delay)
+    elif next_delay is not None:
+        step.step_index += 1
+        flow_scheduler.schedule(step, next_delay)
+
+def dispatch_due_steps(batch: List[PendingStep]):
+    """Run a batch of due steps fired by the scheduler"""
+    free = send_queue.free_slots()
+    if len(batch) > free and settings.FLOW_SCHEDULER != "postgres":
+        # Backpressure: the send queue is full, so leave the rest on the wheel
+        # for another tick (the durable queue claims only `free` rows instead)
+        for step in batch[free:]:
+            flow_scheduler.schedule(step, flow_scheduler.tick)
+        send_queue.record_held_back(len(batch) - free)
+        logger.info("[Checkout Flow] Send queue full, held back %s due steps", len(batch) - free)
+        batch = batch[:free]
+    for step in batch:
+        flow_registry.started(step)
+        task = asyncio.create_task(run_flow_step(step))
+        running_steps.add(task)
+        task.add_done_callback(running_steps.discard)
@@ -0,0 +1,133 @@
+import logging
+from collections import OrderedDict
+from typing import Tuple
+from app.clock import clock
+from app.database.postgres_store import postgres_store
+from config import settings
+from config_flows.client_flows import RATE_LIMITS
+
+logger = logging.getLogger(__name__)
+
+
+class MemoryRateLimitBackend:
+    """Per-process window counters, evicting keys idle for longer than `idle_ttl` seconds"""
+
+    def __init__(self, idle_ttl: float):
+        self.idle_ttl = idle_ttl
+        # key -> [window_index, current_count, previous_count, last_seen], least recently seen first
+        self._counters: "OrderedDict[str, list]" = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._counters)
+
+    def _evict(self, now: float):
+        while self._counters:
+            key, counter = next(iter(self._counters.items()))
+            if now - counter[3] < self.idle_ttl:
+                break
+            del self._counters[key]
+
+    async def get_counts(self, key: str, window_index: int) -> Tuple[int, int]:
+        counter = self._counters.get(key)
+        if counter is None:
+            return 0, 0
+        return _roll(counter[0], counter[1], counter[2], window_index)
+
+    async def increment(self, key: str, window_index: int):
+        now = clock.time()
+        counter = self._counters.get(key)
+        if counter is None:
+            self._counters[key] = [window_index, 1, 0, now]
+        else:
+            current, previous = _roll(counter[0], counter[1], counter[2], window_index)
+            counter[0] = window_index
+            counter[1] = current + 1
+            counter[2] = previous
+            counter[3] = now
+            self._counters.move_to_end(key)
+        self._evict(now)
+
+
+class PostgresRateLimitBackend:
+    """Window counters in the rate_limits table, shared by every worker"""
+
+    def __init__(self, idle_ttl: float):
+        self.idle_ttl = idle_ttl
+        self._last_eviction = clock.time()
+
+    async def get_counts(self, key: str, window_index: int) -> Tuple[int, int]:
+        row = await postgres_store.get_rate_limit(key)
+        if row is None:
+            return 0, 0
+        return _roll(row["window_index"], row["current_count"], row["previous_count"], window_index)
+
+    async def increment(self, key: str, window_index: int):
+        await postgres_store.increment_rate_limit(key, window_index, self.idle_ttl)
+        now = clock.time()
+        if now - self._last_eviction >= self.idle_ttl:
+            self._last_eviction = now
+            await postgres_store.evict_rate_limits(self.idle_ttl)
+
+
+def _roll(stored_index: int, current: int, previous: int, window_index: int) -> Tuple[int, int]:
+    """Shift stored counters forward to `window_index`, returning (current, previous)"""
+    if stored_index == window_index:
+        return current, previous
+    if stored_index == window_index - 1:
+        return 0, current
+    return 0, 0
+
+
+class SlidingWindowRateLimiter:
+    """
+    Sliding-window counter limiter.
+
+    Keeps only the hit counts of the current and previous fixed windows per
+    key and weights the previous one by how much of it still overlaps the
+    sliding window, so every check is O(1) regardless of traffic.
+    """
+
+    def __init__(self, backend, limit: int, window: float):
+        self.backend = backend
+        self.limit = limit
+        self.window = window
+
+    async def is_limited(self, key: str) -> bool:
+        """Check whether another hit for `key` would exceed the limit"""
+        now = clock.time()
+        window_index = int(now // self.window)
+        current, previous = await self.backend.get_counts(key, window_index)
+        elapsed = (now % self.window) / self.window
+        return previous * (1 - elapsed) + current >= self.limit
+
+    async def hit(self, key: str):
+        """Record a hit for `key`"""
+        await self.backend.increment(key, int(clock.time() // self.window))
+
+
+def _create_limiter(limit: int, window: float) -> SlidingWindowRateLimiter:
+    # Counters older than two windows no longer contribute to the estimate
+    idle_ttl = 2 * window
+    if settings.RATE_LIMIT_BACKEND == "postgres":
+        backend = PostgresRateLimitBackend(idle_ttl)
+    else:
+        backend = MemoryRateLimitBackend(idle_ttl)
+    return SlidingWindowRateLimiter(backend, limit, window)
+
+
+def create_phone_rate_limiter() -> SlidingWindowRateLimiter:
+    """Build the per-phone message limiter from RATE_LIMITS and the configured backend"""
+    return _create_limiter(RATE_LIMITS["max_messages_per_phone_per_hour"], 3600)
+
+
+def create_global_rate_limiter() -> SlidingWindowRateLimiter:
+    """Build the account-wide daily message limiter from RATE_LIMITS and the configured backend"""
+    return _create_limiter(RATE_LIMITS["global_daily_limit"], 86400)
+
+
+# Key of the account-wide counter in global_rate_limiter
+GLOBAL_LIMIT_KEY = "global:daily"
+
+# Global instances
+phone_rate_limiter = create_phone_rate_limiter()
+global_rate_limiter = create_global_rate_limiter()
@@ -0,0 +1,165 @@
+import asyncio
+import logging
+import math
+from typing import Callable, Dict, List, Optional
+from app.clock import clock
+
+logger = logging.getLogger(__name__)
+
+
+class PendingStep:
+    """Compact record for a flow step waiting to be sent"""
+    __slots__ = ("email", "phone", "customer_name", "client_id", "step_index", "due_tick", "cancelled")
+
+    def __init__(self, email: str, phone: str, customer_name: Optional[str], client_id: str, step_index: int = 0):
+        self.email = email
+        self.phone = phone
+        self.customer_name = customer_name
+        self.client_id = client_id
+        self.step_index = step_index
+        self.due_tick = 0
+        self.cancelled = False
+
+
+class TimingWheel:
+    """
+    Hierarchical timing wheel for pending flow steps.
+
+    Level 0 has 2**8 slots of one tick each; every higher level has 2**6 slots,
+    each covering a full revolution of the level below. Scheduling and firing
+    are O(1) per step; entries in upper levels are cascaded down once per
+    revolution of the level beneath them.
+    """
+
+    LEVEL_BITS = (8, 6, 6, 6, 6)
+
+    def __init__(self, tick: float = 1.0):
+        self.tick = tick
+        self._shifts: List[int] = []
+        shift = 0
+        for bits in self.LEVEL_BITS:
+            self._shifts.append(shift)
+            shift += bits
+        self._max_delta = (1 << shift) - 1
+        self._levels: List[List[list]] = [[[] for _ in range(1 << bits)] for bits in self.LEVEL_BITS]
+        self._pending: Dict[str, PendingStep] = {}
+        # Pending steps per step index, kept up to date so scrapes don't walk _pending
+        self._step_counts: Dict[int, int] = {}
+        self._origin = clock.monotonic()
+        self._current = 0
+        self._task: Optional[asyncio.Task] = None
+
+    def __len__(self) -> int:
+        return len(self._pending)
+
+    def _place(self, step: PendingStep):
+        delta = step.due_tick - self._current
+        if delta < 0:
+            step.due_tick = self._current
+            delta = 0
+        for level, shift in enumerate(self._shifts):
+            bits = self.LEVEL_BITS[level]
+            if delta < (1 << (shift + bits)) or level == len(self._shifts) - 1:
+                index = (step.due_tick >> shift) & ((1 << bits) - 1)
+                self._levels[level][index].append(step)
+                return
+
+    def schedule(self, step: PendingStep, delay: float):
+        """Schedule a step to fire after `delay` seconds, replacing any pending step for the same email"""
+        previous = self._pending.get(step.email)
+        if previous is not None:
+            previous.cancelled = True
+            self._uncount(previous)
+        ticks = min(max(1, math.ceil(delay / self.tick)), self._max_delta)
+        step.due_tick = self._current + ticks
+        step.cancelled = False
+        self._pending[step.email] = step
+        self._step_counts[step.step_index] = self._step_counts.get(step.step_index, 0) + 1
+        self._place(step)
+
+    def _uncount(self, step: PendingStep):
+        count = self._step_counts[step.step_index] - 1
+        if count:
+            self._step_counts[step.step_index] = count
+        else:
+            del self._step_counts[step.step_index]
+
+    def pending_by_step(self) -> Dict[int, int]:
+        """Number of pending steps per step index"""
+        return dict(self._step_counts)
+
+    def cancel(self, email: str) -> bool:
+        """Cancel the pending step for an email, if any"""
+        step = self._pending.pop(email, None)
+        if step is None:
+            return False
+        step.cancelled = True
+        self._uncount(step)
+        return True
+
+    def _cascade(self, level: int):
+        index = (self._current >> self._shifts[level]) & ((1 << self.LEVEL_BITS[level]) - 1)
+        slot = self._levels[level][index]
+        if not slot:
+            return
+        self._levels[level][index] = []
+        for step in slot:
+            if not step.cancelled:
+                self._place(step)
+
+    def advance(self, now: Optional[float] = None) -> List[PendingStep]:
+        """Advance the wheel up to `now` (monotonic seconds) and return the steps that became due"""
+        if now is None:
+            now = clock.monotonic()
+        target = int((now - self._origin) / self.tick + 1e-9)
+        due: List[PendingStep] = []
+        level0_mask = (1 << self.LEVEL_BITS[0]) - 1
+        while self._current < target:
+            self._current += 1
+            # Cascade upper levels whenever the level below completes a revolution
+            for level in range(1, len(self._shifts)):
+                if self._current & ((1 << self._shifts[level]) - 1):
+                    break
+                self._cascade(level)
+            index = self._current & level0_mask
+            slot = self._levels[0][index]
+            if slot:
+                self._levels[0][index] = []
+                for step in slot:
+                    if not step.cancelled:
+                        del self._pending[step.email]
+                        self._uncount(step)
+                        due.append(step)
+        return due
+
+    async def _run(self, on_due: Callable[[List[PendingStep]], None]):
+        while True:
+            next_tick = self._origin + (self._current + 1) * self.tick
+            await clock.sleep(max(0.0, next_tick - clock.monotonic()))
+            try:
+                batch = self.advance()
+                if batch:
+                    on_due(batch)
+            except Exception as e:
+                logger.error("[Scheduler] Error firing due steps: %s", e)
+
+    def start(self, on_due: Callable[[List[PendingStep]], None]):
+        """Start the tick loop, handing each batch of due steps to `on_due`"""
+        if self._task is None:
+            self._task = asyncio.create_task(self._run(on_due))
+            logger.info("[Scheduler] Timing wheel started (tick=%ss)", self.tick)
+
+    async def stop(self):
+        """Stop the tick loop"""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+            logger.info("[Scheduler] Timing wheel stopped with %s pending steps", len(self._pending))
+
+
+# Global instance
+flow_scheduler = TimingWheel()
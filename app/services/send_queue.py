@@ -0,0 +1,248 @@
+import asyncio
+import heapq
+import itertools
+import logging
+import random
+from collections import deque
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+from app.clock import clock
+from app.services.whatsapp import send_whatsapp_template, is_retryable_send_error
+from app.metrics import metrics
+from config import settings
+
+logger = logging.getLogger(__name__)
+
+
+class TokenBucket:
+    """Messages-per-second governor; `acquire` waits until a token is available"""
+
+    def __init__(self, rate: float, burst: float):
+        self.rate = rate
+        self.burst = burst
+        self._tokens = burst
+        self._updated = clock.monotonic()
+
+    async def acquire(self):
+        while True:
+            now = clock.monotonic()
+            self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            if self._tokens >= 1:
+                self._tokens -= 1
+                return
+            await clock.sleep((1 - self._tokens) / self.rate)
+
+
+class SendJob:
+    """A queued send and the future its flow is waiting on"""
+    __slots__ = ("phone_id", "phone", "template", "parameters", "priority", "future", "queued_at",
+                 "attempts", "backoff")
+
+    def __init__(self, phone_id: str, phone: str, template: str, parameters: list, priority: int,
+                 future: asyncio.Future):
+        self.phone_id = phone_id
+        self.phone = phone
+        self.template = template
+        self.parameters = parameters
+        self.priority = priority
+        self.future = future
+        self.queued_at = clock.monotonic()
+        self.attempts = 0
+        self.backoff = 0.0
+
+
+class SendQueue:
+    """
+    Central outbound queue for WhatsApp sends.
+
+    Flows submit messages and await the result while a fixed pool of workers
+    drains the queue in priority order, each send first taking a token from
+    the bucket of its sending phone-number ID. Schedulers check `free_slots`
+    before releasing more due steps so bursts wait in the scheduler rather
+    than piling up here.
+
+    Retryable failures are parked in a retry heap with decorrelated-jitter
+    backoff (never sooner than an open circuit breaker allows) and fed back
+    into the queue by a single pump task, so nothing sleeps per message.
+    """
+
+    def __init__(self, send: Callable[..., Awaitable[Any]], workers: int, rate: float, burst: float,
+                 max_depth: int, retryable: Callable[[Exception], bool] = lambda e: False,
+                 max_attempts: int = 1, retry_base: float = 1.0, retry_cap: float = 60.0,
+                 latency_samples: int = 1000):
+        self.send = send
+        self.workers = workers
+        self.rate = rate
+        self.burst = burst
+        self.max_depth = max_depth
+        self.retryable = retryable
+        self.max_attempts = max_attempts
+        self.retry_base = retry_base
+        self.retry_cap = retry_cap
+        self._queue: asyncio.PriorityQueue = asyncio.PriorityQueue()
+        self._retries: List[tuple] = []
+        self._retry_added: Optional[asyncio.Event] = None
+        self._buckets: Dict[str, TokenBucket] = {}
+        self._seq = itertools.count()
+        self._tasks: List[asyncio.Task] = []
+        self._latencies: deque = deque(maxlen=latency_samples)
+        self.enqueued = 0
+        self.sent = 0
+        self.failed = 0
+        self.retried = 0
+        self.max_depth_seen = 0
+        self.held_back = 0
+
+    @property
+    def depth(self) -> int:
+        return self._queue.qsize()
+
+    @property
+    def retry_depth(self) -> int:
+        return len(self._retries)
+
+    def free_slots(self) -> int:
+        """How many more sends can be queued before the scheduler should hold back"""
+        return max(0, self.max_depth - self._queue.qsize())
+
+    def record_held_back(self, count: int):
+        """Count due steps a scheduler held back because the queue was full"""
+        self.held_back += count
+
+    def _bucket(self, phone_id: str) -> TokenBucket:
+        bucket = self._buckets.get(phone_id)
+        if bucket is None:
+            bucket = self._buckets[phone_id] = TokenBucket(self.rate, self.burst)
+        return bucket
+
+    def _put(self, job: SendJob):
+        self._queue.put_nowait((job.priority, next(self._seq), job))
+        self.max_depth_seen = max(self.max_depth_seen, self._queue.qsize())
+
+    async def submit(self, phone: str, template: str, parameters: list,
+                     priority: int = 0, phone_id: Optional[str] = None) -> Any:
+        """Queue a send (lower `priority` goes first) and wait for its result"""
+        future = asyncio.get_running_loop().create_future()
+        self._put(SendJob(phone_id or settings.WHATSAPP_PHONE_ID, phone, template, parameters, priority, future))
+        self.enqueued += 1
+        return await future
+
+    def _next_backoff(self, job: SendJob, error: Exception) -> float:
+        # Decorrelated jitter: sleep = min(cap, uniform(base, previous sleep * 3))
+        job.backoff = min(self.retry_cap, random.uniform(self.retry_base, max(self.retry_base, job.backoff * 3)))
+        return max(job.backoff, getattr(error, "retry_after", 0.0))
+
+    def _fail(self, job: SendJob, error: Exception):
+        if job.attempts < self.max_attempts and self.retryable(error):
+            delay = self._next_backoff(job, error)
+            heapq.heappush(self._retries, (clock.monotonic() + delay, next(self._seq), job))
+            self._retry_added.set()
+            self.retried += 1
+            logger.info("[Send Queue] Retrying send to %s in %.1fs (attempt %s)", job.phone, delay, job.attempts)
+            return
+        self.failed += 1
+        if not job.future.done():
+            job.future.set_exception(error)
+
+    async def _worker(self):
+        while True:
+            _, _, job = await self._queue.get()
+            try:
+                if job.future.done():
+                    continue
+                await self._bucket(job.phone_id).acquire()
+                job.attempts += 1
+                try:
+                    result = await self.send(job.phone, job.template, job.parameters)
+                except Exception as e:
+                    self._fail(job, e)
+                    continue
+                self.sent += 1
+                if not job.future.done():
+                    job.future.set_result(result)
+                self._latencies.append(clock.monotonic() - job.queued_at)
+            finally:
+                self._queue.task_done()
+
+    async def _pump_retries(self):
+        while True:
+            timeout = None
+            if self._retries:
+                timeout = max(0.0, self._retries[0][0] - clock.monotonic())
+            await clock.wait(self._retry_added, timeout)
+            self._retry_added.clear()
+            now = clock.monotonic()
+            while self._retries and self._retries[0][0] <= now:
+                _, _, job = heapq.heappop(self._retries)
+                self._put(job)
+
+    def start(self):
+        """Start the worker pool and retry pump"""
+        if not self._tasks:
+            self._retry_added = asyncio.Event()
+            self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+            self._tasks.append(asyncio.create_task(self._pump_retries()))
+            logger.info("[Send Queue] Started %s workers at %s msgs/s per phone number", self.workers, self.rate)
+
+    async def stop(self):
+        """Stop the workers; sends still queued or awaiting retry are not attempted"""
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        if self._tasks:
+            logger.info("[Send Queue] Stopped with %s sends queued and %s awaiting retry", self._queue.qsize(), len(self._retries))
+        self._tasks = []
+
+    def stats(self) -> dict:
+        latencies = sorted(self._latencies)
+
+        def percentile(p: float) -> Optional[float]:
+            if not latencies:
+                return None
+            return round(latencies[min(len(latencies) - 1, int(p * len(latencies)))], 4)
+
+        return {
+            "depth": self._queue.qsize(),
+            "retry_depth": self.retry_depth,
+            "max_depth_seen": self.max_depth_seen,
+            "max_depth": self.max_depth,
+            "workers": self.workers,
+            "rate_per_phone_id": self.rate,
+            "enqueued": self.enqueued,
+            "sent": self.sent,
+            "failed": self.failed,
+            "retried": self.retried,
+            "held_back": self.held_back,
+            "latency_p50": percentile(0.5),
+            "latency_p95": percentile(0.95),
+            "latency_p99": percentile(0.99),
+        }
+
+
+def step_priority(step_index: int, step_count: int) -> int:
+    """Queue priority for a flow step per SEND_QUEUE_PRIORITY ("final" or "first" reminders go first)"""
+    if settings.SEND_QUEUE_PRIORITY == "first":
+        return step_index
+    return step_count - 1 - step_index
+
+
+# Global instance
+send_queue = SendQueue(
+    send_whatsapp_template,
+    workers=settings.SEND_QUEUE_WORKERS,
+    rate=settings.SEND_RATE_PER_SECOND,
+    burst=settings.SEND_RATE_BURST,
+    max_depth=settings.SEND_QUEUE_MAX_DEPTH,
+    retryable=is_retryable_send_error,
+    max_attempts=settings.SEND_RETRY_MAX_ATTEMPTS,
+    retry_base=settings.SEND_RETRY_BASE_DELAY,
+    retry_cap=settings.SEND_RETRY_MAX_DELAY
+)
+
+metrics.gauge("send_queue_depth", "Sends waiting in the outbound queue", ("queue",), collect=lambda: {
+    ("ready",): send_queue.depth, ("retry",): send_queue.retry_depth
+})
+metrics.counter("send_queue_events_total", "Outbound queue events since start", ("event",), collect=lambda: {
+    ("enqueued",): send_queue.enqueued, ("sent",): send_queue.sent, ("failed",): send_queue.failed,
+    ("retried",): send_queue.retried, ("held_back",): send_queue.held_back
+})
@@ -1,43 +1,108 @@
 import httpx
 import logging
-import asyncio
-from datetime import datetime, timedelta
-from typing import Dict
+import time
+from typing import Optional
+from app.clock import clock
+from app.services.circuit_breaker import CircuitOpenError, circuit_breakers
+from app.metrics import whatsapp_sends, whatsapp_send_duration
+from app.services.rate_limiter import phone_rate_limiter, global_rate_limiter, GLOBAL_LIMIT_KEY
 from config import settings
 
 logger = logging.getLogger(__name__)
 
-# Rate limiting storage (in production, use Redis)
-rate_limit_store: Dict[str, list] = {}
-RATE_LIMIT_WINDOW = 3600  # 1 hour in seconds
-MAX_MESSAGES_PER_HOUR = 10  # Max messages per phone number per hour
+# Per-message send logs are sampled under this category (see LOG_SAMPLE_RATES)
+SEND_LOG = {"category": "send"}
 
 async def is_rate_limited(phone: str) -> bool:
     """Check if phone number is rate limited"""
-    now = datetime.now()
-    cutoff_time = now - timedelta(seconds=RATE_LIMIT_WINDOW)
-    
-    if phone not in rate_limit_store:
-        rate_limit_store[phone] = []
-    
-    # Remove old entries
-    rate_limit_store[phone] = [
-        timestamp for timestamp in rate_limit_store[phone] 
-        if timestamp > cutoff_time
-    ]
-    
-    # Check if limit exceeded
-    if len(rate_limit_store[phone]) >= MAX_MESSAGES_PER_HOUR:
-        logger.warning(f"[WhatsApp] Rate limit exceeded for {phone}")
+    if await phone_rate_limiter.is_limited(phone):
+        logger.warning("[WhatsApp] Rate limit exceeded for %s", phone)
+        return True
+    return False
+
+async def is_global_limit_reached() -> bool:
+    """Check the account-wide daily message limit"""
+    if await global_rate_limiter.is_limited(GLOBAL_LIMIT_KEY):
+        logger.warning("[WhatsApp] Global daily limit of %s messages reached", global_rate_limiter.limit)
         return True
-    
     return False
 
 async def record_message_sent(phone: str):
     """Record that a message was sent"""
-    if phone not in rate_limit_store:
-        rate_limit_store[phone] = []
-    rate_limit_store[phone].append(datetime.now())
+    await phone_rate_limiter.hit(phone)
+    await global_rate_limiter.hit(GLOBAL_LIMIT_KEY)
+
+class WhatsAppSender:
+    """Shared Graph API client with pooled keep-alive (and HTTP/2 where the server supports it) connections"""
+
+    def __init__(self, base_url: str, token: str, phone_id: str, http2: bool = True,
+                 max_connections: int = 100, max_keepalive: int = 20, timeout: float = 10.0):
+        self.base_url = base_url.rstrip("/")
+        self.token = token
+        self.phone_id = phone_id
+        self.http2 = http2
+        self.max_connections = max_connections
+        self.max_keepalive = max_keepalive
+        self.timeout = timeout
+        self.client: Optional[httpx.AsyncClient] = None
+
+    async def start(self):
+        """Open the shared client"""
+        if self.client is None:
+            self.client = httpx.AsyncClient(
+                base_url=self.base_url,
+                http2=self.http2,
+                limits=httpx.Limits(
+                    max_connections=self.max_connections,
+                    max_keepalive_connections=self.max_keepalive
+                ),
+                timeout=httpx.Timeout(self.timeout, connect=min(self.timeout, 5.0)),
+                headers={"Authorization": f"Bearer {self.token}"}
+            )
+            logger.info("[WhatsApp] Sender client opened for %s", self.base_url)
+
+    async def send_template(self, phone: str, template: str, parameters: list) -> dict:
+        """Post a template message over the shared client"""
+        if self.client is None:
+            raise RuntimeError("WhatsApp sender is not started")
+        body = {
+            "messaging_product": "whatsapp",
+            "to": phone,
+            "type": "template",
+            "template": {
+                "name": template,
+                "language": { "code": "en_US" },
+                "components": [
+                    {
+                        "type": "body",
+                        "parameters": [
+                            {"type": "text", "text": str(val)} for val in parameters
+                        ]
+                    }
+                ]
+            }
+        }
+        response = await self.client.post(f"/{self.phone_id}/messages", json=body)
+        response.raise_for_status()
+        return response.json()
+
+    async def close(self):
+        """Close the shared client and its connections"""
+        if self.client is not None:
+            await self.client.aclose()
+            self.client = None
+            logger.info("[WhatsApp] Sender client closed")
+
+# Global instance
+whatsapp_sender = WhatsAppSender(
+    settings.WHATSAPP_API_BASE_URL,
+    settings.WHATSAPP_TOKEN,
+    settings.WHATSAPP_PHONE_ID,
+    http2=settings.WHATSAPP_HTTP2,
+    max_connections=settings.WHATSAPP_MAX_CONNECTIONS,
+    max_keepalive=settings.WHATSAPP_MAX_KEEPALIVE,
+    timeout=settings.WHATSAPP_TIMEOUT
+)
 
 async def send_whatsapp_template(phone: str, template: str, parameters: list):
     """
@@ -45,71 +110,56 @@ async def send_whatsapp_template(phone: str, template: str, parameters: list):
     """
     # Check rate limit first
     if await is_rate_limited(phone):
-        logger.error(f"[WhatsApp] Message blocked due to rate limit: {phone}")
+        logger.error("[WhatsApp] Message blocked due to rate limit: %s", phone)
+        whatsapp_sends.inc("rate_limited")
         raise Exception(f"Rate limit exceeded for {phone}")
+    if await is_global_limit_reached():
+        whatsapp_sends.inc("global_limited")
+        raise Exception("Global daily rate limit exceeded")
     
-    # TESTING MODE: Comment out actual WhatsApp sending
-    print(f"📱 [TESTING] Would send WhatsApp to {phone}")
-    print(f"   Template: {template}")
-    print(f"   Parameters: {parameters}")
-    print(f"   Time: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
-    
+    if settings.WHATSAPP_DRY_RUN:
+        # Record successful send
+        await record_message_sent(phone)
+        logger.info("[WhatsApp] TEST MODE - Would send template '%s' to %s with %s", template, phone, parameters,
+                    extra=SEND_LOG)
+        whatsapp_sends.inc("dry_run")
+        return {"message_id": f"test_msg_{clock.time()}", "status": "sent"}
+
+    # A single attempt; the send queue retries failures that is_retryable_send_error accepts
+    breaker = circuit_breakers.get(whatsapp_sender.base_url)
+    try:
+        breaker.before_call()
+    except CircuitOpenError:
+        whatsapp_sends.inc("circuit_open")
+        raise
+    started = time.perf_counter()
+    try:
+        result = await whatsapp_sender.send_template(phone, template, parameters)
+    except Exception as e:
+        whatsapp_send_duration.observe(time.perf_counter() - started, "failed")
+        whatsapp_sends.inc("failed")
+        if _is_upstream_failure(e):
+            breaker.record_failure()
+        else:
+            breaker.record_success()
+        detail = e.response.text if isinstance(e, httpx.HTTPStatusError) else str(e)
+        logger.error("[WhatsApp] Failed to send to %s: %s", phone, detail)
+        raise
+    whatsapp_send_duration.observe(time.perf_counter() - started, "sent")
+    whatsapp_sends.inc("sent")
+    breaker.record_success()
+
     # Record successful send
     await record_message_sent(phone)
-    logger.info(f"[WhatsApp] TEST MODE - Would send template '{template}' to {phone}")
-    return {"message_id": f"test_msg_{datetime.now().timestamp()}", "status": "sent"}
-    
-    # COMMENTED OUT FOR TESTING - UNCOMMENT FOR PRODUCTION
-    # url = f"https://graph.facebook.com/v18.0/{settings.WHATSAPP_PHONE_ID}/messages"
-
-    # headers = {
-    #     "Authorization": f"Bearer {settings.WHATSAPP_TOKEN}",
-    #     "Content-Type": "application/json"
-    # }
-
-    # body = {
-    #     "messaging_product": "whatsapp",
-    #     "to": phone,
-    #     "type": "template",
-    #     "template": {
-    #         "name": template,
-    #         "language": { "code": "en_US" },
-    #         "components": [
-    #             {
-    #                 "type": "body",
-    #                 "parameters": [
-    #                     {"type": "text", "text": str(val)} for val in parameters
-    #                 ]
-    #             }
-    #         ]
-    #     }
-    # }
-
-    # max_retries = 3
-    # retry_count = 0
-    
-    # while retry_count < max_retries:
-    #     try:
-    #         async with httpx.AsyncClient() as client:
-    #             response = await client.post(url, headers=headers, json=body)
-    #             response.raise_for_status()
-                
-    #             # Record successful send
-    #             await record_message_sent(phone)
-    #             logger.info(f"[WhatsApp] Sent template '{template}' to {phone}")
-    #             return response.json()
-                
-    #     except httpx.HTTPStatusError as e:
-    #         retry_count += 1
-    #         logger.error(f"[WhatsApp] Attempt {retry_count} failed to send to {phone}: {e.response.text}")
-    #         if retry_count >= max_retries:
-    #             logger.error(f"[WhatsApp] Max retries reached for {phone}")
-    #             raise
-    #         await asyncio.sleep(2 ** retry_count)  # Exponential backoff
-    #     except Exception as e:
-    #         retry_count += 1
-    #         logger.error(f"[WhatsApp] Attempt {retry_count} failed with error: {str(e)}")
-    #         if retry_count >= max_retries:
-    #             logger.error(f"[WhatsApp] Max retries reached for {phone}")
-    #             raise
-    #         await asyncio.sleep(2 ** retry_count)
+    logger.info("[WhatsApp] Sent template '%s' to %s", template, phone, extra=SEND_LOG)
+    return result
+
+def _is_upstream_failure(error: Exception) -> bool:
+    """Whether an error means the Graph API itself is unhealthy (as opposed to a bad request)"""
+    if isinstance(error, httpx.HTTPStatusError):
+        return error.response.status_code == 429 or error.response.status_code >= 500
+    return isinstance(error, httpx.TransportError)
+
+def is_retryable_send_error(error: Exception) -> bool:
+    """Whether a failed send may succeed if tried again later"""
+    return isinstance(error, CircuitOpenError) or _is_upstream_failure(error)
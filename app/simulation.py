@@ -0,0 +1,343 @@
+"""
+Replay a day of webhook traffic through the real flow code on a virtual clock.
+
+Checkouts go through handle_checkout_flow and orders through
+update_checkout_status exactly as the webhooks would, and due steps are sent
+by the timing wheel and the real send queue (token buckets, priorities,
+backpressure, retries) with WHATSAPP_DRY_RUN on. Everything that waits runs on
+a VirtualClock that jumps straight to the next wakeup once every task is
+waiting, so a day of production delays replays in seconds. Postgres is
+replaced by an in-memory store, so nothing is written or sent. Prints a JSON
+report of admissions, blocks, sends per template, cancellations, the send
+queue's stats and the peak send rate. Run from the repository root:
+
+    python -m app.simulation [--checkouts 20000] [--conversion 0.3] [--seed 1]
+    python -m app.simulation --events day.ndjson [--plans plans.json]
+
+An events file has one {"at": ..., "topic": ..., "payload": {...}} object per
+line, with "at" in seconds from the start of the replay or an ISO timestamp,
+"topic" checkouts/create or orders/create, and an optional "shop_domain".
+"""
+import argparse
+import asyncio
+import json
+import logging
+import random
+import sys
+import time
+from collections import Counter
+from datetime import datetime
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+from app.api.parsing import extract_checkout, extract_order_email
+from app.clock import VirtualClock, clock
+from app.database.postgres_store import postgres_store
+from app.services import rate_limiter
+from app.services.flow_plans import flow_plans
+from app.services.flow_registry import flow_registry
+from app.services.handlers import dispatch_due_steps, handle_checkout_flow, running_steps
+from app.services.scheduler import flow_scheduler
+from app.services.send_queue import send_queue
+from app.state.store import update_checkout_status
+from config import settings
+from config_flows.client_flows import FLOW_CONFIG
+
+logger = logging.getLogger(__name__)
+
+DAY = 86400
+
+
+class SimulatedStore:
+    """
+    In-memory stand-in for the PostgresStore calls a flow makes, with the same
+    admission rules as the admit_flow query. Times come from the shared clock,
+    so the duplicate and per-phone windows follow the virtual time.
+    """
+
+    # PostgresStore methods a flow calls, replaced on the shared instance
+    METHODS = ("admit_flow", "set_flow", "get_flow", "update_status", "update_step_status", "cancel_steps")
+
+    def __init__(self):
+        self.flows: Dict[str, Dict[str, Any]] = {}
+        # phone -> emails whose flow was stored with that phone
+        self._by_phone: Dict[str, set] = {}
+        self.admissions: Counter = Counter()
+        self.completed = 0
+
+    async def admit_flow(self, email: str, phone: str, recent_hours: int,
+                         phone_hours: int, phone_limit: int) -> str:
+        now = clock.time()
+        flow = self.flows.get(email)
+        if flow is not None and flow["created_at"] > now - recent_hours * 3600:
+            outcome = "duplicate"
+        else:
+            since = now - phone_hours * 3600
+            phone_flows = sum(
+                1 for other in self._by_phone.get(phone, ())
+                if self.flows[other]["created_at"] > since and self.flows[other]["status"] != "blocked"
+            )
+            outcome = "phone_limit" if phone_flows >= phone_limit else "allowed"
+        self.admissions[outcome] += 1
+        return outcome
+
+    async def set_flow(self, email: str, data: Dict[str, Any]):
+        flow = self.flows.get(email)
+        if flow is None:
+            flow = self.flows[email] = {}
+        elif flow["customer_phone"] != data.get("customer_phone"):
+            self._by_phone[flow["customer_phone"]].discard(email)
+        flow.update(
+            created_at=clock.time(),
+            status=data["status"],
+            step_status=dict(data.get("step_status", {})),
+            customer_name=data.get("customer_name"),
+            customer_phone=data.get("customer_phone"),
+            client_id=data.get("client_id", settings.DEFAULT_CLIENT_ID),
+        )
+        self._by_phone.setdefault(flow["customer_phone"], set()).add(email)
+
+    async def get_flow(self, email: str) -> Optional[Dict[str, Any]]:
+        flow = self.flows.get(email)
+        return dict(flow, step_status=dict(flow["step_status"])) if flow else None
+
+    async def update_status(self, email: str, status: str):
+        flow = self.flows.get(email)
+        if flow is None:
+            return
+        if status == "completed" and flow["status"] != "completed":
+            self.completed += 1
+        flow["status"] = status
+
+    async def update_step_status(self, email: str, step: str, status: str, client_id: str = settings.DEFAULT_CLIENT_ID):
+        flow = self.flows.get(email)
+        if flow is not None:
+            flow["step_status"][step] = status
+
+    async def cancel_steps(self, email: str):
+        pass
+
+
+class SendRecorder:
+    """Wraps the send queue's send function to tally outcomes per template and sends per second"""
+
+    def __init__(self, send: Callable[..., Awaitable[Any]]):
+        self.send = send
+        # (template, outcome) -> count
+        self.outcomes: Counter = Counter()
+        self.per_second: Counter = Counter()
+
+    async def __call__(self, phone: str, template: str, parameters: list) -> Any:
+        try:
+            result = await self.send(phone, template, parameters)
+        except Exception as e:
+            message = str(e).lower()
+            if "global" in message:
+                outcome = "global_limited"
+            elif "rate limit" in message:
+                outcome = "rate_limited"
+            else:
+                outcome = "failed"
+            self.outcomes[(template, outcome)] += 1
+            raise
+        self.outcomes[(template, "sent")] += 1
+        self.per_second[int(clock.time())] += 1
+        return result
+
+
+def _install(sim_store: SimulatedStore, virtual_clock: VirtualClock) -> SendRecorder:
+    """
+    Run the flow code on the virtual clock against the simulated store. Every
+    module shares the one PostgresStore instance, so its methods are replaced
+    there; the send queue is the real one, sending in dry-run mode through a
+    recorder. Meant for a process that runs nothing but the simulation.
+    """
+    clock.use(virtual_clock)
+    settings.WHATSAPP_DRY_RUN = True
+    settings.FLOW_SCHEDULER = "memory"
+    for name in SimulatedStore.METHODS:
+        setattr(postgres_store, name, getattr(sim_store, name))
+    for limiter in (rate_limiter.phone_rate_limiter, rate_limiter.global_rate_limiter):
+        limiter.backend = rate_limiter.MemoryRateLimitBackend(limiter.backend.idle_ttl)
+    recorder = send_queue.send = SendRecorder(send_queue.send)
+    return recorder
+
+
+async def _settle():
+    """Yield until every other task is waiting, on the virtual clock or on each other"""
+    loop = asyncio.get_running_loop()
+    while True:
+        await asyncio.sleep(0)
+        # Callbacks due on the next loop iteration; empty once nothing can run
+        # until the clock moves (the simulation does no I/O)
+        if not getattr(loop, "_ready", None):
+            return
+
+
+def synthetic_day(checkouts: int, customers: int, phones: int, conversion: float,
+                  order_delay: float, seed: int) -> List[Dict[str, Any]]:
+    """Checkouts spread over a day with a share of them followed by an order, sorted by time"""
+    rng = random.Random(seed)
+    events = []
+    for _ in range(checkouts):
+        customer = rng.randrange(customers)
+        email = f"sim-{customer}@example.com"
+        at = rng.uniform(0, DAY)
+        events.append({"at": at, "topic": "checkouts/create", "payload": {
+            "email": email,
+            "customer": {"first_name": "Sim", "last_name": str(customer), "phone": f"+91{9000000000 + customer % phones}"},
+            "line_items": [{"title": "Handloom Kurta", "quantity": 1, "price": "1299.00"}],
+        }})
+        if rng.random() < conversion:
+            events.append({"at": at + rng.expovariate(1 / order_delay), "topic": "orders/create",
+                           "payload": {"email": email}})
+    events.sort(key=lambda event: event["at"])
+    return events
+
+
+def read_events(path: str) -> List[Dict[str, Any]]:
+    """Events from an NDJSON file, with ISO "at" timestamps turned into seconds from the first event"""
+    with open(path) as f:
+        events = [json.loads(line) for line in f if line.strip()]
+    start = None
+    for event in events:
+        if isinstance(event["at"], str):
+            at = datetime.fromisoformat(event["at"].replace("Z", "+00:00")).timestamp()
+            start = at if start is None else min(start, at)
+            event["at"] = at
+    if start is not None:
+        for event in events:
+            event["at"] -= start
+    events.sort(key=lambda event: event["at"])
+    return events
+
+
+class Simulation:
+    """
+    Drives the virtual clock: once every task is waiting it jumps to the next
+    wakeup (a wheel tick, a token bucket refill, a retry), stopping at each
+    event's time to apply it.
+    """
+
+    def __init__(self, virtual_clock: VirtualClock, sim_store: SimulatedStore, recorder: SendRecorder):
+        self.clock = virtual_clock
+        self.store = sim_store
+        self.recorder = recorder
+        self.counts: Counter = Counter()
+
+    async def run_until(self, at: float):
+        """Advance virtual time to `at` seconds, running everything due on the way"""
+        while True:
+            await _settle()
+            deadline = self.clock.next_deadline()
+            if deadline is None or deadline > at:
+                break
+            self.clock.advance(deadline - self.clock.elapsed)
+        if at > self.clock.elapsed:
+            self.clock.advance(at - self.clock.elapsed)
+            await _settle()
+
+    async def drain(self):
+        """Run until no step is pending, being sent or waiting in the send queue"""
+        while len(flow_scheduler) or running_steps or send_queue.depth or send_queue.retry_depth:
+            await self.run_until(self.clock.elapsed + flow_scheduler.tick)
+
+    async def apply(self, event: Dict[str, Any]):
+        topic = event["topic"]
+        payload = event["payload"]
+        self.counts[topic] += 1
+        if topic == "orders/create":
+            email = extract_order_email(payload)
+            if email:
+                await update_checkout_status(email, "completed")
+            return
+        checkout = extract_checkout(payload)
+        shop_domain = event.get("shop_domain")
+        client_id = flow_plans.client_for_shop(shop_domain) if shop_domain else settings.DEFAULT_CLIENT_ID
+        if client_id is None or not checkout.customer_email or not checkout.customer_phone:
+            self.counts["checkouts_skipped"] += 1
+            return
+        admissions = sum(self.store.admissions.values())
+        await handle_checkout_flow(checkout, client_id)
+        if sum(self.store.admissions.values()) == admissions:
+            # Never reached the admission query: caught by the recently-admitted prefilter
+            self.counts["checkouts_prefiltered"] += 1
+
+    def report(self, wall_seconds: float) -> Dict[str, Any]:
+        sends: Dict[str, Dict[str, int]] = {}
+        for (template, outcome), count in sorted(self.recorder.outcomes.items()):
+            sends.setdefault(template, {})[outcome] = count
+        per_minute = Counter()
+        for second, count in self.recorder.per_second.items():
+            per_minute[second // 60] += count
+        return {
+            "simulated_seconds": round(self.clock.elapsed, 1),
+            "wall_seconds": round(wall_seconds, 3),
+            "checkouts": self.counts["checkouts/create"],
+            "orders": self.counts["orders/create"],
+            "flows_started": self.store.admissions["allowed"],
+            "blocked": {
+                "duplicate_prefilter": self.counts["checkouts_prefiltered"],
+                "duplicate": self.store.admissions["duplicate"],
+                "phone_limit": self.store.admissions["phone_limit"],
+                "missing_contact": self.counts["checkouts_skipped"],
+            },
+            "flows_completed": self.store.completed,
+            "flows_cancelled": flow_registry.cancelled,
+            "sends": sends,
+            "peak_sends_per_second": max(self.recorder.per_second.values(), default=0),
+            "peak_sends_per_minute": max(per_minute.values(), default=0),
+            "send_queue": send_queue.stats(),
+        }
+
+
+async def simulate(events: List[Dict[str, Any]], definitions: Dict[str, Dict[str, Any]]) -> Dict[str, Any]:
+    """Replay `events` against the flow `definitions` and return the report"""
+    virtual_clock = VirtualClock()
+    sim_store = SimulatedStore()
+    recorder = _install(sim_store, virtual_clock)
+    flow_plans.load(definitions)
+
+    simulation = Simulation(virtual_clock, sim_store, recorder)
+    started = time.perf_counter()
+    send_queue.start()
+    flow_scheduler.start(dispatch_due_steps)
+    try:
+        for event in events:
+            await simulation.run_until(event["at"])
+            await simulation.apply(event)
+        await simulation.drain()
+    finally:
+        await flow_scheduler.stop()
+        await send_queue.stop()
+    return simulation.report(time.perf_counter() - started)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--events", help="NDJSON events to replay instead of a synthetic day")
+    parser.add_argument("--plans", help="JSON flow definitions to use instead of FLOW_CONFIG")
+    parser.add_argument("--checkouts", type=int, default=20000)
+    parser.add_argument("--customers", type=int, help="distinct emails (default 80%% of --checkouts)")
+    parser.add_argument("--phones", type=int, help="distinct phones (default one per customer)")
+    parser.add_argument("--conversion", type=float, default=0.3, help="share of checkouts followed by an order")
+    parser.add_argument("--order-delay", type=float, default=1800, help="mean seconds from checkout to order")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--log-level", default="CRITICAL", help="flow logs are off unless raised, e.g. INFO")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=args.log_level, stream=sys.stderr)
+    if args.events:
+        events = read_events(args.events)
+    else:
+        customers = args.customers or max(1, int(args.checkouts * 0.8))
+        events = synthetic_day(args.checkouts, customers, args.phones or customers,
+                               args.conversion, args.order_delay, args.seed)
+    definitions = FLOW_CONFIG
+    if args.plans:
+        with open(args.plans) as f:
+            definitions = json.load(f)
+    print(json.dumps(asyncio.run(simulate(events, definitions)), indent=2))
+
+
+if __name__ == "__main__":
+    main()
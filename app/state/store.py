@@ -1,44 +1,195 @@
+from app.clock import clock
 from app.database.postgres_store import postgres_store
+from app.services.flow_registry import flow_registry
+from collections import OrderedDict
+from typing import Optional
+import asyncio
+from config import settings
+from config_flows.client_flows import RATE_LIMITS
 import logging
 
 logger = logging.getLogger(__name__)
 
+class FlowCache:
+    """Size- and TTL-bounded LRU cache of checkout flows"""
+
+    def __init__(self, max_size: int, ttl: float):
+        self.max_size = max_size
+        self.ttl = ttl
+        # email -> (expires_at, flow), least recently used first
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def peek(self, email: str) -> Optional[dict]:
+        """Return a live cached flow without touching recency or counters"""
+        entry = self._entries.get(email)
+        if entry is None or entry[0] < clock.monotonic():
+            return None
+        return entry[1]
+
+    def get(self, email: str) -> Optional[dict]:
+        entry = self._entries.get(email)
+        if entry is None:
+            self.misses += 1
+            return None
+        if entry[0] < clock.monotonic():
+            del self._entries[email]
+            self.evictions += 1
+            self.misses += 1
+            return None
+        self._entries.move_to_end(email)
+        self.hits += 1
+        return entry[1]
+
+    def set(self, email: str, flow: dict):
+        self._entries[email] = (clock.monotonic() + self.ttl, flow)
+        self._entries.move_to_end(email)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def invalidate(self, email: str):
+        if self._entries.pop(email, None) is not None:
+            self.invalidations += 1
+
+    def clear(self):
+        self._entries.clear()
+
+    def stats(self) -> dict:
+        return {
+            "size": len(self._entries),
+            "max_size": self.max_size,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "invalidations": self.invalidations
+        }
+
+class TTLSet:
+    """Bounded set of keys that each expire `ttl` seconds after being added"""
+
+    def __init__(self, ttl: float, max_size: int):
+        self.ttl = ttl
+        self.max_size = max_size
+        # key -> expires_at; with a fixed TTL insertion order is expiry order
+        self._expiry: "OrderedDict[str, float]" = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._expiry)
+
+    def _expire(self, now: float):
+        while self._expiry:
+            key, expires_at = next(iter(self._expiry.items()))
+            if expires_at > now and len(self._expiry) <= self.max_size:
+                break
+            del self._expiry[key]
+
+    def __contains__(self, key: str) -> bool:
+        expires_at = self._expiry.get(key)
+        return expires_at is not None and expires_at > clock.monotonic()
+
+    def add(self, key: str):
+        now = clock.monotonic()
+        self._expiry.pop(key, None)
+        self._expiry[key] = now + self.ttl
+        self._expire(now)
+
+    def discard(self, key: str):
+        self._expiry.pop(key, None)
+
+    def clear(self):
+        self._expiry.clear()
+
 # Keep in-memory cache for frequently accessed data
-checkout_flows = {}
+checkout_flows = FlowCache(settings.FLOW_CACHE_MAX_SIZE, settings.FLOW_CACHE_TTL)
+
+# Emails this worker started a flow for within the duplicate window; lets obvious
+# duplicates skip the admission query (misses still go to the database)
+recent_admissions = TTLSet(
+    RATE_LIMITS["min_hours_between_flows"] * 3600,
+    settings.ADMISSION_PREFILTER_MAX_SIZE
+)
+
+def _on_flow_changed(email: str, status: str):
+    """Drop flows written by another worker so the next read sees the new state"""
+    checkout_flows.invalidate(email)
+    if status == "completed":
+        flow_registry.cancel(email)
+
+def _on_listener_reset():
+    """Invalidations may have been missed while disconnected"""
+    logger.warning("[Cache] Flow change listener reset, clearing flow cache")
+    checkout_flows.clear()
 
 async def init_database():
     """Initialize database connection"""
     await postgres_store.init_pool()
+    await postgres_store.start_listener(_on_flow_changed, _on_listener_reset)
 
 async def set_checkout_flow(email: str, data: dict):
     """Set checkout flow in both cache and database"""
-    checkout_flows[email] = data
+    checkout_flows.set(email, data)
     await postgres_store.set_flow(email, data)
 
 async def get_checkout_flow(email: str) -> dict:
     """Get checkout flow from cache or database"""
-    if email not in checkout_flows:
+    flow_data = checkout_flows.get(email)
+    if flow_data is None:
         # Load from database if not in cache
         flow_data = await postgres_store.get_flow(email)
         if flow_data:
-            checkout_flows[email] = flow_data
-        return flow_data
-    return checkout_flows.get(email, {})
+            checkout_flows.set(email, flow_data)
+    return flow_data
 
 async def update_checkout_status(email: str, status: str):
     """Update checkout status in both cache and database"""
-    if email in checkout_flows:
-        checkout_flows[email]["status"] = status
+    flow_data = checkout_flows.peek(email)
+    if flow_data is not None:
+        flow_data["status"] = status
+    if status == "completed":
+        # Stop the flow's timer now instead of waiting for its next step to notice
+        await flow_registry.cancel_everywhere(email)
     await postgres_store.update_status(email, status)
 
-async def update_step_status(email: str, step: str, status: str):
+async def update_step_status(email: str, step: str, status: str, client_id: str = settings.DEFAULT_CLIENT_ID):
     """Update step status in both cache and database"""
-    if email in checkout_flows and "step_status" in checkout_flows[email]:
-        checkout_flows[email]["step_status"][step] = status
-    await postgres_store.update_step_status(email, step, status)
-
-async def cleanup_old_flows(days: int = 30):
-    """Clean up old flows"""
-    await postgres_store.cleanup_old_flows(days)
-    # Clear cache
-    checkout_flows.clear()
\ No newline at end of file
+    flow_data = checkout_flows.peek(email)
+    if flow_data is not None and "step_status" in flow_data:
+        flow_data["step_status"][step] = status
+    await postgres_store.update_step_status(email, step, status, client_id)
+
+def _evict_deleted_flows(emails):
+    for email in emails:
+        checkout_flows.invalidate(email)
+
+async def cleanup_old_flows(days: int = 30) -> int:
+    """Clean up old flows, evicting only the deleted emails from the cache"""
+    return await postgres_store.cleanup_old_flows(
+        days,
+        batch_size=settings.RETENTION_BATCH_SIZE,
+        pause=settings.RETENTION_BATCH_PAUSE,
+        on_deleted=_evict_deleted_flows
+    )
+
+async def run_retention(days: int, interval: float):
+    """Run the retention cleanup, and evict expired webhook receipts, every `interval` seconds"""
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            await cleanup_old_flows(days)
+        except Exception as e:
+            logger.error("[Retention] Cleanup failed: %s", e)
+        try:
+            await postgres_store.evict_webhook_receipts(
+                settings.WEBHOOK_DEDUP_TTL,
+                batch_size=settings.RETENTION_BATCH_SIZE,
+                pause=settings.RETENTION_BATCH_PAUSE
+            )
+        except Exception as e:
+            logger.error("[Retention] Webhook receipt eviction failed: %s", e)
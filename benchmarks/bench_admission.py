@@ -0,0 +1,95 @@
+"""
+Admission check benchmark over a large checkout_flows table.
+
+Seeds a few million synthetic flows (bench- email prefix) spread over the
+last week, then times the previous two-query check against the single
+admit_flow statement, with and without the (customer_phone, created_at)
+index. Needs DATABASE_URL (and the other settings) in the environment or
+.env; seeded rows are deleted afterwards. Run from the repository root:
+
+    python -m benchmarks.bench_admission [--rows 3000000] [--checks 2000]
+"""
+import argparse
+import asyncio
+import random
+import statistics
+import time
+
+from app.database.postgres_store import postgres_store
+
+PHONE_INDEX = "idx_checkout_flows_phone_created_at"
+
+
+async def _seed(rows: int, phones: int):
+    async with postgres_store.pool.acquire() as conn:
+        await conn.execute("""
+            INSERT INTO checkout_flows (email, status, customer_phone, created_at, updated_at)
+            SELECT 
+                'bench-' || i || '@example.com',
+                CASE WHEN i % 10 = 0 THEN 'blocked' ELSE 'pending' END,
+                '+91' || (9000000000 + i % $2),
+                NOW() - (i % 604800) * INTERVAL '1 second',
+                NOW()
+            FROM generate_series(1, $1) AS i
+            ON CONFLICT (email) DO NOTHING
+        """, rows, phones)
+        await conn.execute("ANALYZE checkout_flows")
+
+
+async def _time(label: str, check, checks: int, rows: int, phones: int):
+    rng = random.Random(7)
+    latencies = []
+    for _ in range(checks):
+        i = rng.randint(1, rows * 2)  # half the emails exist, half are new
+        email = f"bench-{i}@example.com"
+        phone = f"+91{9000000000 + i % phones}"
+        started = time.perf_counter()
+        await check(email, phone)
+        latencies.append((time.perf_counter() - started) * 1000)
+    latencies.sort()
+    print(f"{label:<38}{statistics.mean(latencies):>10.3f}{latencies[int(len(latencies) * 0.99)]:>10.3f}")
+
+
+async def _two_queries(email: str, phone: str):
+    if await postgres_store.check_recent_flow(email, hours=2):
+        return "duplicate"
+    if await postgres_store.get_phone_message_count(phone, hours=24) >= 3:
+        return "phone_limit"
+    return "allowed"
+
+
+async def _single_statement(email: str, phone: str):
+    return await postgres_store.admit_flow(email, phone, recent_hours=2, phone_hours=24, phone_limit=3)
+
+
+async def main_async(args):
+    await postgres_store.init_pool()
+    try:
+        print(f"Seeding {args.rows} rows...")
+        await _seed(args.rows, args.phones)
+        print(f"{'variant':<38}{'mean ms':>10}{'p99 ms':>10}")
+        async with postgres_store.pool.acquire() as conn:
+            await conn.execute(f"DROP INDEX IF EXISTS {PHONE_INDEX}")
+        await _time("two queries, no phone index", _two_queries, args.checks, args.rows, args.phones)
+        await _time("single statement, no phone index", _single_statement, args.checks, args.rows, args.phones)
+        async with postgres_store.pool.acquire() as conn:
+            await conn.execute(f"CREATE INDEX {PHONE_INDEX} ON checkout_flows(customer_phone, created_at)")
+        await _time("two queries, phone index", _two_queries, args.checks, args.rows, args.phones)
+        await _time("single statement, phone index", _single_statement, args.checks, args.rows, args.phones)
+    finally:
+        async with postgres_store.pool.acquire() as conn:
+            await conn.execute("DELETE FROM checkout_flows WHERE email LIKE 'bench-%'")
+            await conn.execute(f"CREATE INDEX IF NOT EXISTS {PHONE_INDEX} ON checkout_flows(customer_phone, created_at)")
+        await postgres_store.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=3_000_000)
+    parser.add_argument("--phones", type=int, default=1_000_000)
+    parser.add_argument("--checks", type=int, default=2000)
+    asyncio.run(main_async(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
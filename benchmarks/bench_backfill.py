@@ -0,0 +1,80 @@
+"""
+Backfill benchmark: rows/sec for python -m app.backfill's bulk path (parse,
+extract, COPY into staging, merge) versus one PostgresStore.set_flow per
+checkout, over a generated NDJSON export of compact Shopify checkouts.
+
+Needs DATABASE_URL (and the other settings) in the environment or .env; rows
+use a bench- email prefix and are deleted afterwards. Run from the
+repository root:
+
+    python -m benchmarks.bench_backfill [--rows 500000] [--batch-size 20000] [--set-flow-rows 5000]
+"""
+import argparse
+import asyncio
+import json
+import os
+import tempfile
+import time
+
+from app.backfill import backfill
+from app.database.postgres_store import postgres_store
+
+
+def _write_export(path: str, rows: int):
+    with open(path, "w") as f:
+        for i in range(rows):
+            f.write(json.dumps({
+                "id": i, "email": f"bench-{i}@example.com", "created_at": "2024-11-29T10:15:00+05:30",
+                "customer": {"first_name": "Asha", "last_name": "Verma", "phone": f"+91{9000000000 + i % 50000}"},
+                "line_items": [{"title": "Handloom Kurta", "quantity": 1, "price": "1299.00"}],
+                "completed_at": None if i % 4 else "2024-11-29T10:30:00+05:30",
+            }) + "\n")
+
+
+async def _cleanup():
+    async with postgres_store.pool.acquire() as conn:
+        await conn.execute("DELETE FROM checkout_flows WHERE email LIKE 'bench-%'")
+
+
+async def main_async(args):
+    await postgres_store.init_pool()
+    # Time the per-row path without write-behind batching, as the old import would run
+    await postgres_store.write_buffer.stop()
+    with tempfile.NamedTemporaryFile(suffix=".ndjson", delete=False) as export:
+        path = export.name
+    try:
+        _write_export(path, args.rows)
+        await _cleanup()
+        print(f"{'variant':<12}{'rows':>10}{'rows/s':>12}")
+
+        started = time.perf_counter()
+        with open(path, "rb") as stream:
+            progress = await backfill(stream, "ndjson", "zuzumonk", args.batch_size)
+        elapsed = time.perf_counter() - started
+        print(f"{'backfill':<12}{progress.written:>10}{progress.read / elapsed:>12.0f}")
+        await _cleanup()
+
+        started = time.perf_counter()
+        for i in range(args.set_flow_rows):
+            await postgres_store.set_flow(f"bench-{i}@example.com", {
+                "status": "backfilled", "customer_name": "Asha Verma",
+                "customer_phone": f"+91{9000000000 + i % 50000}", "client_id": "zuzumonk",
+            })
+        elapsed = time.perf_counter() - started
+        print(f"{'set_flow':<12}{args.set_flow_rows:>10}{args.set_flow_rows / elapsed:>12.0f}")
+    finally:
+        os.unlink(path)
+        await _cleanup()
+        await postgres_store.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=500_000)
+    parser.add_argument("--batch-size", type=int, default=20_000)
+    parser.add_argument("--set-flow-rows", type=int, default=5000)
+    asyncio.run(main_async(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,95 @@
+"""
+Cold start benchmark: time from spawning app.main:app under uvicorn until
+/ready answers 200 and until the first checkouts/create webhook is accepted.
+
+The first boot runs with schema_version emptied, so it applies the DDL; the
+remaining boots find the schema current and skip it. Sends stay in dry-run
+mode. Needs DATABASE_URL (and the other settings) in the environment or .env
+plus uvicorn and httpx. Run from the repository root:
+
+    python -m benchmarks.bench_cold_start [--boots 5] [--port 8000]
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+import asyncpg
+import httpx
+
+from benchmarks.bench_webhook_parse import make_checkout
+from config import settings
+
+
+async def _until_ok(request, server: subprocess.Popen, timeout: float = 60) -> float:
+    """Retry `request` until it returns 200; returns the perf_counter time it did"""
+    started = time.perf_counter()
+    while time.perf_counter() - started < timeout:
+        if server.poll() is not None:
+            raise RuntimeError(f"Server exited with code {server.returncode}")
+        try:
+            if (await request()).status_code == 200:
+                return time.perf_counter()
+        except httpx.TransportError:
+            pass
+        await asyncio.sleep(0.01)
+    raise RuntimeError("Server did not answer in time")
+
+
+async def _boot(args, seed: int) -> dict:
+    env = dict(os.environ, WHATSAPP_DRY_RUN="true")
+    body = make_checkout(4000, seed)
+    async with httpx.AsyncClient(base_url=f"http://127.0.0.1:{args.port}", timeout=10) as client:
+        spawned = time.perf_counter()
+        server = subprocess.Popen(
+            [sys.executable, "-m", "uvicorn", "app.main:app", "--host", "127.0.0.1", "--port", str(args.port),
+             "--no-access-log"],
+            env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+        )
+        try:
+            ready, webhook = await asyncio.gather(
+                _until_ok(lambda: client.get("/ready"), server),
+                _until_ok(lambda: client.post("/checkouts/create", content=body,
+                                              headers={"Content-Type": "application/json"}), server),
+            )
+        finally:
+            server.terminate()
+            try:
+                server.wait(timeout=30)
+            except subprocess.TimeoutExpired:
+                server.kill()
+    return {"ready": ready - spawned, "first_webhook": webhook - spawned}
+
+
+async def main_async(args):
+    conn = await asyncpg.connect(settings.DATABASE_URL)
+    try:
+        if await conn.fetchval("SELECT to_regclass('schema_version')") is not None:
+            await conn.execute("DELETE FROM schema_version")
+    finally:
+        await conn.close()
+
+    print(f"{'boot':<14}{'ready s':>10}{'first webhook s':>18}")
+    warm = []
+    for boot in range(args.boots):
+        timings = await _boot(args, seed=boot)
+        label = "schema setup" if boot == 0 else f"warm #{boot}"
+        print(f"{label:<14}{timings['ready']:>10.3f}{timings['first_webhook']:>18.3f}")
+        if boot:
+            warm.append(timings["first_webhook"])
+    if warm:
+        print(f"median time-to-first-webhook with a current schema: {statistics.median(warm):.3f}s")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--boots", type=int, default=5)
+    parser.add_argument("--port", type=int, default=8000)
+    asyncio.run(main_async(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
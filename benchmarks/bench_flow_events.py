@@ -0,0 +1,103 @@
+"""
+Flow event benchmark: write throughput and table/index growth for step
+transitions recorded the old way (jsonb_set on the checkout_flows row, bumping
+the indexed updated_at) versus appended to flow_events.
+
+Both variants run against scratch copies of the real tables (CREATE TABLE ...
+LIKE ... INCLUDING ALL) seeded with the same flows, three transitions per flow,
+written in batches through executemany. Needs DATABASE_URL (and the other
+settings) in the environment or .env; the scratch tables are dropped afterwards.
+Run from the repository root:
+
+    python -m benchmarks.bench_flow_events [--transitions 1000000] [--batch 500]
+"""
+import argparse
+import asyncio
+import time
+
+from app.database.postgres_store import postgres_store
+
+JSONB_SET_SQL = """
+    UPDATE bench_checkout_flows
+    SET step_status = jsonb_set(step_status, ARRAY[$2::text], to_jsonb($3::text), true),
+        updated_at = NOW()
+    WHERE email = $1
+"""
+
+APPEND_EVENT_SQL = """
+    INSERT INTO bench_flow_events (email, step, outcome)
+    VALUES ($1, $2, $3)
+"""
+
+SIZES_SQL = """
+    SELECT pg_table_size($1::regclass) AS table_bytes, pg_indexes_size($1::regclass) AS index_bytes
+"""
+
+
+async def _setup(conn, flows: int):
+    await conn.execute("""
+        DROP TABLE IF EXISTS bench_checkout_flows, bench_flow_events;
+        CREATE TABLE bench_checkout_flows (LIKE checkout_flows INCLUDING ALL);
+        CREATE TABLE bench_flow_events (LIKE flow_events INCLUDING ALL);
+    """)
+    await conn.execute("""
+        INSERT INTO bench_checkout_flows (email, status, step_status, customer_phone)
+        SELECT 'bench-' || i || '@example.com', 'pending', '{}', '+91' || (9000000000 + i)
+        FROM generate_series(1, $1) AS i
+    """, flows)
+    await conn.execute("VACUUM ANALYZE bench_checkout_flows")
+
+
+async def _sizes(conn, table: str) -> dict:
+    return dict(await conn.fetchrow(SIZES_SQL, table))
+
+
+async def _run(conn, label: str, table: str, sql: str, transitions: list, batch: int, key):
+    before = await _sizes(conn, table)
+    started = time.perf_counter()
+    for start in range(0, len(transitions), batch):
+        async with conn.transaction():
+            await conn.executemany(sql, [key(t) for t in transitions[start:start + batch]])
+    elapsed = time.perf_counter() - started
+    after = await _sizes(conn, table)
+    print(f"{label:<12}{len(transitions) / elapsed:>12.0f}"
+          f"{(after['table_bytes'] - before['table_bytes']) / 2**20:>14.1f}"
+          f"{(after['index_bytes'] - before['index_bytes']) / 2**20:>14.1f}")
+
+
+async def main_async(args):
+    await postgres_store.init_pool()
+    flows = args.transitions // 3
+    # Every flow goes through step_1..step_3, interleaved as they would be in production
+    transitions = [(f"bench-{i}@example.com", step, "sent") for step in (1, 2, 3) for i in range(1, flows + 1)]
+    try:
+        async with postgres_store.pool.acquire() as conn:
+            print(f"Seeding {flows} flows...")
+            await _setup(conn, flows)
+            print(f"{'variant':<12}{'rows/s':>12}{'table MiB +':>14}{'index MiB +':>14}")
+            await _run(conn, "jsonb_set", "bench_checkout_flows", JSONB_SET_SQL, transitions, args.batch,
+                       lambda t: (t[0], f"step_{t[1]}", t[2]))
+            await _run(conn, "flow_events", "bench_flow_events", APPEND_EVENT_SQL, transitions, args.batch,
+                       lambda t: t)
+            stats = await conn.fetchrow("""
+                SELECT n_tup_upd, n_tup_hot_upd, n_dead_tup FROM pg_stat_user_tables
+                WHERE relname = 'bench_checkout_flows'
+            """)
+            if stats:
+                print(f"jsonb_set: {stats['n_tup_upd']} updates, {stats['n_tup_hot_upd']} HOT, "
+                      f"{stats['n_dead_tup']} dead tuples")
+    finally:
+        async with postgres_store.pool.acquire() as conn:
+            await conn.execute("DROP TABLE IF EXISTS bench_checkout_flows, bench_flow_events")
+        await postgres_store.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--transitions", type=int, default=1_000_000)
+    parser.add_argument("--batch", type=int, default=500)
+    asyncio.run(main_async(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,75 @@
+"""
+Durable step queue benchmark: claim throughput of the flow_steps table at
+increasing worker counts against a local Postgres.
+
+Each worker process leases batches with FOR UPDATE SKIP LOCKED and releases
+them exactly as the app does. Needs DATABASE_URL (and the other settings) in
+the environment or .env; the flow_steps table is truncated first. Run from the
+repository root:
+
+    python -m benchmarks.bench_flow_steps [--steps 50000] [--workers 1 2 4 8]
+"""
+import argparse
+import asyncio
+import multiprocessing
+import time
+from datetime import datetime, timedelta, timezone
+
+from app.database.postgres_store import postgres_store
+
+
+async def _seed(count: int):
+    await postgres_store.init_pool()
+    async with postgres_store.pool.acquire() as conn:
+        await conn.execute("TRUNCATE flow_steps")
+        due_at = datetime.now(timezone.utc) - timedelta(seconds=1)
+        await conn.copy_records_to_table(
+            "flow_steps",
+            records=[
+                (f"bench{i}@example.com", 0, "zuzumonk", f"+91{9000000000 + i}", "Bench", due_at)
+                for i in range(count)
+            ],
+            columns=["email", "step_index", "client_id", "customer_phone", "customer_name", "due_at"],
+        )
+    await postgres_store.close()
+
+
+async def _drain(worker_id: str, batch_size: int) -> int:
+    await postgres_store.init_pool()
+    done = 0
+    while True:
+        rows = await postgres_store.claim_due_steps(worker_id, batch_size, 60)
+        if not rows:
+            break
+        await asyncio.gather(*[
+            postgres_store.advance_step(row["email"], row["step_index"], None) for row in rows
+        ])
+        done += len(rows)
+    await postgres_store.close()
+    return done
+
+
+def _worker(args):
+    worker_id, batch_size = args
+    return asyncio.run(_drain(worker_id, batch_size))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--steps", type=int, default=50_000)
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4, 8])
+    parser.add_argument("--batch", type=int, default=100)
+    args = parser.parse_args()
+
+    print(f"{'workers':>8}{'steps':>10}{'seconds':>10}{'steps/s':>12}")
+    for workers in args.workers:
+        asyncio.run(_seed(args.steps))
+        started = time.perf_counter()
+        with multiprocessing.Pool(workers) as pool:
+            done = sum(pool.map(_worker, [(f"bench-{i}", args.batch) for i in range(workers)]))
+        elapsed = time.perf_counter() - started
+        print(f"{workers:>8}{done:>10}{elapsed:>10.2f}{done / elapsed:>12.0f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,97 @@
+"""
+Cost of the built-in metrics: a histogram observation, a counter increment,
+a PostgresStore-style timed coroutine method, and the route middleware on a
+minimal ASGI app, each against the same work without instrumentation. Run
+from the repository root:
+
+    python -m benchmarks.bench_metrics_overhead [--iterations 200000]
+"""
+import argparse
+import asyncio
+import time
+
+from app.metrics import MetricsRegistry, RouteMetricsMiddleware, instrument_methods
+
+
+class _Store:
+    async def get_flow(self, email: str):
+        return email
+
+
+class _TimedStore:
+    async def get_flow(self, email: str):
+        return email
+
+
+async def _asgi_app(scope, receive, send):
+    await send({"type": "http.response.start", "status": 200, "headers": []})
+    await send({"type": "http.response.body", "body": b"ok"})
+
+
+def _report(label: str, baseline: float, instrumented: float, iterations: int):
+    overhead = (instrumented - baseline) / iterations * 1e9
+    print(f"{label:<26}{baseline / iterations * 1e9:>12.0f}{instrumented / iterations * 1e9:>14.0f}{overhead:>12.0f}")
+
+
+async def main_async(iterations: int):
+    registry = MetricsRegistry()
+    histogram = registry.histogram("bench_seconds", "bench", ("method",))
+    counter = registry.counter("bench_total", "bench", ("outcome",))
+    print(f"{'operation':<26}{'bare ns':>12}{'metered ns':>14}{'added ns':>12}")
+
+    started = time.perf_counter()
+    for _ in range(iterations):
+        pass
+    empty = time.perf_counter() - started
+    started = time.perf_counter()
+    for _ in range(iterations):
+        histogram.observe(0.0042, "get_flow")
+    _report("histogram.observe", empty, time.perf_counter() - started, iterations)
+    started = time.perf_counter()
+    for _ in range(iterations):
+        counter.inc("sent")
+    _report("counter.inc", empty, time.perf_counter() - started, iterations)
+
+    instrument_methods(_TimedStore, histogram)
+    bare, timed = _Store(), _TimedStore()
+    started = time.perf_counter()
+    for _ in range(iterations):
+        await bare.get_flow("a@b.c")
+    baseline = time.perf_counter() - started
+    started = time.perf_counter()
+    for _ in range(iterations):
+        await timed.get_flow("a@b.c")
+    _report("timed store method", baseline, time.perf_counter() - started, iterations)
+
+    scope = {"type": "http", "method": "GET", "path": "/ping", "endpoint": None}
+
+    async def receive():
+        return {"type": "http.request", "body": b""}
+
+    async def send(message):
+        pass
+
+    middleware = RouteMetricsMiddleware(_asgi_app, registry.histogram("bench_http_seconds", "bench",
+                                                                      ("method", "route", "status")))
+    started = time.perf_counter()
+    for _ in range(iterations):
+        await _asgi_app(scope, receive, send)
+    baseline = time.perf_counter() - started
+    started = time.perf_counter()
+    for _ in range(iterations):
+        await middleware(scope, receive, send)
+    _report("route middleware", baseline, time.perf_counter() - started, iterations)
+
+    started = time.perf_counter()
+    text = await registry.render()
+    print(f"\nrender: {len(text.splitlines())} lines in {(time.perf_counter() - started) * 1e3:.2f} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--iterations", type=int, default=200000)
+    asyncio.run(main_async(parser.parse_args().iterations))
+
+
+if __name__ == "__main__":
+    main()
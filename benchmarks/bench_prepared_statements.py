@@ -0,0 +1,104 @@
+"""
+Prepared statement benchmark: per-query latency of the hot PostgresStore reads
+executed three ways against the same seeded data:
+
+  - unprepared: statement_cache_size=0, so every call parses and plans anew
+    (what the old %-interpolated interval queries amounted to, since each
+    distinct hours value was a new statement text)
+  - statement cache: asyncpg's automatic per-connection cache of query text
+  - catalog: the app.database.queries statements prepared once per connection
+
+Needs DATABASE_URL (and the other settings) in the environment or .env;
+seeded rows use a bench- email prefix and are deleted afterwards. Run from
+the repository root:
+
+    python -m benchmarks.bench_prepared_statements [--rows 100000] [--calls 5000]
+"""
+import argparse
+import asyncio
+import random
+import statistics
+import time
+
+import asyncpg
+
+from app.database.postgres_store import CatalogConnection, postgres_store
+from app.database.queries import STATEMENTS
+from config import settings
+
+# Catalog statement -> argument factory taking (rng, rows)
+QUERIES = {
+    "get_flow": lambda rng, rows: (f"bench-{rng.randint(1, rows)}@example.com",),
+    "check_recent_flow": lambda rng, rows: (f"bench-{rng.randint(1, rows)}@example.com", 2),
+    "count_phone_flows": lambda rng, rows: (f"+91{9000000000 + rng.randint(1, rows) % 1000}", 24),
+    "admit_flow": lambda rng, rows: (
+        f"bench-{rng.randint(1, rows * 2)}@example.com", f"+91{9000000000 + rng.randint(1, rows) % 1000}", 2, 24, 3
+    ),
+    "get_rate_limit": lambda rng, rows: (f"bench-key-{rng.randint(1, 1000)}",),
+}
+
+
+async def _seed(rows: int):
+    async with postgres_store.pool.acquire() as conn:
+        await conn.execute("""
+            INSERT INTO checkout_flows (email, status, customer_phone, created_at, updated_at)
+            SELECT 'bench-' || i || '@example.com', 'pending', '+91' || (9000000000 + i % 1000),
+                   NOW() - (i % 86400) * INTERVAL '1 second', NOW()
+            FROM generate_series(1, $1) AS i
+            ON CONFLICT (email) DO NOTHING
+        """, rows)
+        await conn.execute("ANALYZE checkout_flows")
+
+
+async def _time(name: str, run, calls: int, rows: int) -> list:
+    rng = random.Random(7)
+    args = QUERIES[name]
+    for _ in range(min(calls, 50)):  # warm up
+        await run(*args(rng, rows))
+    latencies = []
+    for _ in range(calls):
+        call_args = args(rng, rows)
+        started = time.perf_counter()
+        await run(*call_args)
+        latencies.append((time.perf_counter() - started) * 1000)
+    latencies.sort()
+    return latencies
+
+
+async def main_async(args):
+    await postgres_store.init_pool()
+    unprepared = await asyncpg.connect(settings.DATABASE_URL, statement_cache_size=0)
+    cached = await asyncpg.connect(settings.DATABASE_URL, statement_cache_size=100)
+    catalog = await asyncpg.connect(settings.DATABASE_URL, connection_class=CatalogConnection)
+    await catalog.prepare_catalog()
+    try:
+        print(f"Seeding {args.rows} rows...")
+        await _seed(args.rows)
+        print(f"{'query':<22}{'variant':<18}{'mean ms':>10}{'p50 ms':>10}{'p99 ms':>10}")
+        for name in QUERIES:
+            variants = (
+                ("unprepared", lambda *a, q=STATEMENTS[name]: unprepared.fetch(q, *a)),
+                ("statement cache", lambda *a, q=STATEMENTS[name]: cached.fetch(q, *a)),
+                ("catalog", catalog.statements[name].fetch),
+            )
+            for label, run in variants:
+                latencies = await _time(name, run, args.calls, args.rows)
+                print(f"{name:<22}{label:<18}{statistics.mean(latencies):>10.3f}"
+                      f"{latencies[len(latencies) // 2]:>10.3f}{latencies[int(len(latencies) * 0.99)]:>10.3f}")
+    finally:
+        for conn in (unprepared, cached, catalog):
+            await conn.close()
+        async with postgres_store.pool.acquire() as conn:
+            await conn.execute("DELETE FROM checkout_flows WHERE email LIKE 'bench-%'")
+        await postgres_store.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=100_000)
+    parser.add_argument("--calls", type=int, default=5000)
+    asyncio.run(main_async(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,113 @@
+"""
+Timing wheel benchmark: memory and CPU for 10^5-10^6 pending flow steps.
+
+Compares the wheel against the previous model of one sleeping coroutine per
+checkout. Run from the repository root:
+
+    python -m benchmarks.bench_scheduler [--sizes 100000 1000000] [--baseline-size 100000]
+"""
+import argparse
+import asyncio
+import gc
+import random
+import time
+import tracemalloc
+
+from app.services.scheduler import PendingStep, TimingWheel
+
+DELAYS = (300, 1800, 3600)
+
+
+def make_steps(count: int):
+    return [
+        PendingStep(f"customer{i}@example.com", f"+91{9000000000 + i}", f"Customer {i}", "zuzumonk")
+        for i in range(count)
+    ]
+
+
+def bench_wheel(count: int):
+    rng = random.Random(count)
+    delays = [rng.choice(DELAYS) for _ in range(count)]
+
+    # Memory pass (tracemalloc slows allocation, so timings come from a separate pass)
+    gc.collect()
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    wheel = TimingWheel(tick=1.0)
+    for step, delay in zip(make_steps(count), delays):
+        wheel.schedule(step, delay)
+    gc.collect()
+    memory = tracemalloc.get_traced_memory()[0] - before
+    tracemalloc.stop()
+    del wheel
+    gc.collect()
+
+    steps = make_steps(count)
+    wheel = TimingWheel(tick=1.0)
+    started = time.perf_counter()
+    for step, delay in zip(steps, delays):
+        wheel.schedule(step, delay)
+    schedule_seconds = time.perf_counter() - started
+    del steps
+
+    # Fire everything by advancing the wheel one tick at a time
+    fired = 0
+    started = time.perf_counter()
+    for tick in range(1, max(DELAYS) + 2):
+        fired += len(wheel.advance(wheel._origin + tick))
+    fire_seconds = time.perf_counter() - started
+    assert fired == count, f"fired {fired} of {count} steps"
+
+    return {
+        "pending": count,
+        "bytes_per_step": memory / count,
+        "schedule_ns_per_step": schedule_seconds / count * 1e9,
+        "fire_ns_per_step": fire_seconds / count * 1e9,
+    }
+
+
+async def _park_coroutines(count: int):
+    async def flow(step: PendingStep, delay: float):
+        await asyncio.sleep(delay)
+
+    rng = random.Random(count)
+    gc.collect()
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    steps = make_steps(count)
+    started = time.perf_counter()
+    tasks = [asyncio.create_task(flow(step, rng.choice(DELAYS))) for step in steps]
+    await asyncio.sleep(0)  # let every task reach its sleep
+    schedule_seconds = time.perf_counter() - started
+    del steps
+    gc.collect()
+    memory = tracemalloc.get_traced_memory()[0] - before
+    tracemalloc.stop()
+    for task in tasks:
+        task.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
+    return {
+        "pending": count,
+        "bytes_per_step": memory / count,
+        "schedule_ns_per_step": schedule_seconds / count * 1e9,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[100_000, 1_000_000])
+    parser.add_argument("--baseline-size", type=int, default=100_000)
+    args = parser.parse_args()
+
+    print(f"{'model':<22}{'pending':>10}{'bytes/step':>12}{'schedule ns':>13}{'fire ns':>10}")
+    baseline = asyncio.run(_park_coroutines(args.baseline_size))
+    print(f"{'sleeping coroutines':<22}{baseline['pending']:>10}{baseline['bytes_per_step']:>12.0f}"
+          f"{baseline['schedule_ns_per_step']:>13.0f}{'-':>10}")
+    for size in args.sizes:
+        result = bench_wheel(size)
+        print(f"{'timing wheel':<22}{result['pending']:>10}{result['bytes_per_step']:>12.0f}"
+              f"{result['schedule_ns_per_step']:>13.0f}{result['fire_ns_per_step']:>10.0f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,92 @@
+"""
+Send queue load test: a burst of due steps all waking in the same second,
+sent directly from their own coroutines (the previous code path) versus
+through the SendQueue worker pool and token bucket, against the local fake
+Graph server. Reports the peak requests the upstream saw in any one second,
+drain time, and queue latency per reminder. Run from the repository root:
+
+    python -m benchmarks.bench_send_queue [--sends 3000] [--rate 80] [--workers 16] [--latency-ms 20]
+"""
+import argparse
+import asyncio
+import time
+
+from app.services.send_queue import SendQueue
+from app.services.whatsapp import WhatsAppSender
+from benchmarks.fake_graph import FakeGraphServer
+
+STEPS = 3
+
+
+def _percentile(values, p):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(p * len(values)))] if values else 0.0
+
+
+def _report(label: str, server: FakeGraphServer, elapsed: float, sends: int, latencies=None):
+    peak = max(server.per_second.values()) if server.per_second else 0
+    line = f"{label:<14}{sends / elapsed:>10.0f}{peak:>10}{elapsed:>10.2f}"
+    if latencies:
+        line += "".join(
+            f"{_percentile(latencies[i], 0.5) * 1000:>9.0f}/{_percentile(latencies[i], 0.95) * 1000:<6.0f}"
+            for i in range(STEPS)
+        )
+    print(line)
+
+
+async def main_async(args):
+    server = FakeGraphServer(port=args.port, latency=args.latency_ms / 1000)
+    await server.start()
+    sender = WhatsAppSender(server.base_url, "token", "123", max_connections=args.workers * 4,
+                            max_keepalive=args.workers * 4)
+    await sender.start()
+    phones = [f"+91{9000000000 + i}" for i in range(args.sends)]
+    header = f"{'path':<14}{'sends/s':>10}{'peak/s':>10}{'drain s':>10}"
+    header += "".join(f"{f'step {i + 1} p50/p95 ms':>16}" for i in range(STEPS))
+    print(header)
+    try:
+        # Direct: every flow sends as soon as it wakes
+        server.per_second.clear()
+        started = time.perf_counter()
+        await asyncio.gather(*[
+            sender.send_template(phone, "abandoned_cart_reminder_1", ["there"]) for phone in phones
+        ])
+        _report("direct", server, time.perf_counter() - started, args.sends)
+
+        # Queued: the same burst through the worker pool and token bucket,
+        # final reminders first as with SEND_QUEUE_PRIORITY="final"
+        queue = SendQueue(lambda phone, template, params: sender.send_template(phone, template, params),
+                          workers=args.workers, rate=args.rate, burst=args.burst, max_depth=args.sends)
+        queue.start()
+        latencies = [[] for _ in range(STEPS)]
+
+        async def flow_step(i: int, phone: str):
+            step_index = i % STEPS
+            queued = time.perf_counter()
+            await queue.submit(phone, "abandoned_cart_reminder_1", ["there"], priority=STEPS - 1 - step_index)
+            latencies[step_index].append(time.perf_counter() - queued)
+
+        server.per_second.clear()
+        started = time.perf_counter()
+        await asyncio.gather(*[flow_step(i, phone) for i, phone in enumerate(phones)])
+        _report("send queue", server, time.perf_counter() - started, args.sends, latencies)
+        await queue.stop()
+        print(f"\nqueue stats: {queue.stats()}")
+    finally:
+        await sender.close()
+        await server.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sends", type=int, default=3000)
+    parser.add_argument("--rate", type=float, default=80.0)
+    parser.add_argument("--burst", type=float, default=20.0)
+    parser.add_argument("--workers", type=int, default=16)
+    parser.add_argument("--latency-ms", type=float, default=20.0)
+    parser.add_argument("--port", type=int, default=8081)
+    asyncio.run(main_async(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,157 @@
+"""
+Checkout webhook ingestion micro-benchmark on realistic 50-200 KB Shopify
+checkout bodies.
+
+"dict + pydantic" is the previous path: json decode into a validated dict,
+walk it, then build a validated CheckoutPayload. "raw bytes fast path" is
+parse_body + extract_checkout. With --asgi both variants are also served by a
+minimal FastAPI app through httpx's ASGI transport. Run from the repository
+root:
+
+    python -m benchmarks.bench_webhook_parse [--requests 2000] [--asgi]
+"""
+import argparse
+import asyncio
+import json
+import random
+import statistics
+import time
+
+from pydantic import TypeAdapter
+
+from app.api.parsing import extract_checkout, parse_body
+from app.models.checkout import CheckoutPayload
+
+_dict_adapter = TypeAdapter(dict)
+
+
+def _address(rng: random.Random) -> dict:
+    return {
+        "first_name": "Asha", "last_name": "Verma", "company": None,
+        "address1": f"{rng.randint(1, 999)} MG Road", "address2": "Floor 3",
+        "city": "Bengaluru", "province": "Karnataka", "country": "India", "zip": "560001",
+        "phone": f"+91{rng.randint(7000000000, 9999999999)}", "latitude": 12.97, "longitude": 77.59,
+        "country_code": "IN", "province_code": "KA",
+    }
+
+
+def make_checkout(target_bytes: int, seed: int) -> bytes:
+    """Build a Shopify-shaped checkout body of roughly `target_bytes`"""
+    rng = random.Random(seed)
+    payload = {
+        "id": seed, "token": f"{seed:032x}", "cart_token": f"c{seed:031x}",
+        "email": f"customer{seed}@example.com", "created_at": "2024-11-29T10:15:00+05:30",
+        "updated_at": "2024-11-29T10:20:00+05:30", "currency": "INR", "presentment_currency": "INR",
+        "customer": {
+            "id": seed, "email": f"customer{seed}@example.com", "first_name": "Asha", "last_name": "Verma",
+            "phone": None, "tags": "vip,newsletter", "default_address": _address(rng),
+        },
+        "billing_address": _address(rng), "shipping_address": _address(rng),
+        "discount_codes": [{"code": "BLACKFRIDAY", "amount": "250.00", "type": "fixed_amount"}],
+        "shipping_lines": [{"title": "Express", "price": "99.00", "code": "EXP"}],
+        "tax_lines": [{"title": "GST", "price": "180.00", "rate": 0.18}],
+        "note_attributes": [{"name": "gift", "value": "yes"}],
+        "line_items": [],
+    }
+    body = json.dumps(payload)
+    while len(body) < target_bytes:
+        payload["line_items"].append({
+            "id": rng.randint(1, 10 ** 12), "variant_id": rng.randint(1, 10 ** 12),
+            "product_id": rng.randint(1, 10 ** 12), "title": f"Handloom Kurta {rng.randint(1, 500)}",
+            "variant_title": "M / Indigo", "sku": f"SKU-{rng.randint(1, 10 ** 6)}", "vendor": "Zuzumonk",
+            "quantity": rng.randint(1, 3), "price": f"{rng.randint(500, 5000)}.00",
+            "compare_at_price": f"{rng.randint(5000, 8000)}.00", "requires_shipping": True, "taxable": True,
+            "grams": rng.randint(100, 900), "fulfillment_service": "manual",
+            "properties": [{"name": f"note{k}", "value": "x" * 40} for k in range(4)],
+            "tax_lines": [{"title": "GST", "price": "90.00", "rate": 0.18}],
+            "discount_allocations": [{"amount": "25.00", "discount_application_index": 0}],
+        })
+        body = json.dumps(payload)
+    return body.encode()
+
+
+def _walk(payload: dict) -> CheckoutPayload:
+    customer = payload.get("customer") or {}
+    customer_name = f"{customer.get('first_name', '')} {customer.get('last_name', '')}".strip() or None
+    phone = (customer.get("phone") or customer.get("default_address", {}).get("phone")
+             or payload.get("billing_address", {}).get("phone"))
+    cart_items = [
+        {"name": item.get("title", "Unknown Product"), "quantity": item.get("quantity", 1),
+         "price": float(item.get("price", "0"))}
+        for item in payload.get("line_items", [])
+    ]
+    return CheckoutPayload(customer_name=customer_name, customer_email=payload.get("email"),
+                           customer_phone=phone, cart_items=cart_items, created_at=payload.get("created_at", ""))
+
+
+def dict_pydantic_path(body: bytes) -> CheckoutPayload:
+    return _walk(_dict_adapter.validate_python(json.loads(body)))
+
+
+def fast_path(body: bytes) -> CheckoutPayload:
+    return extract_checkout(parse_body(body))
+
+
+def _report(label: str, latencies: list, elapsed: float):
+    latencies.sort()
+    print(f"{label:<28}{len(latencies) / elapsed:>10.0f}{statistics.median(latencies):>10.3f}"
+          f"{latencies[int(len(latencies) * 0.99)]:>10.3f}")
+
+
+def bench_functions(bodies: list, requests: int):
+    for label, parse in (("dict + pydantic", dict_pydantic_path), ("raw bytes fast path", fast_path)):
+        latencies = []
+        started = time.perf_counter()
+        for i in range(requests):
+            t0 = time.perf_counter()
+            parse(bodies[i % len(bodies)])
+            latencies.append((time.perf_counter() - t0) * 1000)
+        _report(label, latencies, time.perf_counter() - started)
+
+
+async def bench_asgi(bodies: list, requests: int):
+    import httpx
+    from fastapi import FastAPI, Request
+
+    app = FastAPI()
+
+    @app.post("/dict")
+    async def dict_route(payload: dict):
+        checkout = _walk(payload)
+        return {"status": "received", "email": checkout.customer_email}
+
+    @app.post("/fast")
+    async def fast_route(request: Request):
+        checkout = fast_path(await request.body())
+        return {"status": "received", "email": checkout.customer_email}
+
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        for label, path in (("ASGI dict + pydantic", "/dict"), ("ASGI raw bytes fast path", "/fast")):
+            latencies = []
+            started = time.perf_counter()
+            for i in range(requests):
+                t0 = time.perf_counter()
+                response = await client.post(path, content=bodies[i % len(bodies)],
+                                             headers={"Content-Type": "application/json"})
+                response.raise_for_status()
+                latencies.append((time.perf_counter() - t0) * 1000)
+            _report(label, latencies, time.perf_counter() - started)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--asgi", action="store_true")
+    args = parser.parse_args()
+
+    bodies = [make_checkout(size, seed) for seed, size in enumerate((50_000, 100_000, 150_000, 200_000))]
+    print(f"payload sizes: {', '.join(f'{len(b) // 1024} KB' for b in bodies)}")
+    print(f"{'path':<28}{'req/s':>10}{'p50 ms':>10}{'p99 ms':>10}")
+    bench_functions(bodies, args.requests)
+    if args.asgi:
+        asyncio.run(bench_asgi(bodies, args.requests))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,74 @@
+"""
+WhatsApp send throughput: one AsyncClient per message (the previous code path)
+versus the shared, pooled WhatsAppSender, both against the local fake Graph
+server. Run from the repository root:
+
+    python -m benchmarks.bench_whatsapp_send [--sends 5000] [--concurrency 50] [--latency-ms 5]
+"""
+import argparse
+import asyncio
+import time
+
+import httpx
+
+from app.services.whatsapp import WhatsAppSender
+from benchmarks.fake_graph import FakeGraphServer
+
+
+async def _per_message_client(base_url: str, phone: str):
+    async with httpx.AsyncClient() as client:
+        response = await client.post(
+            f"{base_url}/123/messages",
+            headers={"Authorization": "Bearer token", "Content-Type": "application/json"},
+            json={"messaging_product": "whatsapp", "to": phone, "type": "template",
+                  "template": {"name": "abandoned_cart_reminder_1", "language": {"code": "en_US"}}},
+        )
+        response.raise_for_status()
+
+
+async def _run(label: str, send, sends: int, concurrency: int, server: FakeGraphServer):
+    semaphore = asyncio.Semaphore(concurrency)
+    connections = server.connections
+
+    async def one(i: int):
+        async with semaphore:
+            await send(f"+91{9000000000 + i}")
+
+    started = time.perf_counter()
+    await asyncio.gather(*[one(i) for i in range(sends)])
+    elapsed = time.perf_counter() - started
+    print(f"{label:<24}{sends / elapsed:>12.0f}{server.connections - connections:>14}")
+
+
+async def main_async(args):
+    server = FakeGraphServer(port=args.port, latency=args.latency_ms / 1000)
+    await server.start()
+    print(f"{'client':<24}{'sends/s':>12}{'connections':>14}")
+    try:
+        await _run("per-message client", lambda phone: _per_message_client(server.base_url, phone),
+                   args.sends, args.concurrency, server)
+
+        sender = WhatsAppSender(server.base_url, "token", "123", max_connections=args.concurrency,
+                                max_keepalive=args.concurrency)
+        await sender.start()
+        try:
+            await _run("shared pooled sender",
+                       lambda phone: sender.send_template(phone, "abandoned_cart_reminder_1", ["there"]),
+                       args.sends, args.concurrency, server)
+        finally:
+            await sender.close()
+    finally:
+        await server.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sends", type=int, default=5000)
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--latency-ms", type=float, default=5.0)
+    parser.add_argument("--port", type=int, default=8081)
+    asyncio.run(main_async(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,71 @@
+"""
+Write-behind benchmark: rows/sec for flow upserts plus step events
+written one round trip per row versus batched through PostgresStore.write_batch
+at several batch sizes. Needs DATABASE_URL (and the other settings) in the
+environment or .env; rows use a bench- email prefix and are deleted afterwards.
+Run from the repository root:
+
+    python -m benchmarks.bench_write_behind [--rows 20000] [--batch-sizes 1 10 50 100 500 1000]
+"""
+import argparse
+import asyncio
+import json
+import time
+
+from app.database.postgres_store import postgres_store
+from app.database.queries import STATEMENTS
+
+
+def _rows(count: int, run: int):
+    flows = [
+        (f"bench-{run}-{i}@example.com", "pending", json.dumps({}), "Bench", f"+91{9000000000 + i}", "zuzumonk")
+        for i in range(count)
+    ]
+    steps = [(row[0], "step_1", "sent") for row in flows]
+    return flows, steps
+
+
+async def _cleanup():
+    async with postgres_store.pool.acquire() as conn:
+        await conn.execute("DELETE FROM checkout_flows WHERE email LIKE 'bench-%'")
+        await conn.execute("DELETE FROM flow_events WHERE email LIKE 'bench-%'")
+
+
+async def main_async(args):
+    await postgres_store.init_pool()
+    print(f"{'batch size':>12}{'rows':>10}{'rows/s':>12}")
+    try:
+        for run, batch_size in enumerate(args.batch_sizes):
+            await _cleanup()
+            flows, steps = _rows(args.rows, run)
+            started = time.perf_counter()
+            if batch_size == 1:
+                # The previous write path: one pool acquire and one statement per row
+                for flow in flows:
+                    async with postgres_store.pool.acquire() as conn:
+                        await conn.execute(STATEMENTS["upsert_flow"], *flow)
+                for step in steps:
+                    async with postgres_store.pool.acquire() as conn:
+                        await conn.execute(STATEMENTS["append_flow_event"], step[0], 1, step[2])
+            else:
+                for start in range(0, args.rows, batch_size):
+                    await postgres_store.write_batch(
+                        flows[start:start + batch_size], steps[start:start + batch_size], []
+                    )
+            elapsed = time.perf_counter() - started
+            written = len(flows) + len(steps)
+            print(f"{batch_size:>12}{written:>10}{written / elapsed:>12.0f}")
+    finally:
+        await _cleanup()
+        await postgres_store.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=20_000)
+    parser.add_argument("--batch-sizes", type=int, nargs="+", default=[1, 10, 50, 100, 500, 1000])
+    asyncio.run(main_async(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
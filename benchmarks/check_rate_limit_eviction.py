@@ -0,0 +1,75 @@
+"""
+Rate limit eviction check: the phone and global limiters share the
+rate_limits table, so evicting idle phone counters after a lull longer than
+the phone window (2h) must keep the global daily counter.
+
+Writes keys with a check- prefix through the Postgres backend, ages them to
+simulate the lull, runs the phone limiter's eviction and verifies what is
+left. Exits non-zero on failure. Needs DATABASE_URL (and the other settings)
+in the environment or .env. Run from the repository root:
+
+    python -m benchmarks.check_rate_limit_eviction
+"""
+import asyncio
+import sys
+
+from app.database.postgres_store import postgres_store
+from app.services.rate_limiter import PostgresRateLimitBackend, SlidingWindowRateLimiter
+
+PHONE_KEY = "check-+919000000000"
+GLOBAL_KEY = "check-global:daily"
+
+
+async def _age(key: str, seconds: float):
+    async with postgres_store.pool.acquire() as conn:
+        await conn.execute("""
+            UPDATE rate_limits SET updated_at = NOW() - make_interval(secs => $2) WHERE key = $1
+        """, key, float(seconds))
+
+
+async def _cleanup():
+    async with postgres_store.pool.acquire() as conn:
+        await conn.execute("DELETE FROM rate_limits WHERE key LIKE 'check-%'")
+
+
+async def main_async() -> bool:
+    await postgres_store.init_pool()
+    phone = SlidingWindowRateLimiter(PostgresRateLimitBackend(2 * 3600), limit=10, window=3600)
+    daily = SlidingWindowRateLimiter(PostgresRateLimitBackend(2 * 86400), limit=1000, window=86400)
+    failures = []
+    try:
+        await _cleanup()
+        await phone.hit(PHONE_KEY)
+        await daily.hit(GLOBAL_KEY)
+
+        # Overnight lull: nothing sent for 3 hours, then the phone limiter evicts
+        await _age(PHONE_KEY, 3 * 3600)
+        await _age(GLOBAL_KEY, 3 * 3600)
+        await postgres_store.evict_rate_limits(phone.backend.idle_ttl)
+        if await postgres_store.get_rate_limit(PHONE_KEY) is not None:
+            failures.append("idle phone counter was not evicted after 3h")
+        if await postgres_store.get_rate_limit(GLOBAL_KEY) is None:
+            failures.append("global daily counter was evicted by the phone limiter after a 3h lull")
+
+        # Past its own TTL the global counter goes too
+        await _age(GLOBAL_KEY, 3 * 86400)
+        await postgres_store.evict_rate_limits(phone.backend.idle_ttl)
+        if await postgres_store.get_rate_limit(GLOBAL_KEY) is not None:
+            failures.append("global daily counter was not evicted after 3 days")
+    finally:
+        await _cleanup()
+        await postgres_store.close()
+
+    for failure in failures:
+        print(f"FAIL: {failure}")
+    if not failures:
+        print("OK: eviction keeps each counter until its own idle TTL")
+    return not failures
+
+
+def main():
+    sys.exit(0 if asyncio.run(main_async()) else 1)
+
+
+if __name__ == "__main__":
+    main()
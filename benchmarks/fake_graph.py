@@ -0,0 +1,109 @@
+"""
+Minimal stand-in for the WhatsApp Cloud API (Graph) messages endpoint.
+
+Speaks HTTP/1.1 with keep-alive, answers every POST with a message id after an
+optional delay, and can fail a fraction of requests with 500s. Point
+WHATSAPP_API_BASE_URL at it (e.g. http://127.0.0.1:8081/v18.0). Run standalone:
+
+    python -m benchmarks.fake_graph [--port 8081] [--latency-ms 20] [--error-rate 0.0]
+"""
+import argparse
+import asyncio
+import itertools
+import json
+import random
+import time
+from collections import Counter
+
+
+class FakeGraphServer:
+    def __init__(self, host: str = "127.0.0.1", port: int = 8081, latency: float = 0.0, error_rate: float = 0.0):
+        self.host = host
+        self.port = port
+        self.latency = latency
+        self.error_rate = error_rate
+        self.requests = 0
+        self.connections = 0
+        # Requests received per wall-clock second, for checking send rate caps
+        self.per_second = Counter()
+        self._ids = itertools.count(1)
+        self._server = None
+
+    @property
+    def base_url(self) -> str:
+        return f"http://{self.host}:{self.port}/v18.0"
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        self.connections += 1
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                length = 0
+                keep_alive = True
+                while True:
+                    line = await reader.readline()
+                    if line in (b"\r\n", b"\n", b""):
+                        break
+                    name, _, value = line.decode("latin-1").partition(":")
+                    name = name.strip().lower()
+                    if name == "content-length":
+                        length = int(value.strip())
+                    elif name == "connection" and value.strip().lower() == "close":
+                        keep_alive = False
+                if length:
+                    await reader.readexactly(length)
+                self.requests += 1
+                self.per_second[int(time.time())] += 1
+                if self.latency:
+                    await asyncio.sleep(self.latency)
+                if self.error_rate and random.random() < self.error_rate:
+                    status = "500 Internal Server Error"
+                    body = json.dumps({"error": {"message": "fake upstream failure", "code": 1}}).encode()
+                else:
+                    status = "200 OK"
+                    body = json.dumps({
+                        "messaging_product": "whatsapp",
+                        "messages": [{"id": f"wamid.fake{next(self._ids)}"}]
+                    }).encode()
+                writer.write(
+                    f"HTTP/1.1 {status}\r\nContent-Type: application/json\r\n"
+                    f"Content-Length: {len(body)}\r\n"
+                    f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n".encode() + body
+                )
+                await writer.drain()
+                if not keep_alive:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    async def start(self):
+        self._server = await asyncio.start_server(self._handle, self.host, self.port, backlog=4096)
+
+    async def stop(self):
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+
+
+async def _serve(args):
+    server = FakeGraphServer(args.host, args.port, args.latency_ms / 1000, args.error_rate)
+    await server.start()
+    print(f"Fake Graph API listening on {server.base_url}")
+    await asyncio.Event().wait()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8081)
+    parser.add_argument("--latency-ms", type=float, default=0.0)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    asyncio.run(_serve(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,342 @@
+"""
+End-to-end load test: boots app.main:app under uvicorn against a local
+Postgres and the fake Graph server, replays Shopify checkouts/create and
+orders/create webhooks at a fixed open-loop rate (with duplicate deliveries
+and a flash-sale burst), waits for the resulting flows to finish sending and
+reports:
+
+- webhook throughput and p50/p95/p99 latency per topic
+- database transactions and PostgresStore calls per admitted flow
+- send throughput and outcomes seen by the fake Graph server
+- server memory per pending flow
+
+Needs DATABASE_URL pointing at a disposable database (its flow tables are
+emptied first) plus uvicorn, httpx and asyncpg. The app runs with a temporary
+flow plan file using --step-delay second steps. Run from the repository root:
+
+    python -m benchmarks.load_test [--rate 50] [--duration 60] [--burst-size 500] \\
+        [--duplicate-rate 0.1] [--order-rate 0.3] [--output results.json]
+
+Compare runs across commits by diffing the JSON written to --output.
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import time
+from collections import defaultdict
+from datetime import datetime, timezone
+from typing import Dict, List, Optional
+
+import asyncpg
+import httpx
+
+from benchmarks.bench_webhook_parse import make_checkout
+from benchmarks.fake_graph import FakeGraphServer
+
+SHOP_DOMAIN = "bench-shop.myshopify.com"
+CLIENT_ID = "bench"
+TEMPLATES = ("abandoned_cart_reminder_1", "abandoned_cart_reminder_2", "abandoned_cart_final")
+
+
+def _percentiles(values: List[float]) -> Dict[str, Optional[float]]:
+    values = sorted(values)
+    if not values:
+        return {"p50_ms": None, "p95_ms": None, "p99_ms": None}
+    pick = lambda p: round(values[min(len(values) - 1, int(p * len(values)))] * 1000, 2)
+    return {"p50_ms": pick(0.5), "p95_ms": pick(0.95), "p99_ms": pick(0.99)}
+
+
+def _parse_metrics(text: str) -> Dict[str, Dict[str, float]]:
+    """Prometheus text into {metric name: {label text: value}}"""
+    parsed: Dict[str, Dict[str, float]] = defaultdict(dict)
+    for line in text.splitlines():
+        if not line or line.startswith("#"):
+            continue
+        series, _, value = line.rpartition(" ")
+        name, _, labels = series.partition("{")
+        parsed[name]["{" + labels if labels else ""] = float(value)
+    return parsed
+
+
+def _metric_sum(metrics: Dict[str, Dict[str, float]], name: str) -> float:
+    return sum(metrics.get(name, {}).values())
+
+
+def _rss_bytes(pid: int) -> int:
+    with open(f"/proc/{pid}/status") as f:
+        for line in f:
+            if line.startswith("VmRSS:"):
+                return int(line.split()[1]) * 1024
+    return 0
+
+
+def _git_commit() -> Optional[str]:
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def _build_schedule(args, rng: random.Random) -> List[tuple]:
+    """(send_at, topic, body, webhook_id) events for the whole run"""
+    events = []
+    starts = [i / args.rate for i in range(int(args.rate * args.duration))]
+    starts += [args.burst_at] * args.burst_size
+    for seed, at in enumerate(starts):
+        body = make_checkout(args.body_bytes, seed)
+        webhook_id = f"checkout-{seed}"
+        events.append((at, "checkouts/create", body, webhook_id))
+        if rng.random() < args.duplicate_rate:
+            # Shopify redelivers with the same webhook id after a timeout or 5xx
+            events.append((at + rng.uniform(0.05, 2.0), "checkouts/create", body, webhook_id))
+        if rng.random() < args.order_rate:
+            order = json.dumps({
+                "id": seed, "email": f"customer{seed}@example.com", "financial_status": "paid",
+                "customer": {"email": f"customer{seed}@example.com"},
+                "line_items": [{"title": "Handloom Kurta", "quantity": 1, "price": "1999.00"}],
+            }).encode()
+            events.append((at + args.order_delay * rng.uniform(0.5, 1.5), "orders/create", order, f"order-{seed}"))
+    events.sort(key=lambda event: event[0])
+    return events
+
+
+async def _reset_database(database_url: str):
+    conn = await asyncpg.connect(database_url)
+    try:
+        for table in ("checkout_flows", "flow_events", "flow_steps", "rate_limits", "webhook_receipts", "flow_rollups",
+                      "flow_status_counts"):
+            exists = await conn.fetchval("SELECT to_regclass($1)", table)
+            if exists:
+                await conn.execute(f"TRUNCATE {table}")
+    finally:
+        await conn.close()
+
+
+async def _transactions(conn: asyncpg.Connection) -> int:
+    return await conn.fetchval("""
+        SELECT xact_commit + xact_rollback FROM pg_stat_database WHERE datname = current_database()
+    """)
+
+
+def _start_server(args, graph: FakeGraphServer, plan_path: str, log) -> subprocess.Popen:
+    env = dict(os.environ)
+    env.update({
+        "WHATSAPP_API_BASE_URL": graph.base_url,
+        "WHATSAPP_DRY_RUN": "false",
+        "WHATSAPP_TOKEN": env.get("WHATSAPP_TOKEN", "bench-token"),
+        "WHATSAPP_PHONE_ID": env.get("WHATSAPP_PHONE_ID", "123"),
+        "FLOW_PLANS_SOURCE": plan_path,
+        "FLOW_SCHEDULER": args.scheduler,
+    })
+    return subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "app.main:app", "--host", "127.0.0.1", "--port", str(args.port),
+         "--no-access-log"],
+        env=env, stdout=log, stderr=subprocess.STDOUT,
+    )
+
+
+async def _wait_ready(client: httpx.AsyncClient, server: subprocess.Popen, timeout: float = 60):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if server.poll() is not None:
+            raise RuntimeError(f"Server exited with code {server.returncode}")
+        try:
+            if (await client.get("/ping")).status_code == 200:
+                return
+        except httpx.TransportError:
+            pass
+        await asyncio.sleep(0.2)
+    raise RuntimeError("Server did not become ready")
+
+
+async def _replay(client: httpx.AsyncClient, events: List[tuple]) -> Dict[str, dict]:
+    latencies: Dict[str, List[float]] = defaultdict(list)
+    statuses: Dict[str, Dict[str, int]] = defaultdict(lambda: defaultdict(int))
+    tasks = []
+
+    async def post(topic: str, body: bytes, webhook_id: str):
+        headers = {
+            "Content-Type": "application/json",
+            "X-Shopify-Topic": topic,
+            "X-Shopify-Shop-Domain": SHOP_DOMAIN,
+            "X-Shopify-Webhook-Id": webhook_id,
+        }
+        started = time.perf_counter()
+        try:
+            response = await client.post(f"/{topic}", content=body, headers=headers)
+            outcome = str(response.status_code)
+            if response.status_code == 200:
+                outcome = response.json().get("status", outcome)
+        except httpx.HTTPError as e:
+            outcome = type(e).__name__
+        latencies[topic].append(time.perf_counter() - started)
+        statuses[topic][outcome] += 1
+
+    started = time.monotonic()
+    for at, topic, body, webhook_id in events:
+        delay = started + at - time.monotonic()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        tasks.append(asyncio.create_task(post(topic, body, webhook_id)))
+    await asyncio.gather(*tasks)
+    elapsed = time.monotonic() - started
+
+    results = {}
+    for topic, values in latencies.items():
+        results[topic] = {"requests": len(values), "statuses": dict(statuses[topic]), **_percentiles(values)}
+    everything = [value for values in latencies.values() for value in values]
+    results["all"] = {"requests": len(everything), "req_per_s": round(len(everything) / elapsed, 1),
+                      "elapsed_s": round(elapsed, 2), **_percentiles(everything)}
+    return results
+
+
+async def main_async(args) -> dict:
+    database_url = args.database_url or os.environ.get("DATABASE_URL")
+    if not database_url:
+        raise SystemExit("Set DATABASE_URL or pass --database-url")
+    os.environ["DATABASE_URL"] = database_url
+    rng = random.Random(args.seed)
+    events = _build_schedule(args, rng)
+    checkouts = len({event[3] for event in events if event[1] == "checkouts/create"})
+
+    with tempfile.NamedTemporaryFile("w", suffix=".json", delete=False) as plan_file:
+        json.dump({CLIENT_ID: {
+            "shop_domains": [SHOP_DOMAIN],
+            "checkout_url": "https://bench-shop.example/checkout",
+            "checkout": [
+                {"delay": args.step_delay, "template": template, "params": ["{customer_name}", "{checkout_url}"]}
+                for template in TEMPLATES
+            ],
+        }}, plan_file)
+
+    await _reset_database(database_url)
+    graph = FakeGraphServer(port=args.graph_port, latency=args.graph_latency_ms / 1000)
+    await graph.start()
+    log = open(args.server_log, "w")
+    server = _start_server(args, graph, plan_file.name, log)
+    stats_conn = await asyncpg.connect(database_url)
+    client = httpx.AsyncClient(base_url=f"http://127.0.0.1:{args.port}", timeout=30,
+                               limits=httpx.Limits(max_connections=args.connections,
+                                                   max_keepalive_connections=args.connections))
+    samples = []
+    try:
+        await _wait_ready(client, server)
+        await asyncio.sleep(1)
+        baseline_rss = _rss_bytes(server.pid)
+        before = _parse_metrics((await client.get("/metrics")).text)
+        transactions_before = await _transactions(stats_conn)
+
+        async def sample():
+            while True:
+                metrics = _parse_metrics((await client.get("/metrics")).text)
+                samples.append((_metric_sum(metrics, "flows_pending"), _rss_bytes(server.pid)))
+                await asyncio.sleep(args.sample_interval)
+
+        sampler = asyncio.create_task(sample())
+        print(f"Replaying {len(events)} webhooks ({checkouts} checkouts) ...", file=sys.stderr)
+        webhooks = await _replay(client, events)
+
+        # Let the flows finish: nothing pending on the scheduler or in the send queue
+        drain_started = time.monotonic()
+        while time.monotonic() - drain_started < args.drain_timeout:
+            metrics = _parse_metrics((await client.get("/metrics")).text)
+            if _metric_sum(metrics, "flows_pending") == 0 and _metric_sum(metrics, "send_queue_depth") == 0:
+                break
+            await asyncio.sleep(0.5)
+        sampler.cancel()
+        await asyncio.gather(sampler, return_exceptions=True)
+
+        # Cumulative statistics are flushed to pg_stat_database about once a second
+        await asyncio.sleep(1.5)
+        # Less the reading query itself
+        transactions = await _transactions(stats_conn) - transactions_before - 1
+        flows = await stats_conn.fetchval("SELECT COUNT(*) FROM checkout_flows WHERE status <> 'blocked'")
+        after = _parse_metrics((await client.get("/metrics")).text)
+    finally:
+        await client.aclose()
+        await stats_conn.close()
+        server.terminate()
+        try:
+            server.wait(timeout=30)
+        except subprocess.TimeoutExpired:
+            server.kill()
+        log.close()
+        await graph.stop()
+        os.unlink(plan_file.name)
+
+    flows = max(1, flows)
+    store_calls = sum(
+        value - before.get("db_method_duration_seconds_count", {}).get(labels, 0)
+        for labels, value in after.get("db_method_duration_seconds_count", {}).items()
+    )
+    outcomes = {
+        labels.split('"')[1]: value for labels, value in after.get("whatsapp_sends_total", {}).items()
+    }
+    seconds = sorted(graph.per_second)
+    send_window = (seconds[-1] - seconds[0] + 1) if seconds else 0
+    peak_pending, peak_rss = max(samples, default=(0, baseline_rss))
+
+    return {
+        "commit": _git_commit(),
+        "timestamp": datetime.now(timezone.utc).isoformat(),
+        "config": vars(args),
+        "webhooks": webhooks,
+        "database": {
+            "flows_admitted": flows,
+            "transactions_per_flow": round(transactions / flows, 2),
+            "store_calls_per_flow": round(store_calls / flows, 2),
+        },
+        "sends": {
+            "graph_requests": graph.requests,
+            "per_s": round(graph.requests / send_window, 1) if send_window else 0,
+            "peak_per_s": max(graph.per_second.values(), default=0),
+            "outcomes": outcomes,
+        },
+        "memory": {
+            "baseline_rss_mb": round(baseline_rss / 2 ** 20, 1),
+            "peak_rss_mb": round(peak_rss / 2 ** 20, 1),
+            "peak_pending_flows": int(peak_pending),
+            "bytes_per_pending_flow": round((peak_rss - baseline_rss) / peak_pending) if peak_pending else None,
+        },
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--database-url", help="defaults to $DATABASE_URL")
+    parser.add_argument("--rate", type=float, default=50.0, help="checkouts per second")
+    parser.add_argument("--duration", type=float, default=60.0, help="seconds of steady traffic")
+    parser.add_argument("--burst-size", type=int, default=500, help="checkouts fired at once (flash sale)")
+    parser.add_argument("--burst-at", type=float, default=10.0, help="seconds into the run")
+    parser.add_argument("--duplicate-rate", type=float, default=0.1, help="share of checkouts redelivered")
+    parser.add_argument("--order-rate", type=float, default=0.3, help="share of checkouts that convert")
+    parser.add_argument("--order-delay", type=float, default=5.0, help="mean seconds from checkout to order")
+    parser.add_argument("--body-bytes", type=int, default=8000, help="approximate checkout body size")
+    parser.add_argument("--step-delay", type=float, default=2.0, help="seconds between flow steps")
+    parser.add_argument("--scheduler", choices=["memory", "postgres"], default="memory")
+    parser.add_argument("--connections", type=int, default=200)
+    parser.add_argument("--graph-latency-ms", type=float, default=20.0)
+    parser.add_argument("--drain-timeout", type=float, default=120.0)
+    parser.add_argument("--sample-interval", type=float, default=0.5)
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--graph-port", type=int, default=8081)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--server-log", default="load_test_server.log")
+    parser.add_argument("--output", help="write the JSON report here as well as to stdout")
+    args = parser.parse_args()
+
+    report = asyncio.run(main_async(args))
+    text = json.dumps(report, indent=2)
+    print(text)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(text + "\n")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,3 +1,4 @@
+from typing import Dict
 from pydantic_settings import BaseSettings
 
 class Settings(BaseSettings):
@@ -5,7 +6,109 @@ class Settings(BaseSettings):
     WHATSAPP_PHONE_ID: str
     DATABASE_URL: str
 
+    # asyncpg pool sizing and per-connection cache of prepared ad-hoc statements
+    # (the fixed queries in app.database.queries are always prepared on connect).
+    # DB_POOL_PREWARM runs the hot reads on every initial connection before the
+    # app reports ready
+    DB_POOL_MIN_SIZE: int = 2
+    DB_POOL_MAX_SIZE: int = 10
+    DB_STATEMENT_CACHE_SIZE: int = 100
+    DB_POOL_PREWARM: bool = True
+
+    # WhatsApp Graph API client. Point WHATSAPP_API_BASE_URL at a local fake
+    # Graph server for load tests; WHATSAPP_DRY_RUN logs sends instead of calling the API
+    WHATSAPP_API_BASE_URL: str = "https://graph.facebook.com/v18.0"
+    WHATSAPP_DRY_RUN: bool = True
+    WHATSAPP_HTTP2: bool = True
+    WHATSAPP_MAX_CONNECTIONS: int = 100
+    WHATSAPP_MAX_KEEPALIVE: int = 20
+    WHATSAPP_TIMEOUT: float = 10.0
+
+    # Flow step scheduling: "memory" (in-process timing wheel, single worker)
+    # or "postgres" (durable flow_steps table shared by all workers). Leases are
+    # renewed while a step is being sent; a step claimed FLOW_MAX_ATTEMPTS times
+    # without completing is marked failed
+    FLOW_SCHEDULER: str = "memory"
+    FLOW_CLAIM_BATCH: int = 100
+    FLOW_LEASE_SECONDS: float = 120
+    FLOW_POLL_INTERVAL: float = 1.0
+    FLOW_MAX_ATTEMPTS: int = 5
+
+    # Per-phone send limiter backend: "memory" (per process) or "postgres" (shared by all workers)
+    RATE_LIMIT_BACKEND: str = "memory"
+
+    # In-process checkout flow cache, invalidated across workers via LISTEN/NOTIFY
+    FLOW_CACHE_MAX_SIZE: int = 10000
+    FLOW_CACHE_TTL: float = 300
+
+    # Write-behind batching of flow upserts and step status updates
+    WRITE_BEHIND_ENABLED: bool = True
+    WRITE_BEHIND_FLUSH_INTERVAL: float = 0.05
+    WRITE_BEHIND_MAX_BATCH: int = 500
+    # Consecutive failed flushes (lost connection, deadlock) retried before the rows are dropped
+    WRITE_BEHIND_MAX_RETRIES: int = 10
+
+    # In-process prefilter of recently admitted emails (0 disables it)
+    ADMISSION_PREFILTER_MAX_SIZE: int = 100000
+
+    # Webhook idempotency: Shopify retries failed deliveries for up to 48 hours
+    WEBHOOK_DEDUP_TTL: float = 172800
+    WEBHOOK_DEDUP_MAX_SIZE: int = 200000
+
+    # Retention: flows not updated for RETENTION_DAYS, and webhook receipts older
+    # than WEBHOOK_DEDUP_TTL, are deleted in batches every RETENTION_INTERVAL_SECONDS
+    # (0 disables the scheduled job)
+    RETENTION_DAYS: int = 30
+    RETENTION_INTERVAL_SECONDS: float = 3600
+    RETENTION_BATCH_SIZE: int = 1000
+    RETENTION_BATCH_PAUSE: float = 0.1
+    # Flow plans: "config" (config_flows.client_flows.FLOW_CONFIG), "postgres"
+    # (client_flow_plans table) or a path to a JSON file, re-read every
+    # FLOW_PLANS_RELOAD_INTERVAL seconds (0 disables hot reload)
+    FLOW_PLANS_SOURCE: str = "config"
+    FLOW_PLANS_RELOAD_INTERVAL: float = 30
+    # Outbound send queue: worker pool size, messages/sec (and burst) allowed per
+    # sending phone number ID, queue depth at which schedulers stop releasing
+    # due steps, and which reminders jump the queue ("final" or "first")
+    SEND_QUEUE_WORKERS: int = 16
+    SEND_RATE_PER_SECOND: float = 80
+    SEND_RATE_BURST: float = 20
+    SEND_QUEUE_MAX_DEPTH: int = 1000
+    SEND_QUEUE_PRIORITY: str = "final"
+    # Failed sends are retried from the send queue with decorrelated-jitter
+    # backoff between SEND_RETRY_BASE_DELAY and SEND_RETRY_MAX_DELAY seconds
+    SEND_RETRY_MAX_ATTEMPTS: int = 4
+    SEND_RETRY_BASE_DELAY: float = 1.0
+    SEND_RETRY_MAX_DELAY: float = 60.0
+    # Per-upstream circuit breaker: consecutive failures before opening, seconds
+    # to stay open, and calls let through while half-open
+    BREAKER_FAILURE_THRESHOLD: int = 5
+    BREAKER_RESET_TIMEOUT: float = 30.0
+    BREAKER_HALF_OPEN_PROBES: int = 1
+    # Logging: JSON lines written off the event loop by a queue listener thread.
+    # LOG_SAMPLE_RATES keeps that fraction of INFO records per category
+    # ("db_row", "webhook", "send"); warnings and errors are never sampled
+    LOG_LEVEL: str = "INFO"
+    LOG_JSON: bool = True
+    LOG_SAMPLE_RATES: Dict[str, float] = {"db_row": 0.01, "webhook": 1.0, "send": 1.0}
+    # Client used for webhooks that carry no X-Shopify-Shop-Domain header
+    DEFAULT_CLIENT_ID: str = "zuzumonk"
+    # Adaptive load shedding on the webhook routes: the concurrency limit moves
+    # between SHED_MIN_LIMIT and SHED_MAX_LIMIT, shrinking when request latency
+    # exceeds SHED_LATENCY_TOLERANCE x its no-load baseline or pool waits average
+    # over SHED_POOL_WAIT_THRESHOLD seconds. Checkouts may use SHED_CHECKOUT_SHARE
+    # of the limit, the rest is kept for orders; shed requests get a 503 with
+    # Retry-After: SHED_RETRY_AFTER
+    SHED_ENABLED: bool = True
+    SHED_INITIAL_LIMIT: int = 40
+    SHED_MIN_LIMIT: int = 4
+    SHED_MAX_LIMIT: int = 400
+    SHED_LATENCY_TOLERANCE: float = 2.0
+    SHED_POOL_WAIT_THRESHOLD: float = 0.05
+    SHED_CHECKOUT_SHARE: float = 0.8
+    SHED_RETRY_AFTER: int = 5
+
     class Config:
         env_file = ".env"
 
-settings = Settings()
\ No newline at end of file
+settings = Settings()
@@ -1,4 +1,4 @@
-from typing import Dict, List, Any
+from typing import Dict, Any
 
 # Rate limiting configuration
 RATE_LIMITS = {
@@ -8,22 +8,28 @@ RATE_LIMITS = {
     "global_daily_limit": 1000
 }
 
-# Configuration for different client checkout flows
-FLOW_CONFIG: Dict[str, Dict[str, List[Dict[str, Any]]]] = {
+# Configuration for different client checkout flows. Params are either
+# "{variable}" placeholders (customer_name, checkout_url) or literal text.
+# shop_domains are the store's *.myshopify.com domains as sent in the
+# X-Shopify-Shop-Domain header (not its custom domain). While only one client
+# is configured, webhooks from unlisted shops use its plan.
+FLOW_CONFIG: Dict[str, Dict[str, Any]] = {
     "zuzumonk": {
+        "shop_domains": [],
+        "checkout_url": "https://zuzumonk.com/checkout",
         "checkout": [
             {
-                "delay": 10,  # TESTING: 10 seconds (was 300 = 5 minutes)
+                "delay": 300,  # 5 minutes
                 "template": "abandoned_cart_reminder_1",
                 "params": ["{customer_name}"]
             },
             {
-                "delay": 10,  # TESTING: 10 seconds (was 1800 = 30 minutes)
+                "delay": 1800,  # 30 minutes
                 "template": "abandoned_cart_reminder_2", 
                 "params": ["{customer_name}", "{checkout_url}"]
             },
             {
-                "delay": 10,  # TESTING: 10 seconds (was 3600 = 1 hour)
+                "delay": 3600,  # 1 hour
                 "template": "abandoned_cart_final",
                 "params": ["{customer_name}", "{checkout_url}"]
             }
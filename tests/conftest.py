@@ -0,0 +1,20 @@
+import os
+
+import pytest
+
+from app.clock import SystemClock, VirtualClock, clock
+
+# config.Settings requires these; tests never reach the WhatsApp API or, unless
+# TEST_DATABASE_URL is set, a database
+os.environ.setdefault("WHATSAPP_TOKEN", "test-token")
+os.environ.setdefault("WHATSAPP_PHONE_ID", "test-phone-id")
+os.environ.setdefault("DATABASE_URL", os.environ.get("TEST_DATABASE_URL", "postgresql://localhost/test"))
+
+
+@pytest.fixture
+def virtual_clock():
+    """Swap a VirtualClock into app.clock for the test"""
+    source = VirtualClock()
+    clock.use(source)
+    yield source
+    clock.use(SystemClock())
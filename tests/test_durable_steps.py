@@ -0,0 +1,108 @@
+"""
+Claim / lease / heartbeat cycle of the durable step queue against a real
+Postgres. Writes rows with a test- prefix; set TEST_DATABASE_URL to a
+disposable database to run it.
+"""
+import asyncio
+import os
+
+import pytest
+
+pytestmark = pytest.mark.skipif(
+    not os.environ.get("TEST_DATABASE_URL"), reason="TEST_DATABASE_URL is not set"
+)
+pytest.importorskip("asyncpg")
+
+from app.database.postgres_store import postgres_store  # noqa: E402
+from app.services.durable_scheduler import DurableStepQueue  # noqa: E402
+from app.services.scheduler import PendingStep  # noqa: E402
+
+STEP = PendingStep("test-lease@example.com", "+919000000000", "Asha", "zuzumonk", 0)
+LEASE = 1.5
+
+
+def _queue(**kwargs) -> DurableStepQueue:
+    return DurableStepQueue(batch_size=10, lease_seconds=LEASE, poll_interval=0.05, **kwargs)
+
+
+async def _row() -> dict:
+    async with postgres_store.pool.acquire() as conn:
+        row = await conn.fetchrow("SELECT leased_by, attempts FROM flow_steps WHERE email = $1", STEP.email)
+    return dict(row) if row else None
+
+
+async def _wait_for(condition, timeout: float):
+    deadline = asyncio.get_running_loop().time() + timeout
+    while not condition():
+        assert asyncio.get_running_loop().time() < deadline, "timed out"
+        await asyncio.sleep(0.05)
+
+
+async def _cleanup():
+    async with postgres_store.pool.acquire() as conn:
+        await conn.execute("DELETE FROM flow_steps WHERE email LIKE 'test-%'")
+        await conn.execute("DELETE FROM flow_events WHERE email LIKE 'test-%'")
+
+
+def _run(scenario):
+    async def main():
+        postgres_store.connection_string = os.environ["TEST_DATABASE_URL"]
+        await postgres_store.init_pool()
+        try:
+            await _cleanup()
+            await scenario()
+        finally:
+            await _cleanup()
+            await postgres_store.close()
+
+    asyncio.run(main())
+
+
+def test_worker_ids_are_unique_per_instance():
+    assert _queue().worker_id != _queue().worker_id
+
+
+def test_heartbeat_holds_lease_until_worker_stops():
+    async def scenario():
+        first, second = _queue(), _queue()
+        claimed_first, claimed_second = [], []
+        await first.schedule(STEP, 0)
+        first.start(claimed_first.extend)
+        try:
+            await _wait_for(lambda: claimed_first, LEASE)
+            second.start(claimed_second.extend)
+            # Twice the lease: only the heartbeat keeps the step with the first worker
+            await asyncio.sleep(2 * LEASE)
+            assert claimed_second == []
+            assert (await _row())["leased_by"] == first.worker_id
+
+            # A stopped (or dead) worker's lease runs out and the step is claimed again
+            await first.stop()
+            await _wait_for(lambda: claimed_second, 2 * LEASE)
+            assert await _row() == {"leased_by": second.worker_id, "attempts": 2}
+
+            await second.complete(claimed_second[0], None)
+            assert await _row() is None
+        finally:
+            await first.stop()
+            await second.stop()
+
+    _run(scenario)
+
+
+def test_step_claimed_too_often_is_given_up():
+    async def scenario():
+        queue = _queue(max_attempts=2)
+        claimed = []
+        await queue.schedule(STEP, 0)
+        async with postgres_store.pool.acquire() as conn:
+            await conn.execute("UPDATE flow_steps SET attempts = 2 WHERE email = $1", STEP.email)
+        queue.start(claimed.extend)
+        try:
+            await _wait_for(lambda: queue.exhausted == 1, LEASE)
+        finally:
+            await queue.stop()
+        assert claimed == []
+        assert await _row() is None
+
+    _run(scenario)
@@ -0,0 +1,54 @@
+import pytest
+
+from app.api.load_shedding import AdaptiveLimiter
+
+HEALTHY = 0.01
+
+
+def _limiter() -> AdaptiveLimiter:
+    return AdaptiveLimiter(20, min_limit=4, max_limit=100, tolerance=2.0, pool_wait_threshold=0.05,
+                           pool_wait=lambda: (0.0, 0), window=0.5)
+
+
+def _window(limiter: AdaptiveLimiter, virtual_clock, latency: float, concurrency: int = 1000):
+    """One window of `concurrency` requests arriving together, each taking `latency`"""
+    admitted = sum(limiter.try_acquire() for _ in range(concurrency))
+    virtual_clock.advance(limiter.window)
+    for _ in range(admitted):
+        limiter.release(latency)
+
+
+def test_healthy_load_grows_the_limit(virtual_clock):
+    limiter = _limiter()
+    for _ in range(30):
+        _window(limiter, virtual_clock, HEALTHY)
+    assert limiter.limit >= 45
+    assert limiter.decreases == 0
+
+
+def test_idle_limit_does_not_grow(virtual_clock):
+    limiter = _limiter()
+    for _ in range(30):
+        _window(limiter, virtual_clock, HEALTHY, concurrency=2)
+    assert limiter.limit == 20
+
+
+def test_sustained_overload_holds_the_limit_at_minimum(virtual_clock):
+    limiter = _limiter()
+    for _ in range(5):
+        _window(limiter, virtual_clock, HEALTHY)
+
+    limits = []
+    for _ in range(500):
+        _window(limiter, virtual_clock, 3 * HEALTHY)
+        limits.append(limiter.limit)
+
+    floor = limits.index(limiter.min_limit)
+    assert floor < 50
+    # Overloaded windows never raise the baseline, so the overload is never re-learned as normal
+    assert limits[floor:] == [limiter.min_limit] * (len(limits) - floor)
+    assert limiter.baseline == pytest.approx(HEALTHY, rel=0.01)
+
+    for _ in range(20):
+        _window(limiter, virtual_clock, HEALTHY)
+    assert limiter.limit > limiter.min_limit
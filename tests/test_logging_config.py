@@ -0,0 +1,23 @@
+import json
+import logging
+
+from app.logging_config import JsonFormatter
+
+
+def _format(message: str) -> dict:
+    record = logging.LogRecord("app.test", logging.INFO, __file__, 1, message, None, None)
+    return json.loads(JsonFormatter().format(record))
+
+
+def test_tag_is_taken_from_the_prefix():
+    assert _format("[Webhook] Parsed data")["tag"] == "Webhook"
+
+
+def test_message_without_a_closing_bracket_has_no_tag():
+    entry = _format("[1, 2, 3")
+    assert "tag" not in entry
+    assert entry["message"] == "[1, 2, 3"
+
+
+def test_empty_brackets_have_no_tag():
+    assert "tag" not in _format("[] nothing")
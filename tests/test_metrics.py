@@ -0,0 +1,94 @@
+import asyncio
+import time
+
+from app.metrics import MetricsRegistry, Counter, metrics
+from app.services.scheduler import PendingStep, TimingWheel
+
+
+def _render(registry: MetricsRegistry) -> list:
+    return asyncio.run(registry.render()).splitlines()
+
+
+def _per_call(function, calls: int) -> float:
+    started = time.perf_counter()
+    for _ in range(calls):
+        function()
+    return (time.perf_counter() - started) / calls
+
+
+def test_counter_and_gauge_exposition():
+    registry = MetricsRegistry()
+    sends = registry.counter("sends_total", "Sends by outcome", ("outcome",))
+    registry.gauge("queue_depth", "Queued sends", ("queue",), collect=lambda: {("ready",): 3})
+    sends.inc("sent")
+    sends.inc("sent", amount=2)
+    sends.inc('bad "quote"\\\n')
+
+    assert _render(registry) == [
+        "# HELP sends_total Sends by outcome",
+        "# TYPE sends_total counter",
+        'sends_total{outcome="sent"} 3',
+        'sends_total{outcome="bad \\"quote\\"\\\\\\n"} 1',
+        "# HELP queue_depth Queued sends",
+        "# TYPE queue_depth gauge",
+        'queue_depth{queue="ready"} 3',
+    ]
+
+
+def test_histogram_exposition():
+    registry = MetricsRegistry()
+    latency = registry.histogram("latency_seconds", "Latency", ("route",), buckets=(0.1, 1.0))
+    for value in (0.05, 0.1, 0.5, 2.0):
+        latency.observe(value, "/a")
+
+    assert _render(registry) == [
+        "# HELP latency_seconds Latency",
+        "# TYPE latency_seconds histogram",
+        'latency_seconds_bucket{route="/a",le="0.1"} 2',
+        'latency_seconds_bucket{route="/a",le="1.0"} 3',
+        'latency_seconds_bucket{route="/a",le="+Inf"} 4',
+        'latency_seconds_sum{route="/a"} 2.65',
+        'latency_seconds_count{route="/a"} 4',
+    ]
+
+
+def test_counters_are_named_total():
+    for metric in metrics._metrics.values():
+        if isinstance(metric, Counter):
+            assert metric.name.endswith("_total"), metric.name
+
+
+def test_pending_by_step_tracks_schedule_fire_and_cancel():
+    wheel = TimingWheel()
+    wheel.schedule(PendingStep("a@example.com", "+1", None, "c"), 1)
+    wheel.schedule(PendingStep("b@example.com", "+2", None, "c"), 5)
+    # Replacing a@example.com's pending step moves it to step 2
+    wheel.schedule(PendingStep("a@example.com", "+1", None, "c", 1), 10)
+    assert wheel.pending_by_step() == {0: 1, 1: 1}
+
+    wheel.cancel("b@example.com")
+    assert wheel.pending_by_step() == {1: 1}
+
+    fired = wheel.advance(wheel._origin + 10)
+    assert [step.email for step in fired] == ["a@example.com"]
+    assert wheel.pending_by_step() == {}
+
+
+def test_scrape_overhead_budget():
+    # Walking this many pending steps took tens of milliseconds per scrape
+    wheel = TimingWheel()
+    for i in range(200_000):
+        wheel.schedule(PendingStep(f"user{i}@example.com", "+1", None, "c", i % 3), 60 + i % 3600)
+    started = time.perf_counter()
+    counts = wheel.pending_by_step()
+    assert time.perf_counter() - started < 0.001
+    assert sum(counts.values()) == 200_000
+
+
+def test_hot_path_overhead_budget():
+    registry = MetricsRegistry()
+    latency = registry.histogram("latency_seconds", "Latency", ("route",))
+    sends = registry.counter("sends_total", "Sends", ("outcome",))
+
+    assert _per_call(lambda: latency.observe(0.02, "/webhook"), 100_000) < 10e-6
+    assert _per_call(lambda: sends.inc("sent"), 100_000) < 5e-6
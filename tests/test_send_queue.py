@@ -0,0 +1,64 @@
+import asyncio
+
+from app.services.send_queue import SendQueue
+
+
+class Flaky(Exception):
+    pass
+
+
+async def _run(virtual_clock, coroutine):
+    """Run `coroutine`, jumping the virtual clock to the next wakeup whenever every task is waiting"""
+    task = asyncio.ensure_future(coroutine)
+    while not task.done():
+        for _ in range(20):
+            await asyncio.sleep(0)
+        deadline = virtual_clock.next_deadline()
+        if deadline is not None:
+            virtual_clock.advance(deadline - virtual_clock.elapsed)
+    return task.result()
+
+
+def test_token_bucket_paces_sends_on_the_clock(virtual_clock):
+    sent_at = []
+
+    async def send(phone, template, parameters):
+        sent_at.append(virtual_clock.elapsed)
+
+    async def scenario():
+        queue = SendQueue(send, workers=4, rate=10, burst=1, max_depth=100)
+        queue.start()
+        try:
+            await asyncio.gather(*(queue.submit(f"+91900000{i:04d}", "t", []) for i in range(50)))
+        finally:
+            await queue.stop()
+
+    asyncio.run(_run(virtual_clock, scenario()))
+
+    assert len(sent_at) == 50
+    # One token up front, then one every 1/rate seconds
+    assert 4.8 <= virtual_clock.elapsed <= 5.0
+    assert all(later - earlier >= 0.099 for earlier, later in zip(sent_at, sent_at[1:]))
+
+
+def test_retries_wait_out_their_backoff_on_the_clock(virtual_clock):
+    attempts = []
+
+    async def send(phone, template, parameters):
+        attempts.append(virtual_clock.elapsed)
+        if len(attempts) < 3:
+            raise Flaky()
+        return "ok"
+
+    async def scenario():
+        queue = SendQueue(send, workers=1, rate=100, burst=10, max_depth=100,
+                          retryable=lambda e: isinstance(e, Flaky), max_attempts=3, retry_base=1.0, retry_cap=5.0)
+        queue.start()
+        try:
+            return await queue.submit("+919000000000", "t", []), queue.retried
+        finally:
+            await queue.stop()
+
+    assert asyncio.run(_run(virtual_clock, scenario())) == ("ok", 2)
+    assert attempts[1] - attempts[0] >= 1.0
+    assert attempts[2] - attempts[1] >= 1.0
@@ -0,0 +1,88 @@
+import asyncio
+
+from app.database.write_buffer import WriteBehindBuffer
+
+
+class FakeDatabase:
+    """Stands in for PostgresStore.write_batch; rejects names longer than checkout_flows allows"""
+
+    def __init__(self, fail_times: int = 0):
+        self.flows = {}
+        self.steps = {}
+        self.rollups = {}
+        self.fail_times = fail_times
+        self.calls = 0
+
+    async def write_batch(self, flows, steps, rollups):
+        self.calls += 1
+        if self.fail_times:
+            self.fail_times -= 1
+            raise ConnectionResetError("connection lost")
+        for row in flows:
+            if row[3] is not None and len(row[3]) > 255:
+                raise ValueError("value too long for type character varying(255)")
+        for row in flows:
+            self.flows[row[0]] = row
+        for email, step, status in steps:
+            self.steps[(email, step)] = status
+        for *key, count in rollups:
+            self.rollups[tuple(key)] = self.rollups.get(tuple(key), 0) + count
+
+
+def _row(email: str, name: str) -> tuple:
+    return (email, "pending", "{}", name, "+919000000000", "zuzumonk")
+
+
+def _is_connection_error(error: Exception) -> bool:
+    return isinstance(error, ConnectionError)
+
+
+def test_rejected_row_is_dropped_and_the_rest_written():
+    database = FakeDatabase()
+    buffer = WriteBehindBuffer(database.write_batch, retryable=_is_connection_error)
+    for i in range(100):
+        buffer.add_flow(f"user{i}@example.com", _row(f"user{i}@example.com", "Asha"))
+    buffer.add_flow("long@example.com", _row("long@example.com", "x" * 300))
+    buffer.add_step("user0@example.com", "step_1", "sent")
+    buffer.add_rollup(("zuzumonk", "2026-10-17T10", "flows_created"), 101)
+
+    asyncio.run(buffer.flush())
+
+    assert len(database.flows) == 100
+    assert "long@example.com" not in database.flows
+    assert database.steps == {("user0@example.com", "step_1"): "sent"}
+    assert database.rollups == {("zuzumonk", "2026-10-17T10", "flows_created"): 101}
+    assert buffer.rows_dropped == 1
+    assert len(buffer) == 0
+    assert not buffer.is_pending()
+
+
+def test_transient_failure_is_retried():
+    database = FakeDatabase(fail_times=2)
+    buffer = WriteBehindBuffer(database.write_batch, retryable=_is_connection_error, max_retries=3)
+    buffer.add_flow("a@example.com", _row("a@example.com", "Asha"))
+
+    async def flush_three_times():
+        for _ in range(3):
+            await buffer.flush()
+
+    asyncio.run(flush_three_times())
+
+    assert list(database.flows) == ["a@example.com"]
+    assert buffer.rows_dropped == 0
+
+
+def test_transient_failures_are_capped():
+    database = FakeDatabase(fail_times=10)
+    buffer = WriteBehindBuffer(database.write_batch, retryable=_is_connection_error, max_retries=2)
+    buffer.add_flow("a@example.com", _row("a@example.com", "Asha"))
+
+    async def flush_until_empty():
+        for _ in range(5):
+            await buffer.flush()
+
+    asyncio.run(flush_until_empty())
+
+    assert database.calls == 3
+    assert buffer.rows_dropped == 1
+    assert not buffer.is_pending("a@example.com")